@@ -0,0 +1,4 @@
+""" __init__.py
+
+    benchmarks package initialization file.
+"""
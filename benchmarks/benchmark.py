@@ -0,0 +1,175 @@
+""" benchmarks.benchmark
+
+    This Python module implements the Benchmark base class, and the functions
+    used to run a benchmark and measure its performance.
+"""
+from threetaps.api.base.transport import Transport
+
+import gc
+import math
+import multiprocessing
+import resource
+import time
+
+#############################################################################
+
+class Benchmark:
+    """ The base class for a single benchmark.
+
+        Subclasses should override run() to perform one iteration of the
+        operation being measured, and optionally setUp() and tearDown() to
+        prepare for and clean up after the benchmark.  'itemsPerRun' should
+        be set to the number of items (postings, requests, etc) processed by
+        each call to run(), so that the throughput can be calculated.
+    """
+    name        = None
+    itemsPerRun = 1
+
+    def setUp(self):
+        """ Prepare to run the benchmark.
+        """
+        pass
+
+
+    def run(self):
+        """ Perform a single iteration of the benchmark.
+        """
+        raise NotImplementedError()
+
+
+    def tearDown(self):
+        """ Clean up after the benchmark.
+        """
+        pass
+
+
+    def getExtraResults(self):
+        """ Return a dictionary of extra figures to report, or None.
+
+            This is called after the benchmark has run, and can be used to
+            report measurements other than time and memory, such as the
+            number of bytes sent over the network.
+        """
+        return None
+
+#############################################################################
+
+class CannedTransport(Transport):
+    """ A Transport which returns a prerecorded response to every request.
+
+        This is used to measure the client-side cost of an API call, without
+        any server or network overhead.
+    """
+    def __init__(self, contents, status=200, contentType="application/json"):
+        """ Standard initializer.
+        """
+        self._response = {'status'       : status,
+                          'contents'     : contents,
+                          'content-type' : contentType}
+
+
+    def send(self, request):
+        """ Return our canned response.
+        """
+        return dict(self._response)
+
+#############################################################################
+
+def runBenchmark(benchmark, iterations=20, warmup=2):
+    """ Run the given benchmark, and return the measured performance.
+
+        The benchmark is run in a separate process, so that its peak memory
+        usage can be measured without interference from other benchmarks.
+        We return a dictionary with the following entries:
+
+            'iterations'
+
+                The number of timed iterations.
+
+            'itemsPerSec'
+
+                The number of items processed per second.
+
+            'p50Ms'
+
+                The median time taken by a single iteration, in milliseconds.
+
+            'p99Ms'
+
+                The 99th percentile time taken by a single iteration, in
+                milliseconds.
+
+            'peakMemoryKB'
+
+                The increase in the process's peak resident memory while
+                running the benchmark, in kilobytes.
+
+            'extra'
+
+                The dictionary returned by the benchmark's getExtraResults()
+                method, if any.
+    """
+    parent,child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=_runInProcess,
+                                      args=(benchmark, iterations, warmup,
+                                            child))
+    process.start()
+    results = parent.recv()
+    process.join()
+
+    if isinstance(results, Exception):
+        raise results
+    return results
+
+
+def percentile(values, fraction):
+    """ Return the given percentile of a list of values.
+
+        'fraction' should be between 0 and 1; for example, 0.99 returns the
+        99th percentile.  We use the nearest-rank method.
+    """
+    values = sorted(values)
+    index  = int(math.ceil(fraction * len(values))) - 1
+    return values[max(0, min(index, len(values) - 1))]
+
+#############################################################################
+
+def _runInProcess(benchmark, iterations, warmup, connection):
+    """ Run a benchmark, sending the results back over the given connection.
+
+        This is run in a child process.
+    """
+    try:
+        startMemory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        benchmark.setUp()
+        try:
+            for i in range(warmup):
+                benchmark.run()
+
+            gc.collect()
+            times = []
+            for i in range(iterations):
+                startTime = time.time()
+                benchmark.run()
+                times.append(time.time() - startTime)
+            extra = benchmark.getExtraResults()
+        finally:
+            benchmark.tearDown()
+
+        endMemory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        total     = sum(times)
+
+        if total > 0:
+            itemsPerSec = benchmark.itemsPerRun * iterations / total
+        else:
+            itemsPerSec = None
+
+        connection.send({'iterations'   : iterations,
+                         'itemsPerSec'  : itemsPerSec,
+                         'p50Ms'        : percentile(times, 0.50) * 1000.0,
+                         'p99Ms'        : percentile(times, 0.99) * 1000.0,
+                         'peakMemoryKB' : endMemory - startMemory,
+                         'extra'        : extra})
+    except Exception,e:
+        connection.send(e)
@@ -0,0 +1,546 @@
+""" benchmarks.clientBenchmarks
+
+    This Python module defines benchmarks for the hot paths in the 3taps API
+    clients.  The benchmarks use synthetic payloads, returned by a
+    CannedTransport or by an in-process fake server, so that they measure the
+    cost of the client code rather than the network.
+"""
+from benchmarks.benchmark import Benchmark, CannedTransport
+from threetaps.api import base
+from threetaps.api import clients
+from threetaps.api import models
+from threetaps.api import testing
+from threetaps.api.testing import syntheticData
+from threetaps.tools import DedupIndex, IngestJournal, SearchMirror
+
+import datetime
+import os
+import random
+import shutil
+import tempfile
+import simplejson as json
+
+#############################################################################
+
+NUM_ITEMS = 1000 # The number of items processed by each benchmark iteration.
+
+#############################################################################
+
+class SearchDecodeBenchmark(Benchmark):
+    """ Measure the cost of decoding a large search response.
+    """
+    name        = "search.decode"
+    itemsPerRun = NUM_ITEMS
+
+    def setUp(self):
+        contents = json.dumps({'success'    : True,
+                               'numResults' : NUM_ITEMS,
+                               'execTimeMs' : 10,
+                               'results'    :
+                                 syntheticData.makePostingDicts(NUM_ITEMS)})
+        self._api   = clients.SearchAPIClient(
+                            transport=CannedTransport(contents))
+        self._query = clients.SearchQuery(location="SFO")
+
+    def run(self):
+        self._api.search(self._query, rpp=-1)
+
+#############################################################################
+
+class MirrorSearchBenchmark(Benchmark):
+    """ Measure a search of a local SearchMirror holding 50,000 postings.
+
+        Each run finds the postings in one category and location under a
+        given price; compare with "search.decode", which only decodes a
+        response the same size as our results, without any network traffic.
+    """
+    name        = "mirror.search"
+    itemsPerRun = 1
+
+    def setUp(self):
+        server       = testing.FakeServer(numPostings=50000)
+        api          = clients.SearchAPIClient(
+                            transport=testing.FakeTransport(server))
+        self._dir    = tempfile.mkdtemp()
+        self._mirror = SearchMirror(os.path.join(self._dir, "mirror.db"),
+                                    api, pageSize=10000)
+        self._mirror.addSlice("all", clients.SearchQuery())
+        self._mirror.sync()
+        self._query      = clients.SearchQuery(category="VAUT",
+                                               location="SFO")
+        self._numResults = 0
+
+    def run(self):
+        self._numResults = len(self._mirror.search(self._query,
+                                                   maxPrice=2500))
+
+    def tearDown(self):
+        self._mirror.close()
+        shutil.rmtree(self._dir)
+
+    def getExtraResults(self):
+        return {'results' : self._numResults}
+
+#############################################################################
+
+class QueryFilterBenchmark(Benchmark):
+    """ Measure a QueryFilter applied to 1,000,000 Posting objects.
+
+        The postings are 10,000 synthetic postings, repeated 100 times.  Each
+        run compiles the query and filters every posting; compare with
+        "query.naive", which interprets the query afresh for each posting.
+    """
+    name        = "query.filter1M"
+    itemsPerRun = 1000000
+
+    def setUp(self):
+        self._postings   = syntheticData.makePostings(10000) * 100
+        self._query      = clients.SearchQuery(
+                                category="VAUT+OR+VMOT",
+                                location="SFO+OR+LAX",
+                                text="vintage",
+                                start=datetime.datetime(2011, 1, 2),
+                                annotations={'color' : "red"})
+        self._numResults = 0
+
+    def run(self):
+        self._numResults = len(self._filter(self._postings))
+
+    def getExtraResults(self):
+        return {'results' : self._numResults}
+
+    def _filter(self, postings):
+        return clients.QueryFilter(self._query).filter(postings)
+
+
+class NaiveQueryFilterBenchmark(QueryFilterBenchmark):
+    """ Measure an uncompiled filter which interprets the query per posting.
+    """
+    name = "query.naive"
+
+    def _filter(self, postings):
+        query   = self._query
+        results = []
+        for posting in postings:
+            matches = True
+            for field in ["category", "location"]:
+                value = getattr(query, field)
+                if value != None and \
+                        getattr(posting, field) not in value.split("+OR+"):
+                    matches = False
+            if query.text != None:
+                text = query.text.lower()
+                if text not in (posting.heading or "").lower() and \
+                        text not in (posting.body or "").lower():
+                    matches = False
+            if query.start != None and posting.timestamp < query.start:
+                matches = False
+            for key,value in query.annotations.items():
+                if (posting.annotations or {}).get(key) != value:
+                    matches = False
+            if matches:
+                results.append(posting)
+        return results
+
+
+class QueryFilterColumnsBenchmark(QueryFilterBenchmark):
+    """ Measure a QueryFilter applied to a columnar batch of 1,000,000 rows.
+    """
+    name = "query.filterColumns1M"
+
+    def setUp(self):
+        QueryFilterBenchmark.setUp(self)
+        self._columns = {}
+        for field in ["category", "location", "heading", "body",
+                      "timestamp", "annotations"]:
+            self._columns[field] = [getattr(posting, field)
+                                    for posting in self._postings]
+        self._postings = None
+
+    def run(self):
+        self._numResults = len(clients.QueryFilter(
+                                    self._query).filterColumns(self._columns))
+
+#############################################################################
+
+class CreateManyEncodeBenchmark(Benchmark):
+    """ Measure the cost of encoding a large createMany() request.
+    """
+    name        = "posting.createMany"
+    itemsPerRun = NUM_ITEMS
+
+    def setUp(self):
+        contents = json.dumps([{'postKey' : "P%07d" % i}
+                               for i in range(NUM_ITEMS)])
+        self._api      = clients.PostingAPIClient(
+                            transport=CannedTransport(contents))
+        self._postings = syntheticData.makePostings(NUM_ITEMS)
+
+    def run(self):
+        self._api.createMany(self._postings)
+
+#############################################################################
+
+class CreateMany100kBenchmark(Benchmark):
+    """ Measure the cost of encoding a 100,000-posting createMany() request.
+    """
+    name        = "posting.createMany100k"
+    itemsPerRun = 100000
+
+    def setUp(self):
+        self._api      = clients.PostingAPIClient(
+                            transport=CannedTransport("[]"))
+        self._postings = syntheticData.makePostings(self.itemsPerRun)
+
+    def run(self):
+        self._api.createMany(self._postings)
+
+#############################################################################
+
+class CreateStream100kBenchmark(Benchmark):
+    """ Measure createStream() with 100,000 postings generated on the fly.
+
+        Compare the peak memory with the "posting.createMany100k" benchmark,
+        which holds every posting and the whole request in memory at once.
+    """
+    name        = "posting.createStream100k"
+    itemsPerRun = 100000
+
+    def setUp(self):
+        self._api = clients.PostingAPIClient(transport=CannedTransport(
+                        json.dumps([{'postKey' : "P%07d" % i}
+                                    for i in range(1000)])))
+
+    def run(self):
+        for response in self._api.createStream(self._generatePostings(),
+                                               chunkSize=1000):
+            pass
+
+    def _generatePostings(self):
+        for seed in range(self.itemsPerRun / 1000):
+            for posting in syntheticData.makePostings(1000, seed):
+                yield posting
+
+#############################################################################
+
+class JournalBenchmark(Benchmark):
+    """ Measure createStream() without an IngestJournal.
+
+        This is the baseline for the "posting.journal" benchmarks below, which
+        record each chunk of 100 postings in an IngestJournal, flushing the
+        journal to disk after a varying number of records.
+    """
+    name        = "posting.journal.none"
+    itemsPerRun = 20000
+    syncEvery   = None
+
+    def setUp(self):
+        self._api      = clients.PostingAPIClient(transport=CannedTransport(
+                            json.dumps([{'postKey' : "P%07d" % i}
+                                        for i in range(100)])))
+        self._postings = syntheticData.makePostings(self.itemsPerRun)
+        self._dir      = tempfile.mkdtemp()
+        self._stats    = None
+
+    def run(self):
+        if self.syncEvery == None:
+            journal = None
+        else:
+            path = os.path.join(self._dir, "postings.journal")
+            if os.path.exists(path):
+                os.remove(path)
+            journal = IngestJournal(path, self.syncEvery)
+
+        for response in self._api.createStream(self._postings, chunkSize=100,
+                                               journal=journal):
+            pass
+
+        if journal != None:
+            journal.close()
+            self._stats = journal.getStats()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def getExtraResults(self):
+        if self._stats == None:
+            return None
+        return {'syncs'     : self._stats['syncs'],
+                'journalKB' : self._stats['bytes'] / 1024}
+
+
+class JournalSyncEveryRecordBenchmark(JournalBenchmark):
+    """ Measure createStream() with an fsync after every journal record.
+    """
+    name      = "posting.journal.sync1"
+    syncEvery = 1
+
+
+class JournalSyncBatchedBenchmark(JournalBenchmark):
+    """ Measure createStream() with an fsync after every 16 journal records.
+    """
+    name      = "posting.journal.sync16"
+    syncEvery = 16
+
+
+class JournalNoSyncBenchmark(JournalBenchmark):
+    """ Measure createStream() with a journal which is only synced on close.
+    """
+    name      = "posting.journal.sync0"
+    syncEvery = 0
+
+#############################################################################
+
+class DedupRescrapeBenchmark(Benchmark):
+    """ Measure a re-scrape of 20,000 postings through a DedupIndex.
+
+        The index already holds every posting, and 1% of them have changed,
+        so only the changed postings should be sent.  Compare with the
+        "posting.createMany" benchmarks, which encode and send everything.
+    """
+    name        = "posting.dedup.rescrape"
+    itemsPerRun = 20000
+
+    def setUp(self):
+        self._dir   = tempfile.mkdtemp()
+        self._index = DedupIndex(os.path.join(self._dir, "postings.index"),
+                                 expectedItems=self.itemsPerRun)
+        for posting in syntheticData.makePostings(self.itemsPerRun):
+            self._index.record(posting.source, posting.externalID,
+                               "P%s" % posting.externalID,
+                               self._index.contentHash(posting))
+        self._index.commit()
+
+        self._postings = syntheticData.makePostings(self.itemsPerRun)
+        self._headings = [posting.heading for posting in self._postings]
+        self._numRuns  = 0
+
+        self._api = clients.PostingAPIClient(transport=CannedTransport(
+                            json.dumps({'success' : True})))
+
+    def run(self):
+        self._numRuns = self._numRuns + 1
+        for i in range(0, self.itemsPerRun, 100):
+            self._postings[i].heading = "%s (%d)" % (self._headings[i],
+                                                     self._numRuns)
+
+        for result in self._index.createOrUpdate(self._api, self._postings):
+            pass
+
+    def tearDown(self):
+        self._index.close()
+        shutil.rmtree(self._dir)
+
+    def getExtraResults(self):
+        stats = self._index.getStats()
+        return {'changedPerRun' : stats['changed'] / self._numRuns,
+                'lookups'       : stats['lookups']}
+
+#############################################################################
+
+class PostingToDictBenchmark(Benchmark):
+    """ Measure the cost of converting Posting objects to dictionaries.
+    """
+    name        = "posting.postingToDict"
+    itemsPerRun = NUM_ITEMS
+
+    def setUp(self):
+        self._api      = clients.PostingAPIClient()
+        self._postings = syntheticData.makePostings(NUM_ITEMS)
+
+    def run(self):
+        for posting in self._postings:
+            self._api._postingToDict(posting)
+
+#############################################################################
+
+class QueryToParamsDictBenchmark(Benchmark):
+    """ Measure the cost of converting SearchQuery objects to parameters.
+    """
+    name        = "search.queryToParamsDict"
+    itemsPerRun = NUM_ITEMS
+
+    def setUp(self):
+        rng = random.Random(0)
+        self._api     = clients.SearchAPIClient()
+        self._queries = []
+        for i in range(NUM_ITEMS):
+            start = datetime.datetime(2011, 1, 1) \
+                  + datetime.timedelta(hours=i)
+            self._queries.append(clients.SearchQuery(
+                source      = rng.choice(syntheticData.SOURCES)[0],
+                category    = rng.choice(syntheticData.CATEGORIES)[1],
+                location    = "SFO+OR+LAX",
+                text        = "vintage bike %d" % i,
+                start       = start,
+                end         = start + datetime.timedelta(days=1),
+                annotations = {'color' : "red"}))
+
+    def run(self):
+        for query in self._queries:
+            self._api._queryToParamsDict(query)
+
+#############################################################################
+
+class StatusGetParseBenchmark(Benchmark):
+    """ Measure the cost of parsing status histories, including timestamps.
+    """
+    name        = "status.get"
+    itemsPerRun = NUM_ITEMS
+
+    def setUp(self):
+        histories = []
+        for i in range(NUM_ITEMS):
+            history = {}
+            for status in ["found", "got", "processed", "sent"]:
+                history[status] = [{'timestamp'  : "2011/01/02 03:04:05 UTC",
+                                    'attributes' : {'worker' : 1}}]
+            histories.append({'exists'     : True,
+                              'externalID' : str(i),
+                              'source'     : "CRAIG",
+                              'history'    : history})
+        self._api      = clients.StatusAPIClient(
+                            transport=CannedTransport(json.dumps(histories)))
+        self._postings = [models.Posting(source="CRAIG", externalID=str(i))
+                          for i in range(NUM_ITEMS)]
+
+    def run(self):
+        self._api.get(self._postings)
+
+#############################################################################
+
+class ReferenceParseBenchmark(Benchmark):
+    """ Measure the cost of parsing the reference categories and locations.
+    """
+    name        = "reference.parse"
+    itemsPerRun = NUM_ITEMS * 2
+
+    def setUp(self):
+        categories = syntheticData.makeCategoryDicts()
+        locations  = syntheticData.makeLocationDicts()
+        self._categoryAPI = clients.ReferenceAPIClient(
+            transport=CannedTransport(json.dumps(
+                [categories[i % len(categories)] for i in range(NUM_ITEMS)])))
+        self._locationAPI = clients.ReferenceAPIClient(
+            transport=CannedTransport(json.dumps(
+                [locations[i % len(locations)] for i in range(NUM_ITEMS)])))
+
+    def run(self):
+        self._categoryAPI.getCategories()
+        self._locationAPI.getLocations()
+
+#############################################################################
+
+class GeocodeBenchmark(Benchmark):
+    """ Measure the cost of geocoding against the in-process fake server.
+
+        Half of the requests are duplicates of earlier requests, with
+        different case and spacing.
+    """
+    name        = "geocoder.geocode"
+    itemsPerRun = NUM_ITEMS
+
+    def setUp(self):
+        server = testing.FakeServer(numPostings=0)
+        self._api      = clients.GeocoderAPIClient(
+                            transport=testing.FakeTransport(server))
+        self._requests = [clients.GeocodeRequest(**request) for request in
+                          syntheticData.makeGeocodeRequests(NUM_ITEMS)]
+
+    def run(self):
+        self._api.geocode(self._requests)
+
+#############################################################################
+
+class RequestBenchmark(Benchmark):
+    """ Measure the fixed cost of making a small API request.
+    """
+    name        = "client.request"
+    itemsPerRun = NUM_ITEMS
+
+    def setUp(self):
+        self._api   = clients.SearchAPIClient(
+                            transport=CannedTransport('{"count" : 1}'))
+        self._query = clients.SearchQuery(location="SFO")
+
+    def run(self):
+        for i in range(NUM_ITEMS):
+            self._api.count(self._query)
+
+#############################################################################
+
+class MetricsRequestBenchmark(RequestBenchmark):
+    """ Measure the cost of a small API request with metrics enabled.
+
+        Compare this with the "client.request" benchmark to see the overhead
+        added by the MetricsHook.
+    """
+    name = "client.request.metrics"
+
+    def setUp(self):
+        RequestBenchmark.setUp(self)
+        self._api.addHook(base.MetricsHook(base.MetricsRegistry()))
+
+#############################################################################
+
+class StragglerSearchBenchmark(Benchmark):
+    """ Measure search latency against a fake server with slow stragglers.
+
+        One request in twenty takes an extra 50 milliseconds.
+    """
+    name        = "hedging.baseline"
+    itemsPerRun = 100
+
+    def setUp(self):
+        server = testing.FakeServer(numPostings=100, latencyMs=2,
+                                    stragglerRate=0.05, stragglerMs=50)
+        self._api   = clients.SearchAPIClient(
+                            transport=self._makeTransport(
+                                testing.FakeTransport(server)))
+        self._query = clients.SearchQuery(location="SFO")
+
+    def run(self):
+        for i in range(self.itemsPerRun):
+            self._api.search(self._query, rpp=5)
+
+    def _makeTransport(self, transport):
+        return transport
+
+#############################################################################
+
+class HedgedSearchBenchmark(StragglerSearchBenchmark):
+    """ Measure search latency against stragglers, with hedging enabled.
+
+        Compare this with the "hedging.baseline" benchmark.
+    """
+    name = "hedging.search"
+
+    def _makeTransport(self, transport):
+        return base.HedgingTransport(transport, percentile=0.9,
+                                     maxExtraLoad=0.1,
+                                     registry=base.MetricsRegistry())
+
+#############################################################################
+
+BENCHMARKS = [SearchDecodeBenchmark,
+              MirrorSearchBenchmark,
+              QueryFilterBenchmark,
+              NaiveQueryFilterBenchmark,
+              QueryFilterColumnsBenchmark,
+              CreateManyEncodeBenchmark,
+              CreateMany100kBenchmark,
+              CreateStream100kBenchmark,
+              JournalBenchmark,
+              JournalSyncEveryRecordBenchmark,
+              JournalSyncBatchedBenchmark,
+              JournalNoSyncBenchmark,
+              DedupRescrapeBenchmark,
+              PostingToDictBenchmark,
+              QueryToParamsDictBenchmark,
+              StatusGetParseBenchmark,
+              ReferenceParseBenchmark,
+              GeocodeBenchmark,
+              RequestBenchmark,
+              MetricsRequestBenchmark,
+              StragglerSearchBenchmark,
+              HedgedSearchBenchmark]
@@ -0,0 +1,186 @@
+""" benchmarks.transportBenchmarks
+
+    This Python module defines benchmarks for the HTTP transport layer.
+    These benchmarks make real HTTP requests to a fake 3taps server running
+    on localhost, so that they include the cost of encoding, sending,
+    receiving and decoding each request.
+"""
+from benchmarks.benchmark import Benchmark
+from threetaps.api import clients
+from threetaps.api import testing
+from threetaps.api.base.transport import HTTPTransport, Transport
+from threetaps.api.testing import syntheticData
+
+#############################################################################
+
+NUM_POSTINGS = 1000 # The number of postings in each request or response.
+
+#############################################################################
+
+class WireCountingTransport(Transport):
+    """ A Transport which totals the bytes sent over the network, and the
+        time spent reading responses.
+    """
+    def __init__(self, transport):
+        self.bytesSent     = 0
+        self.bytesReceived = 0
+        self.readTime      = 0
+        self._transport    = transport
+
+    def send(self, request):
+        response = self._transport.send(request)
+        self.bytesSent     = self.bytesSent     + (request.bytesSent or 0)
+        self.bytesReceived = self.bytesReceived + (request.bytesReceived or 0)
+        self.readTime      = self.readTime + request.timings.get("read", 0)
+        return response
+
+#############################################################################
+
+class HTTPBenchmark(Benchmark):
+    """ The base class for a benchmark which talks to a FakeHTTPServer.
+
+        Subclasses set 'compress' to True to enable compression of requests
+        and responses.  We report the average number of bytes sent and
+        received over the network in each iteration.
+    """
+    compress = False
+
+    def setUp(self):
+        self._httpServer = testing.FakeHTTPServer(
+                                testing.FakeServer(numPostings=NUM_POSTINGS))
+        self._httpServer.start()
+        if self.compress:
+            transport = HTTPTransport(acceptCompression=True,
+                                      compressThreshold=1024)
+        else:
+            transport = HTTPTransport(acceptCompression=False)
+        self._transport = WireCountingTransport(transport)
+        self._numRuns   = 0
+
+    def tearDown(self):
+        self._httpServer.stop()
+
+    def run(self):
+        self._numRuns = self._numRuns + 1
+        self.runRequest()
+
+    def runRequest(self):
+        raise NotImplementedError()
+
+    def getExtraResults(self):
+        return {'bytesSent'     : self._transport.bytesSent
+                                / self._numRuns,
+                'bytesReceived' : self._transport.bytesReceived
+                                / self._numRuns}
+
+#############################################################################
+
+class SearchBenchmark(HTTPBenchmark):
+    """ Measure a large search over HTTP, without compression.
+    """
+    name        = "http.search.plain"
+    itemsPerRun = NUM_POSTINGS
+
+    def setUp(self):
+        HTTPBenchmark.setUp(self)
+        self._api   = clients.SearchAPIClient(url=self._httpServer.url,
+                                              port=self._httpServer.port,
+                                              transport=self._transport)
+        self._query = clients.SearchQuery()
+        self._retvals = ["source", "category", "location", "heading", "body",
+                         "price", "timestamp", "externalURL", "annotations"]
+
+    def runRequest(self):
+        self._api.search(self._query, rpp=-1, retvals=self._retvals)
+
+#############################################################################
+
+class CompressedSearchBenchmark(SearchBenchmark):
+    """ Measure a large search over HTTP, with a gzip-compressed response.
+    """
+    name     = "http.search.gzip"
+    compress = True
+
+#############################################################################
+
+class CreateManyBenchmark(HTTPBenchmark):
+    """ Measure a large createMany() call over HTTP, without compression.
+    """
+    name        = "http.createMany.plain"
+    itemsPerRun = NUM_POSTINGS
+
+    def setUp(self):
+        HTTPBenchmark.setUp(self)
+        self._api      = clients.PostingAPIClient(url=self._httpServer.url,
+                                                  port=self._httpServer.port,
+                                                  transport=self._transport)
+        self._postings = syntheticData.makePostings(NUM_POSTINGS)
+
+    def runRequest(self):
+        self._api.createMany(self._postings)
+
+#############################################################################
+
+class CompressedCreateManyBenchmark(CreateManyBenchmark):
+    """ Measure a large createMany() call over HTTP, with compression.
+    """
+    name     = "http.createMany.gzip"
+    compress = True
+
+#############################################################################
+
+class CannedServer:
+    """ A stand-in for a FakeServer, which returns the same response to
+        every request.
+
+        This keeps the cost of generating the response out of the benchmark.
+    """
+    def __init__(self, contents):
+        self._contents = contents
+
+    def handle(self, method, path, params):
+        return (200, "application/json", self._contents)
+
+#############################################################################
+
+class LargeResponseBenchmark(HTTPBenchmark):
+    """ Measure the cost of receiving a multi-megabyte search response.
+
+        We report the average time spent reading the response body.
+    """
+    name        = "http.search.large"
+    itemsPerRun = NUM_POSTINGS * 5
+
+    def setUp(self):
+        server = testing.FakeServer(numPostings=self.itemsPerRun)
+        contents = server.handle("GET", "/search",
+                                 {'rpp'     : "-1",
+                                  'retvals' : "source,category,location," +
+                                              "heading,body,price," +
+                                              "timestamp,annotations"})[2]
+        self._httpServer = testing.FakeHTTPServer(CannedServer(contents))
+        self._httpServer.start()
+        self._transport = WireCountingTransport(
+                                HTTPTransport(acceptCompression=False))
+        self._numRuns   = 0
+        self._api       = clients.SearchAPIClient(url=self._httpServer.url,
+                                                  port=self._httpServer.port,
+                                                  transport=self._transport)
+        self._query     = clients.SearchQuery()
+
+    def runRequest(self):
+        self._api.search(self._query, rpp=-1)
+
+    def getExtraResults(self):
+        results = HTTPBenchmark.getExtraResults(self)
+        results['readMs'] = round(self._transport.readTime * 1000.0
+                                  / self._numRuns, 2)
+        return results
+
+#############################################################################
+
+BENCHMARKS = [SearchBenchmark,
+              CompressedSearchBenchmark,
+              CreateManyBenchmark,
+              CompressedCreateManyBenchmark,
+              LargeResponseBenchmark]
@@ -0,0 +1,110 @@
+""" importPostings.py
+
+    This Python program imports postings from a JSONL or CSV file into the
+    3taps system, using the PostingImporter class.  For example:
+
+        python importPostings.py --rejects rejects.jsonl postings.csv
+
+    Use "--map column=field" to import a column into a Posting field with a
+    different name.  Use "--journal" to make the import resumable: if it is
+    interrupted, run the same command again to carry on where it stopped.
+"""
+from threetaps.api.base import constants
+from threetaps.api.clients import PostingAPIClient
+from threetaps.tools import ingestJournal
+from threetaps.tools import postingImporter
+
+import optparse
+import sys
+
+#############################################################################
+
+def showProgress(stats):
+    """ Print the progress of an import.
+    """
+    print "%10d rows  %10d created  %8d rejected  %10.1f rows/sec" % \
+            (stats['rows'], stats['created'], stats['rejected'],
+             stats['rowsPerSec'])
+    sys.stdout.flush()
+
+#############################################################################
+
+def main():
+    """ Import the postings, using the options given on the command line.
+    """
+    parser = optparse.OptionParser(usage="%prog [options] file")
+    parser.add_option("-f", "--format", dest="format",
+                      choices=[postingImporter.FORMAT_JSONL,
+                               postingImporter.FORMAT_CSV],
+                      help="input format (jsonl or csv); by default this " +
+                           "is chosen based on the file's extension")
+    parser.add_option("-r", "--rejects", dest="rejects",
+                      help="write rows which could not be imported to the " +
+                           "given JSONL file")
+    parser.add_option("-m", "--map", dest="map", action="append",
+                      default=[], metavar="COLUMN=FIELD",
+                      help="import the given column into a posting field " +
+                           "(may be repeated)")
+    parser.add_option("-c", "--chunk-size", dest="chunkSize", type="int",
+                      default=1000, help="number of postings per request")
+    parser.add_option("-w", "--workers", dest="workers", type="int",
+                      default=4, help="number of requests to send at once")
+    parser.add_option("-p", "--processes", dest="processes", type="int",
+                      help="number of parsing processes (default: one per " +
+                           "CPU; 0 parses in this process)")
+    parser.add_option("-j", "--journal", dest="journal",
+                      help="record progress in the given journal file, so " +
+                           "that an interrupted import can be resumed")
+    parser.add_option("-s", "--sync-every", dest="syncEvery", type="int",
+                      default=1,
+                      help="flush the journal to disk after this many " +
+                           "records (0 only flushes at the end)")
+    parser.add_option("-u", "--url", dest="url",
+                      default=constants.DEFAULT_API_URL,
+                      help="URL of the 3taps API server")
+    parser.add_option("--port", dest="port", type="int",
+                      default=constants.DEFAULT_API_PORT,
+                      help="port of the 3taps API server")
+    options,args = parser.parse_args()
+
+    if len(args) != 1:
+        parser.error("Please specify exactly one file to import.")
+
+    columnMap = {}
+    for mapping in options.map:
+        if "=" not in mapping:
+            parser.error("Invalid column mapping: " + repr(mapping))
+        column,field = mapping.split("=", 1)
+        columnMap[column] = field
+
+    client   = PostingAPIClient(options.url, options.port)
+    importer = postingImporter.PostingImporter(client,
+                                               chunkSize=options.chunkSize,
+                                               maxWorkers=options.workers,
+                                               numProcesses=options.processes,
+                                               columnMap=columnMap)
+    if options.journal:
+        journal = ingestJournal.IngestJournal(options.journal,
+                                              options.syncEvery)
+    else:
+        journal = None
+
+    try:
+        stats = importer.importFile(args[0], options.format, options.rejects,
+                                    showProgress, journal=journal)
+    finally:
+        if journal != None:
+            journal.close()
+
+    showProgress(stats)
+    if stats['skipped'] > 0:
+        print "Skipped %d rows imported by an earlier run." % stats['skipped']
+    print "Finished in %0.1f seconds." % stats['elapsed']
+
+    if stats['rejected'] > 0:
+        sys.exit(1)
+
+#############################################################################
+
+if __name__ == "__main__":
+    main()
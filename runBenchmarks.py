@@ -0,0 +1,131 @@
+""" runBenchmarks.py
+
+    This Python program runs the various benchmarks defined in the
+    'benchmarks' package, and saves the results as JSON so that they can be
+    compared across commits.
+"""
+import benchmarks.benchmark
+import benchmarks.clientBenchmarks
+import benchmarks.transportBenchmarks
+
+import datetime
+import optparse
+import platform
+import subprocess
+import sys
+import simplejson as json
+
+#############################################################################
+
+ALL_BENCHMARKS = benchmarks.clientBenchmarks.BENCHMARKS \
+               + benchmarks.transportBenchmarks.BENCHMARKS
+
+#############################################################################
+
+def runBenchmarks(names=None, iterations=20):
+    """ Run the benchmarks, returning a dictionary with the results.
+
+        If 'names' is given, only the benchmarks whose name starts with one
+        of the given strings are run.
+    """
+    results = {}
+    for benchmarkClass in ALL_BENCHMARKS:
+        name = benchmarkClass.name
+        if names and not [prefix for prefix in names
+                          if name.startswith(prefix)]:
+            continue
+
+        result = benchmarks.benchmark.runBenchmark(benchmarkClass(),
+                                                   iterations)
+        results[name] = result
+        print "%-30s %12.1f items/sec  p50=%8.2fms  p99=%8.2fms  %8d KB" % \
+                (name, result['itemsPerSec'] or 0, result['p50Ms'],
+                 result['p99Ms'], result['peakMemoryKB'])
+        if result.get("extra"):
+            print "%-30s %s" % ("", "  ".join(["%s=%s" % item for item in
+                                             sorted(result['extra'].items())]))
+
+    return {'commit'     : getCommit(),
+            'timestamp'  : datetime.datetime.utcnow().isoformat(),
+            'python'     : platform.python_version(),
+            'benchmarks' : results}
+
+#############################################################################
+
+def compareResults(baseline, current, threshold):
+    """ Compare two sets of benchmark results, printing the differences.
+
+        A benchmark whose throughput has dropped by more than 'threshold'
+        percent is reported as a regression.  We return the number of
+        regressions found.
+    """
+    print
+    print "Compared with commit %s:" % baseline.get("commit")
+
+    numRegressions = 0
+    for name,result in sorted(current['benchmarks'].items()):
+        old = baseline['benchmarks'].get(name)
+        if old == None or not old['itemsPerSec'] or not result['itemsPerSec']:
+            continue
+        change = (result['itemsPerSec'] - old['itemsPerSec']) \
+               * 100.0 / old['itemsPerSec']
+        if change < -threshold:
+            flag = "REGRESSION"
+            numRegressions = numRegressions + 1
+        else:
+            flag = ""
+        print "%-30s %+7.1f%% throughput  p99 %8.2fms -> %8.2fms  %s" % \
+                (name, change, old['p99Ms'], result['p99Ms'], flag)
+    return numRegressions
+
+
+def getCommit():
+    """ Return the current git commit hash, or None if it is not known.
+    """
+    try:
+        process = subprocess.Popen(["git", "rev-parse", "HEAD"],
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE)
+        output = process.communicate()[0]
+    except OSError:
+        return None
+    if process.returncode != 0:
+        return None
+    return output.strip()
+
+#############################################################################
+
+def main():
+    """ Run the benchmarks, using the options given on the command line.
+    """
+    parser = optparse.OptionParser(usage="%prog [options] [benchmark...]")
+    parser.add_option("-o", "--output", dest="output",
+                      help="save the results to the given JSON file")
+    parser.add_option("-c", "--compare", dest="compare",
+                      help="compare the results with the given JSON file")
+    parser.add_option("-n", "--iterations", dest="iterations", type="int",
+                      default=20, help="number of timed iterations")
+    parser.add_option("-t", "--threshold", dest="threshold", type="float",
+                      default=10.0,
+                      help="throughput drop (in percent) to report as a " +
+                           "regression")
+    options,names = parser.parse_args()
+
+    results = runBenchmarks(names, options.iterations)
+
+    if options.output:
+        f = open(options.output, "w")
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.close()
+
+    if options.compare:
+        f = open(options.compare, "r")
+        baseline = json.load(f)
+        f.close()
+        if compareResults(baseline, results, options.threshold) > 0:
+            sys.exit(1)
+
+#############################################################################
+
+if __name__ == "__main__":
+    main()
@@ -2,14 +2,46 @@
 
     This Python program runs the various unit tests defined in the 'tests'
     package.
+
+    The API client unit tests normally talk to the live 3taps server.  Use
+    the "--record" option to record the server's responses to a cassette
+    file, and "--replay" to run the tests against a recorded cassette
+    instead.
 """
+import tests.cassetteTests
+import tests.createResultTests
+import tests.dedupIndexTests
+import tests.encodersTests
+import tests.fakeServerTests
+import tests.geocodeBatcherTests
+import tests.geocodeCacheTests
 import tests.geocoderAPIClientTests
+import tests.geocoderChunkingTests
+import tests.hedgingTests
+import tests.ingestJournalTests
+import tests.instrumentationTests
+import tests.metricsTests
 import tests.postingAPIClientTests
+import tests.postingImporterTests
+import tests.postingStreamTests
+import tests.queryFilterTests
+import tests.rateLimiterTests
 import tests.referenceAPIClientTests
+import tests.resilienceTests
 import tests.searchAPIClientTests
+import tests.searchMirrorTests
+import tests.singleFlightTests
 import tests.statusAPIClientTests
+import tests.statusEmitterTests
+import tests.statusGetManyTests
+import tests.systemStatusMonitorTests
+import tests.transportTests
+
+from threetaps.api import testing
+from threetaps.api.base import transport
 
 import logging
+import optparse
 import unittest
 
 #############################################################################
@@ -17,18 +49,67 @@ import unittest
 def runTests():
     """ Run the various unit tests.
     """
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option("-r", "--record", dest="record",
+                      help="record the server's responses to the given " +
+                           "cassette file")
+    parser.add_option("-p", "--replay", dest="replay",
+                      help="replay the server's responses from the given " +
+                           "cassette file")
+    parser.add_option("-s", "--latency-scale", dest="latencyScale",
+                      type="float", default=0.0,
+                      help="multiply the replayed latencies by this amount")
+    parser.add_option("-o", "--preserve-offsets", dest="preserveOffsets",
+                      action="store_true", default=False,
+                      help="reproduce the recorded gaps between requests")
+    options,args = parser.parse_args()
+
+    if options.record:
+        recorder = testing.RecordingTransport(options.record)
+        transport.setDefaultTransport(recorder)
+    elif options.replay:
+        transport.setDefaultTransport(
+            testing.ReplayTransport(options.replay, options.latencyScale,
+                                    options.preserveOffsets))
+
 #    logging.basicConfig(level=logging.INFO) # Show API requests.
 
     allTests = unittest.TestSuite()
+    allTests.addTest(tests.cassetteTests.suite())
+    allTests.addTest(tests.createResultTests.suite())
+    allTests.addTest(tests.dedupIndexTests.suite())
+    allTests.addTest(tests.encodersTests.suite())
+    allTests.addTest(tests.fakeServerTests.suite())
+    allTests.addTest(tests.geocodeBatcherTests.suite())
+    allTests.addTest(tests.geocodeCacheTests.suite())
     allTests.addTest(tests.geocoderAPIClientTests.suite())
+    allTests.addTest(tests.geocoderChunkingTests.suite())
+    allTests.addTest(tests.hedgingTests.suite())
+    allTests.addTest(tests.ingestJournalTests.suite())
+    allTests.addTest(tests.instrumentationTests.suite())
+    allTests.addTest(tests.metricsTests.suite())
     allTests.addTest(tests.postingAPIClientTests.suite())
+    allTests.addTest(tests.postingImporterTests.suite())
+    allTests.addTest(tests.postingStreamTests.suite())
+    allTests.addTest(tests.queryFilterTests.suite())
+    allTests.addTest(tests.rateLimiterTests.suite())
     allTests.addTest(tests.referenceAPIClientTests.suite())
+    allTests.addTest(tests.resilienceTests.suite())
     allTests.addTest(tests.searchAPIClientTests.suite())
+    allTests.addTest(tests.searchMirrorTests.suite())
+    allTests.addTest(tests.singleFlightTests.suite())
     allTests.addTest(tests.statusAPIClientTests.suite())
+    allTests.addTest(tests.statusEmitterTests.suite())
+    allTests.addTest(tests.statusGetManyTests.suite())
+    allTests.addTest(tests.systemStatusMonitorTests.suite())
+    allTests.addTest(tests.transportTests.suite())
 
     runner = unittest.TextTestRunner(verbosity=2)
     runner.run(allTests)
 
+    if options.record:
+        recorder.close()
+
 #############################################################################
 
 if __name__ == "__main__":
@@ -0,0 +1,137 @@
+""" cassetteTests.py
+
+    This Python module defines unit tests for the cassette record and replay
+    transports.
+"""
+from threetaps.api import clients
+from threetaps.api import testing
+from threetaps.api.base import transport
+from threetaps.api.testing.cassette import readCassette
+
+import tests.postingAPIClientTests
+import tests.statusAPIClientTests
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+#############################################################################
+
+class CassetteTestCase(unittest.TestCase):
+    """ This class implements the various unit tests for the cassettes.
+    """
+    def setUp(self):
+        """ Prepare to run our unit tests.
+        """
+        self._dir = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        """ Clean up after our unit tests.
+        """
+        shutil.rmtree(self._dir)
+
+
+    def testRecordAndReplay(self):
+        """ Test that recorded responses are replayed
+        """
+        for name in ["cassette.jsonl", "cassette.jsonl.gz"]:
+            path   = os.path.join(self._dir, name)
+            server = testing.FakeServer(numPostings=50, latencyMs=20)
+            recorder = testing.RecordingTransport(path,
+                                                  testing.FakeTransport(server))
+            api   = clients.SearchAPIClient(transport=recorder)
+            query = clients.SearchQuery(source="CRAIG")
+            recorded = api.search(query, rpp=5)
+            count    = api.count(query)
+            recorder.close()
+
+            exchanges = list(readCassette(path))
+            assert len(exchanges) == 2
+            assert exchanges[0]['latency'] >= 0.02
+            assert exchanges[1]['offset'] >= exchanges[0]['latency']
+
+            player = testing.ReplayTransport(path, latencyScale=0.0)
+            api    = clients.SearchAPIClient(url="http://elsewhere", port=81,
+                                             transport=player)
+            startTime = time.time()
+            assert api.search(query, rpp=5)['numResults'] \
+                        == recorded['numResults']
+            assert api.count(query) == count
+            assert time.time() - startTime < 0.02
+            assert player.getNumReplayed() == 2
+
+
+    def testPreserveOffsets(self):
+        """ Test that the recorded gaps between requests are reproduced
+        """
+        path     = os.path.join(self._dir, "cassette.jsonl")
+        recorder = testing.RecordingTransport(path, testing.FakeTransport(
+                                                        testing.FakeServer()))
+        api      = clients.SearchAPIClient(transport=recorder)
+        api.count(clients.SearchQuery(source="CRAIG"))
+        time.sleep(0.1)
+        api.count(clients.SearchQuery(source="EBAYM"))
+        recorder.close()
+
+        for preserveOffsets,minElapsed,maxElapsed in [(False, 0, 0.05),
+                                                      (True, 0.1, 1.0)]:
+            api = clients.SearchAPIClient(transport=testing.ReplayTransport(
+                            path, preserveOffsets=preserveOffsets))
+            startTime = time.time()
+            api.count(clients.SearchQuery(source="CRAIG"))
+            api.count(clients.SearchQuery(source="EBAYM"))
+            elapsed = time.time() - startTime
+            assert minElapsed <= elapsed < maxElapsed
+
+
+    def testReplayVolatileRequests(self):
+        """ Test that the API client tests can be replayed from a cassette
+        """
+        path     = os.path.join(self._dir, "cassette.jsonl")
+        original = transport.getDefaultTransport()
+        try:
+            for player in ["record", "replay"]:
+                if player == "record":
+                    server = testing.FakeServer(numPostings=0)
+                    player = testing.RecordingTransport(path,
+                                            testing.FakeTransport(server))
+                else:
+                    time.sleep(0.01) # Make sure time.time() has changed.
+                    player = testing.ReplayTransport(path, latencyScale=0.0)
+                transport.setDefaultTransport(player)
+
+                suite = unittest.TestSuite()
+                suite.addTest(tests.postingAPIClientTests.suite())
+                suite.addTest(tests.statusAPIClientTests.suite())
+                result = unittest.TestResult()
+                suite.run(result)
+                assert result.wasSuccessful(), result.failures
+
+                if isinstance(player, testing.RecordingTransport):
+                    player.close()
+        finally:
+            transport.setDefaultTransport(original)
+
+        assert player.getNumReplayed() > 0
+
+
+    def testUnrecordedRequest(self):
+        """ Test that a request missing from the cassette fails
+        """
+        path = os.path.join(self._dir, "empty.jsonl")
+        testing.RecordingTransport(path, testing.FakeTransport(
+                                            testing.FakeServer())).close()
+
+        api = clients.SearchAPIClient(transport=testing.ReplayTransport(path))
+        assert api.count(clients.SearchQuery(source="CRAIG")) == None
+
+#############################################################################
+
+def suite():
+    """ Create and return a test suite with all the tests we need to run.
+    """
+    loader = unittest.TestLoader()
+    return loader.loadTestsFromTestCase(CassetteTestCase)
@@ -0,0 +1,175 @@
+""" createResultTests.py
+
+    This Python module defines unit tests for the
+    PostingAPIClient.createWithRetries() method and the CreateResult class.
+"""
+from threetaps.api import base
+from threetaps.api import clients
+from threetaps.api import models
+from threetaps.api.base import Transport
+
+import cgi
+import unittest
+
+import simplejson as json
+
+#############################################################################
+
+class FlakyTransport(Transport):
+    """ A Transport which answers posting/create requests locally.
+
+        Any request containing a posting with the heading "poison" fails,
+        and any request containing a posting with the heading "malformed" is
+        rejected with an HTTP 400 status code.  A posting with the heading
+        "flaky" is rejected with a 503 error the first time it is sent, a
+        posting with no source is rejected with a 400 error, and a posting
+        with the heading "nokey" is created without a posting key.
+    """
+    def __init__(self):
+        self.chunkSizes  = []
+        self._seen       = set()
+        self._nextKey    = 0
+
+
+    def send(self, request):
+        postings = json.loads(cgi.parse_qs(request.body)['postings'][0])
+        self.chunkSizes.append(len(postings))
+
+        headings = [posting.get("heading") for posting in postings]
+        if "malformed" in headings:
+            return {'status'       : 400,
+                    'contents'     : "Malformed posting",
+                    'content-type' : "text/plain"}
+
+        results = []
+        for posting in postings:
+            heading = posting.get("heading")
+            if heading == "poison":
+                raise IOError("Bad request")
+            elif heading == "nokey":
+                results.append({})
+            elif heading == "flaky" and heading not in self._seen:
+                self._seen.add(heading)
+                results.append({'error' : {'code'    : 503,
+                                           'message' : "Try again"}})
+            elif "source" not in posting:
+                results.append({'error' : {'code'    : 400,
+                                           'message' : "Missing source"}})
+            else:
+                results.append({'postKey' : "P%d" % self._nextKey})
+                self._nextKey = self._nextKey + 1
+        return {'status'       : 200,
+                'contents'     : json.dumps(results),
+                'content-type' : "application/json"}
+
+#############################################################################
+
+class CreateResultTestCase(unittest.TestCase):
+    """ This class implements the unit tests for createWithRetries().
+    """
+    def setUp(self):
+        """ Prepare to run our unit tests.
+        """
+        self._transport = FlakyTransport()
+        self._api       = clients.PostingAPIClient(transport=self._transport)
+        self._policy    = base.RetryPolicy(maxAttempts=3, baseDelayMs=0)
+
+
+    def testPartialFailure(self):
+        """ Test that only the retryable postings are resubmitted
+        """
+        postings = [models.Posting(source="CRAIG", heading=str(i))
+                    for i in range(16)]
+        postings[3]  = models.Posting(source="CRAIG", heading="flaky")
+        postings[9]  = models.Posting(heading="no source")
+        postings[12] = models.Posting(source="CRAIG", heading="poison")
+
+        result = self._api.createWithRetries(postings, chunkSize=8,
+                                             retryPolicy=self._policy)
+
+        assert not result.isComplete()
+        assert result.numAttempts == 3
+        assert len(result.getSuccesses()) == 14
+        assert result.getPermanentErrors() \
+                    == [(9, {'code' : 400, 'message' : "Missing source"})]
+        assert result.getRetryableErrors() == []
+        assert result.getPoisonPostings() == [12]
+        assert result.getStatus(3) == clients.CreateResult.SUCCESS
+
+        postKeys = result.getPostKeys()
+        assert postKeys[9] == None and postKeys[12] == None
+        assert len(set(postKeys)) == 15 # 14 keys plus None.
+
+        # The first attempt sends both chunks, and bisects the second one
+        # (8 -> 4 -> 2 -> 1) to isolate the poison posting, which is left
+        # retryable.  The second attempt resends the flaky and poison
+        # postings together, bisecting again, and as the poison posting has
+        # now failed on its own twice it is counted as poison.  The third
+        # attempt only resends the poison posting.
+
+        assert self._transport.chunkSizes == [8, 8, 4, 4, 2, 1, 1, 2,
+                                              2, 1, 1,
+                                              1]
+
+
+    def testRejectedPosting(self):
+        """ Test that a posting the server rejects is poison at once
+        """
+        postings = [models.Posting(source="CRAIG", heading=str(i))
+                    for i in range(4)]
+        postings[1] = models.Posting(source="CRAIG", heading="malformed")
+
+        policy = base.RetryPolicy(maxAttempts=1, baseDelayMs=0)
+        result = self._api.createWithRetries(postings, retryPolicy=policy)
+
+        assert result.getPoisonPostings() == [1]
+        assert result.getRetryableErrors() == []
+        assert len(result.getSuccesses()) == 3
+
+
+    def testOutage(self):
+        """ Test that a single failed request doesn't make a posting poison
+        """
+        postings = [models.Posting(source="CRAIG", heading=str(i))
+                    for i in range(4)]
+        postings[2] = models.Posting(source="CRAIG", heading="poison")
+
+        policy = base.RetryPolicy(maxAttempts=1, baseDelayMs=0)
+        result = self._api.createWithRetries(postings, retryPolicy=policy)
+
+        assert result.getPoisonPostings() == []
+        assert result.getRetryableErrors() == [(2, None)]
+        assert not result.isComplete()
+
+
+    def testSuccessWithoutKey(self):
+        """ Test that a success response without a posting key is allowed
+        """
+        postings = [models.Posting(source="CRAIG", heading="nokey"),
+                    models.Posting(source="CRAIG", heading="keyed")]
+        result   = self._api.createWithRetries(postings,
+                                               retryPolicy=self._policy)
+
+        assert result.isComplete()
+        assert result.getSuccesses() == [(0, None), (1, "P0")]
+        assert result.getPostKeys() == [None, "P0"]
+
+
+    def testServerDown(self):
+        """ Test that we give up quickly if every request fails
+        """
+        postings = [models.Posting(source="CRAIG", heading="poison")] * 100
+        result   = self._api.createWithRetries(postings, chunkSize=10,
+                                               retryPolicy=self._policy,
+                                               maxFailedRequests=5)
+        assert len(self._transport.chunkSizes) == 15
+        assert len(result.getRetryableErrors()) + \
+               len(result.getPoisonPostings()) == 100
+
+#############################################################################
+
+def suite():
+    """ Create and return a test suite with all the tests we need to run.
+    """
+    loader = unittest.TestLoader()
+    return loader.loadTestsFromTestCase(CreateResultTestCase)
@@ -0,0 +1,139 @@
+""" dedupIndexTests.py
+
+    This Python module defines unit tests for the DedupIndex and BloomFilter
+    classes.
+"""
+from threetaps.api import clients
+from threetaps.api import testing
+from threetaps.api.testing import syntheticData
+from threetaps.tools import dedupIndex
+
+import os
+import shutil
+import tempfile
+import unittest
+
+#############################################################################
+
+class DedupIndexTestCase(unittest.TestCase):
+    """ This class implements the unit tests for the DedupIndex class.
+    """
+    def setUp(self):
+        """ Prepare to run our unit tests.
+        """
+        self._dir    = tempfile.mkdtemp()
+        self._path   = os.path.join(self._dir, "postings.index")
+        self._server = testing.FakeServer(numPostings=0)
+        self._api    = clients.PostingAPIClient(
+                            transport=testing.FakeTransport(self._server))
+
+
+    def tearDown(self):
+        """ Clean up after our unit tests.
+        """
+        shutil.rmtree(self._dir)
+        self._api    = None
+        self._server = None
+
+
+    def testBloomFilter(self):
+        """ Test the BloomFilter class
+        """
+        bloom = dedupIndex.BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add("key%d" % i)
+        for i in range(1000):
+            assert bloom.mightContain("key%d" % i)
+
+        falsePositives = len([i for i in range(10000)
+                              if bloom.mightContain("other%d" % i)])
+        assert falsePositives < 300
+
+        path = os.path.join(self._dir, "test.bloom")
+        bloom.save(path)
+        loaded = dedupIndex.BloomFilter.load(path)
+        assert loaded.getCount() == 1000
+        assert loaded.mightContain("key999")
+        assert loaded.mightContain("other0") == bloom.mightContain("other0")
+
+
+    def testCreateOrUpdate(self):
+        """ Test that re-sent postings are skipped or updated
+        """
+        postings = syntheticData.makePostings(100)
+        index    = dedupIndex.DedupIndex(self._path, expectedItems=1000)
+        results  = list(index.createOrUpdate(self._api, postings,
+                                             chunkSize=30))
+        assert [action for action,postKey in results] \
+                    == [dedupIndex.NEW] * 100
+        assert results[99][1] == "P0000099"
+        index.close()
+
+        numRequests = self._server.getNumRequests()
+        postings    = syntheticData.makePostings(100)
+        postings[5].heading  = "Changed"
+        postings[50].heading = "Changed"
+
+        index   = dedupIndex.DedupIndex(self._path)
+        results = list(index.createOrUpdate(self._api, postings,
+                                            chunkSize=30, maxWorkers=2))
+        assert results[5]  == (dedupIndex.CHANGED, "P0000005")
+        assert results[6]  == (dedupIndex.UNCHANGED, "P0000006")
+        assert results[50] == (dedupIndex.CHANGED, "P0000050")
+        assert postings[50].postKey == None # Caller's posting unchanged.
+        assert self._server.getNumRequests() == numRequests + 2
+        assert self._api.get("P0000050")['posting'].heading == "Changed"
+        assert self._api.get("P0000100")['success'] == False
+
+        stats = index.getStats()
+        assert stats['changed'] == 2
+        assert stats['unchanged'] == 98
+        index.close()
+
+        # The Bloom filter should be rebuilt if it is missing.
+
+        os.remove(self._path + ".bloom")
+        index = dedupIndex.DedupIndex(self._path)
+        assert index.classify(postings[50]) \
+                    == (dedupIndex.UNCHANGED, "P0000050",
+                        index.contentHash(postings[50]))
+        index.close()
+
+
+    def testDuplicatesInChunk(self):
+        """ Test that a posting repeated within a chunk is only created once
+        """
+        postings = syntheticData.makePostings(3) \
+                 + syntheticData.makePostings(1)
+        index    = dedupIndex.DedupIndex(self._path)
+        results  = list(index.createOrUpdate(self._api, postings))
+        index.close()
+        assert results == [(dedupIndex.UNCHANGED, "P0000002"),
+                           (dedupIndex.NEW,       "P0000000"),
+                           (dedupIndex.NEW,       "P0000001"),
+                           (dedupIndex.NEW,       "P0000002")]
+
+
+    def testShortResponse(self):
+        """ Test that postings missing from a createMany() response fail
+        """
+        class ShortClient(clients.PostingAPIClient):
+            def createMany(self, postings):
+                return [{'postKey' : "P%d" % i} for i in range(2)]
+
+        index   = dedupIndex.DedupIndex(self._path)
+        results = list(index.createOrUpdate(ShortClient(),
+                                            syntheticData.makePostings(3)))
+        assert results == [(dedupIndex.NEW, "P0"),
+                           (dedupIndex.NEW, "P1"),
+                           (dedupIndex.NEW, None)]
+        assert index.getStats()['failed'] == 1
+        index.close()
+
+#############################################################################
+
+def suite():
+    """ Create and return a test suite with all the tests we need to run.
+    """
+    loader = unittest.TestLoader()
+    return loader.loadTestsFromTestCase(DedupIndexTestCase)
@@ -0,0 +1,74 @@
+""" encodersTests.py
+
+    This Python module defines unit tests for the generated posting and query
+    encoders.
+"""
+from threetaps.api import clients
+from threetaps.api import models
+from threetaps.api.clients import encoders
+from threetaps.api.testing import syntheticData
+
+import datetime
+import unittest
+
+import simplejson as json
+
+#############################################################################
+
+class EncodersTestCase(unittest.TestCase):
+    """ This class implements the various unit tests for the encoders.
+    """
+    def testPostingEncoder(self):
+        """ Test that postings are encoded with the expected fields
+        """
+        timestamp = datetime.datetime(2011, 2, 3, 4, 5, 6)
+        posting   = models.Posting(source="CRAIG", heading="Bike", price=0,
+                                   images=[], annotations={'a' : "b"},
+                                   timestamp=timestamp)
+
+        assert encoders.encodePosting(posting) == \
+                    {'source'      : "CRAIG",
+                     'heading'     : "Bike",
+                     'price'       : 0,
+                     'annotations' : {'a' : "b"},
+                     'timestamp'   : "2011/02/03 04:05:06 UTC"}
+
+
+    def testEncodePostings(self):
+        """ Test that the JSON fast path matches encoding each posting
+        """
+        postings = syntheticData.makePostings(50)
+        expected = [encoders.encodePosting(posting) for posting in postings]
+
+        assert json.loads(encoders.encodePostings(postings)) == expected
+        assert json.loads(encoders.encodePostings(iter(postings))) == expected
+
+
+    def testQueryEncoder(self):
+        """ Test that search queries are encoded with the expected fields
+        """
+        query = clients.SearchQuery(source="CRAIG", text="red bike",
+                                    start=datetime.datetime(2011, 1, 1),
+                                    annotations={'color' : "red"})
+
+        assert encoders.encodeQuery(query) == \
+                    {'source'      : "CRAIG",
+                     'text'        : "red+bike",
+                     'start'       : "2011/01/01 00:00:00 UTC",
+                     'annotations' : '{"color": "red"}'}
+
+
+    def testFormatTimestamp(self):
+        """ Test that timestamps are formatted the same way as strftime()
+        """
+        timestamp = datetime.datetime(2011, 12, 31, 23, 59, 58, 999)
+        assert encoders.formatTimestamp(timestamp) == \
+                    timestamp.strftime("%Y/%m/%d %H:%M:%S UTC")
+
+#############################################################################
+
+def suite():
+    """ Create and return a test suite with all the tests we need to run.
+    """
+    loader = unittest.TestLoader()
+    return loader.loadTestsFromTestCase(EncodersTestCase)
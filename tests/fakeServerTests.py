@@ -0,0 +1,133 @@
+""" fakeServerTests.py
+
+    This Python module defines unit tests which run the API clients against
+    the fake 3taps server.
+"""
+from threetaps.api import clients
+from threetaps.api import models
+from threetaps.api import testing
+
+import datetime
+import unittest
+
+#############################################################################
+
+class FakeServerTestCase(unittest.TestCase):
+    """ This class runs each API client against an in-process fake server.
+    """
+    def setUp(self):
+        """ Prepare to run our unit tests.
+        """
+        self._server    = testing.FakeServer(numPostings=200)
+        self._transport = testing.FakeTransport(self._server)
+
+
+    def tearDown(self):
+        """ Clean up after our unit tests.
+        """
+        self._transport = None
+        self._server    = None
+
+
+    def testSearch(self):
+        """ Test the SearchAPIClient against the fake server
+        """
+        api   = clients.SearchAPIClient(transport=self._transport)
+        query = clients.SearchQuery(location="SFO+OR+LAX", source="CRAIG")
+
+        response = api.search(query, rpp=5, retvals=["location", "source"])
+        assert response['success'] == True
+        assert len(response['results']) == 5
+        for posting in response['results']:
+            assert posting.location in ["SFO", "LAX"]
+            assert posting.source == "CRAIG"
+
+        count = api.count(query)
+        assert count == response['numResults']
+        assert sum(api.summary(query, "location")['totals'].values()) == count
+        assert api.range(query, ["price"])['price'][0] != None
+        assert api.bestMatch(["apartment"])['category'] != None
+
+
+    def testPostings(self):
+        """ Test the PostingAPIClient against the fake server
+        """
+        api     = clients.PostingAPIClient(transport=self._transport)
+        posting = models.Posting(source="CRAIG", heading="Test Post",
+                                 timestamp=datetime.datetime.utcnow())
+
+        postKey = api.create(posting)['postKey']
+        assert api.update(models.Posting(postKey=postKey, body="Body"))
+        assert api.get(postKey)['posting'].body == "Body"
+        assert api.delete(postKey)
+        assert api.get(postKey)['success'] == False
+
+
+    def testReference(self):
+        """ Test the ReferenceAPIClient against the fake server
+        """
+        api = clients.ReferenceAPIClient(transport=self._transport)
+
+        categories = api.getCategories()
+        assert len(categories) > 0
+        assert len(categories[0].annotations) > 0
+        assert api.getCategory(categories[0].code).code == categories[0].code
+        assert len(api.getLocations()) > 0
+        assert len(api.getSources()) > 0
+
+
+    def testStatus(self):
+        """ Test the StatusAPIClient against the fake server
+        """
+        api = clients.StatusAPIClient(transport=self._transport)
+
+        event = {'status' : "found", 'externalID' : "1", 'source' : "CRAIG"}
+        assert api.update([event])['success'] == True
+
+        history = api.get([models.Posting(source="CRAIG", externalID="1")])
+        assert history[0]['exists'] == True
+        assert len(history[0]['history']['found']) == 1
+        assert api.system()['code'] == 200
+
+
+    def testGeocoder(self):
+        """ Test the GeocoderAPIClient against the fake server
+        """
+        api = clients.GeocoderAPIClient(transport=self._transport)
+
+        responses = api.geocode([clients.GeocodeRequest(city="Boston"),
+                                 clients.GeocodeRequest(text="Nowhere")])
+        assert responses[0].code == "BOS"
+        assert responses[1].code == None
+
+
+    def testHTTPServer(self):
+        """ Test the API clients against the fake server over HTTP
+        """
+        httpServer = testing.FakeHTTPServer(self._server)
+        httpServer.start()
+        try:
+            api = clients.SearchAPIClient(httpServer.url, httpServer.port)
+            assert api.count(clients.SearchQuery()) == 200
+
+            api = clients.PostingAPIClient(httpServer.url, httpServer.port)
+            response = api.create(models.Posting(source="CRAIG"))
+            assert "postKey" in response
+        finally:
+            httpServer.stop()
+
+
+    def testErrors(self):
+        """ Test that server errors are reported to the caller
+        """
+        self._server.errorRate = 1.0
+        api = clients.SearchAPIClient(transport=self._transport)
+        assert api.count(clients.SearchQuery()) == None
+
+#############################################################################
+
+def suite():
+    """ Create and return a test suite with all the tests we need to run.
+    """
+    loader = unittest.TestLoader()
+    return loader.loadTestsFromTestCase(FakeServerTestCase)
@@ -0,0 +1,103 @@
+""" geocodeBatcherTests.py
+
+    This Python module defines unit tests for the GeocodeBatcher class.
+"""
+from threetaps.api import clients
+from tests.geocodeCacheTests import CountingTransport
+
+import threading
+import unittest
+
+#############################################################################
+
+class GeocodeBatcherTestCase(unittest.TestCase):
+    """ This class implements the various unit tests for the GeocodeBatcher.
+    """
+    def setUp(self):
+        """ Prepare to run our unit tests.
+        """
+        self._transport = CountingTransport()
+        self._batcher   = clients.GeocodeBatcher(
+                            clients.GeocoderAPIClient(transport=self._transport),
+                            maxBatchSize=10, maxDelayMs=200)
+
+
+    def tearDown(self):
+        """ Clean up after our unit tests.
+        """
+        self._batcher.close()
+        self._batcher   = None
+        self._transport = None
+
+
+    def testConcurrentCallers(self):
+        """ Test that requests from several threads are sent as one batch
+        """
+        responses = {}
+
+        def geocode(city):
+            request = clients.GeocodeRequest(city=city)
+            responses[city] = self._batcher.geocode(request, timeout=5)
+
+        threads = []
+        for i in range(5):
+            thread = threading.Thread(target=geocode, args=("city%d" % i,))
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+
+        assert len(self._transport.batches) == 1
+        for city,response in responses.items():
+            assert response.code == city.upper()
+
+
+    def testMaxBatchSize(self):
+        """ Test that batches are limited to the maximum batch size
+        """
+        futures = []
+        for i in range(25):
+            request = clients.GeocodeRequest(city="city%d" % i)
+            futures.append(self._batcher.submit(request))
+
+        codes = [future.result(5).code for future in futures]
+
+        assert codes == ["CITY%d" % i for i in range(25)]
+        assert [len(batch) for batch in self._transport.batches] == [10, 10, 5]
+
+
+    def testSubmitDuringClose(self):
+        """ Test that every accepted request is answered when closing
+        """
+        futures = []
+        lock    = threading.Lock()
+
+        def submit():
+            while True:
+                try:
+                    future = self._batcher.submit(
+                                    clients.GeocodeRequest(city="Paris"))
+                except RuntimeError:
+                    return # Closed.
+                lock.acquire()
+                futures.append(future)
+                lock.release()
+
+        threads = [threading.Thread(target=submit) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        self._batcher.close()
+        for thread in threads:
+            thread.join()
+
+        assert len(futures) > 0
+        for future in futures:
+            assert future.done()
+
+#############################################################################
+
+def suite():
+    """ Create and return a test suite with all the tests we need to run.
+    """
+    loader = unittest.TestLoader()
+    return loader.loadTestsFromTestCase(GeocodeBatcherTestCase)
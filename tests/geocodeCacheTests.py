@@ -0,0 +1,139 @@
+""" geocodeCacheTests.py
+
+    This Python module defines unit tests for the GeocodeCache class.
+"""
+from threetaps.api import clients
+from threetaps.api.base import Transport
+from threetaps.api.clients.geocodeCache import normalizeRequest
+
+import cgi
+import os
+import tempfile
+import unittest
+
+import simplejson as json
+
+#############################################################################
+
+class CountingTransport(Transport):
+    """ A Transport which answers geocoding requests locally.
+
+        Rather than contacting the 3taps server, each request is geocoded to
+        the upper-cased version of its city name.  We keep a list of the
+        batches that would have been sent to the server.
+    """
+    def __init__(self):
+        self.batches = []
+
+
+    def send(self, request):
+        data = json.loads(cgi.parse_qs(request.body)['data'][0])
+        self.batches.append(data)
+        results = []
+        for posting in data:
+            results.append([posting['city'].upper(), 1.0, 2.0])
+        return {'status'       : 200,
+                'contents'     : json.dumps(results),
+                'content-type' : "application/json"}
+
+#############################################################################
+
+class GeocodeCacheTestCase(unittest.TestCase):
+    """ This class implements the various unit tests for the GeocodeCache.
+    """
+    def testNormalization(self):
+        """ Test that case and whitespace are ignored in cache keys
+        """
+        request1 = clients.GeocodeRequest(city="San  Francisco ",
+                                          state="CA")
+        request2 = clients.GeocodeRequest(city="san francisco",
+                                          state=" ca")
+        request3 = clients.GeocodeRequest(city="San Francisco")
+
+        assert normalizeRequest(request1) == normalizeRequest(request2)
+        assert normalizeRequest(request1) != normalizeRequest(request3)
+
+        # Non-string values are converted to strings.
+
+        assert normalizeRequest(clients.GeocodeRequest(postal=94107)) == \
+               normalizeRequest(clients.GeocodeRequest(postal=" 94107"))
+
+
+    def testLRU(self):
+        """ Test that the least recently used entry is discarded
+        """
+        cache = clients.GeocodeCache(maxEntries=2)
+        cache.put("a", "AAA", 1.0, 1.0)
+        cache.put("b", "BBB", 2.0, 2.0)
+        assert cache.get("a") == ("AAA", 1.0, 1.0)
+        cache.put("c", "CCC", 3.0, 3.0)
+
+        assert cache.get("b") == None
+        assert cache.get("a") != None
+        assert cache.get("c") != None
+        assert cache.getStats()['size'] == 2
+
+
+    def testDiskTier(self):
+        """ Test that results survive in the on-disk cache
+        """
+        handle,path = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            cache = clients.GeocodeCache(maxEntries=1, path=path)
+            cache.put("a", "AAA", 1.0, 1.0)
+            cache.put("b", "BBB", 2.0, 2.0)
+            assert cache.get("a") == ("AAA", 1.0, 1.0)
+            cache.close()
+
+            cache = clients.GeocodeCache(path=path)
+            assert cache.get("b") == ("BBB", 2.0, 2.0)
+            cache.putMany([("c", "CCC", 3.0, 3.0), ("d", "DDD", 4.0, 4.0)])
+            cache.close()
+
+            cache = clients.GeocodeCache(path=path)
+            assert cache.get("d") == ("DDD", 4.0, 4.0)
+            cache.close()
+        finally:
+            os.remove(path)
+
+
+    def testBatchDeduplication(self):
+        """ Test that identical requests in a batch are only sent once
+        """
+        transport = CountingTransport()
+        api       = clients.GeocoderAPIClient(transport=transport)
+        requests = [clients.GeocodeRequest(city="Boston"),
+                    clients.GeocodeRequest(city="Hong Kong"),
+                    clients.GeocodeRequest(city=" BOSTON")]
+
+        responses = api.geocode(requests)
+
+        assert len(transport.batches)    == 1
+        assert len(transport.batches[0]) == 2
+        assert [r.code for r in responses] == ["BOSTON", "HONG KONG", "BOSTON"]
+
+
+    def testCachedGeocode(self):
+        """ Test that cached requests are not sent to the server again
+        """
+        transport = CountingTransport()
+        api       = clients.GeocoderAPIClient(transport=transport)
+        api.enableCaching()
+
+        api.geocode([clients.GeocodeRequest(city="Boston")])
+        responses = api.geocode([clients.GeocodeRequest(city="boston"),
+                                 clients.GeocodeRequest(city="Paris")])
+
+        assert len(transport.batches) == 2
+        assert transport.batches[1]   == [{'city' : "Paris"}]
+        assert [r.code for r in responses] == ["BOSTON", "PARIS"]
+        assert api.getCache().getStats()['hits'] == 1
+
+#############################################################################
+
+def suite():
+    """ Create and return a test suite with all the tests we need to run.
+    """
+    loader = unittest.TestLoader()
+    return loader.loadTestsFromTestCase(GeocodeCacheTestCase)
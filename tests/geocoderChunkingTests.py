@@ -0,0 +1,137 @@
+""" geocoderChunkingTests.py
+
+    This Python module defines unit tests for the chunking of requests by the
+    GeocoderAPIClient class.
+"""
+from threetaps.api import clients
+from threetaps.api.base import Transport
+
+import cgi
+import threading
+import unittest
+
+import simplejson as json
+
+#############################################################################
+
+class FailingTransport(Transport):
+    """ A Transport which answers geocoding requests locally.
+
+        Each request is geocoded to the upper-cased version of its city name,
+        except that any batch which includes a city whose name starts with
+        "bad" is rejected with
+        an HTTP 400 error.  If 'down' is True, every request fails as if the
+        server couldn't be reached.
+    """
+    def __init__(self, down=False):
+        self.batchSizes = []
+        self._down      = down
+        self._lock      = threading.Lock()
+
+
+    def send(self, request):
+        data = json.loads(cgi.parse_qs(request.body)['data'][0])
+        self._lock.acquire()
+        self.batchSizes.append(len(data))
+        self._lock.release()
+
+        if self._down:
+            raise IOError("Connection refused")
+
+        results = []
+        for posting in data:
+            if posting['city'].startswith("bad"):
+                return {'status'       : 400,
+                        'contents'     : "Bad request",
+                        'content-type' : "text/plain"}
+            results.append([posting['city'].upper(), 1.0, 2.0])
+        return {'status'       : 200,
+                'contents'     : json.dumps(results),
+                'content-type' : "application/json"}
+
+#############################################################################
+
+class GeocoderChunkingTestCase(unittest.TestCase):
+    """ This class implements the unit tests for geocoder chunking.
+    """
+    def testChunkOrder(self):
+        """ Test that chunked results are returned in the original order
+        """
+        transport = FailingTransport()
+        api       = clients.GeocoderAPIClient(transport=transport)
+        api.enableChunking(chunkSize=3, maxWorkers=4)
+
+        cities    = ["city%d" % i for i in range(20)]
+        requests  = [clients.GeocodeRequest(city=city) for city in cities]
+        responses = api.geocode(requests)
+
+        assert sorted(transport.batchSizes) == [2] + [3] * 6
+        assert [r.code for r in responses] == [c.upper() for c in cities]
+        assert api.getChunkStats()['chunks'] == 7
+
+
+    def testFailureIsolation(self):
+        """ Test that a bad request only causes itself to fail
+        """
+        transport = FailingTransport()
+        api       = clients.GeocoderAPIClient(transport=transport)
+        api.enableChunking(chunkSize=4, maxWorkers=2)
+
+        cities = ["a", "b", "c", "bad", "e", "f", "g", "h"]
+        responses = api.geocode([clients.GeocodeRequest(city=city)
+                                 for city in cities])
+
+        assert [r.code for r in responses] == \
+                    ["A", "B", "C", None, "E", "F", "G", "H"]
+        assert api.getChunkStats()['failures'] == 3
+
+
+    def testServerDown(self):
+        """ Test that chunks aren't split when the server can't be reached
+        """
+        transport = FailingTransport(down=True)
+        api       = clients.GeocoderAPIClient(transport=transport)
+        api.enableChunking(chunkSize=10, maxWorkers=1)
+
+        responses = api.geocode([clients.GeocodeRequest(city="c%d" % i)
+                                 for i in range(50)])
+
+        assert transport.batchSizes == [10] * 5
+        assert [r.code for r in responses] == [None] * 50
+
+
+    def testFailureBudget(self):
+        """ Test that no more requests are sent once the budget is used up
+        """
+        transport = FailingTransport()
+        api       = clients.GeocoderAPIClient(transport=transport)
+        api.enableChunking(chunkSize=8, maxWorkers=1, maxFailedRequests=3)
+
+        cities = ["bad%d" % i for i in range(16)] + \
+                 ["city%d" % i for i in range(8)]
+        responses = api.geocode([clients.GeocodeRequest(city=city)
+                                 for city in cities])
+
+        assert transport.batchSizes == [8, 4, 2]
+        assert [r.code for r in responses] == [None] * 24
+
+
+    def testWithoutChunking(self):
+        """ Test that a failure without chunking fails every request
+        """
+        transport = FailingTransport()
+        api       = clients.GeocoderAPIClient(transport=transport)
+
+        responses = api.geocode([clients.GeocodeRequest(city="a"),
+                                 clients.GeocodeRequest(city="bad")])
+
+        assert transport.batchSizes == [2]
+        assert [r.code for r in responses] == [None, None]
+
+#############################################################################
+
+def suite():
+    """ Create and return a test suite with all the tests we need to run.
+    """
+    loader = unittest.TestLoader()
+    return loader.loadTestsFromTestCase(GeocoderChunkingTestCase)
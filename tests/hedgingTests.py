@@ -0,0 +1,148 @@
+""" hedgingTests.py
+
+    This Python module defines unit tests for the HedgingTransport.
+"""
+from threetaps.api import base
+from threetaps.api import clients
+from threetaps.api.base.hedging import HedgingTransport
+from threetaps.api.base.transport import Request, Transport
+
+import threading
+import time
+import unittest
+
+#############################################################################
+
+class StragglerTransport(Transport):
+    """ A Transport whose first request is much slower than the others.
+    """
+    def __init__(self, slowSeconds=0.5, error=None):
+        self.numRequests = 0
+        self.threads     = set() # Identities of the sending threads.
+        self._slow       = slowSeconds
+        self._error      = error
+        self._lock       = threading.Lock()
+
+
+    def send(self, request):
+        self._lock.acquire()
+        try:
+            self.numRequests = self.numRequests + 1
+            self.threads.add(threading.currentThread().ident)
+            first = self.numRequests == 1
+        finally:
+            self._lock.release()
+        if first:
+            time.sleep(self._slow)
+        request.bytesReceived   = 1000 if first else 10
+        request.timings['read'] = 1.0 if first else 0.01
+        if self._error != None:
+            raise self._error
+        return {'status'       : 200,
+                'contents'     : '{"count" : 3}',
+                'content-type' : "application/json"}
+
+#############################################################################
+
+class HedgingTestCase(unittest.TestCase):
+    """ This class implements the various unit tests for request hedging.
+    """
+    def testHedge(self):
+        """ Test that a slow request is answered by its duplicate
+        """
+        registry  = base.MetricsRegistry()
+        straggler = StragglerTransport()
+        api       = clients.SearchAPIClient(
+                        transport=HedgingTransport(straggler,
+                                                   initialDelayMs=20,
+                                                   registry=registry))
+
+        startTime = time.time()
+        assert api.count(clients.SearchQuery()) == 3
+        assert time.time() - startTime < 0.25
+        assert straggler.numRequests == 2
+
+        wins = registry.getMetric("threetaps_hedge_wins")
+        assert wins.getValues() == {("search/count",) : 1}
+
+
+    def testBudget(self):
+        """ Test that no duplicates are sent once the budget is spent
+        """
+        straggler = StragglerTransport(0.1)
+        api       = clients.SearchAPIClient(
+                        transport=HedgingTransport(straggler,
+                                                   initialDelayMs=20,
+                                                   maxExtraLoad=0,
+                                                   maxBurst=0,
+                                                   registry=
+                                                     base.MetricsRegistry()))
+
+        assert api.count(clients.SearchQuery()) == 3
+        assert straggler.numRequests == 1
+
+
+    def testUnexpectedError(self):
+        """ Test that an exception other than IOError reaches the caller
+        """
+        straggler = StragglerTransport(0, error=ValueError("bad"))
+        api       = clients.SearchAPIClient(
+                        transport=HedgingTransport(straggler,
+                                                   registry=
+                                                     base.MetricsRegistry()))
+
+        self.assertRaises(ValueError, api.count, clients.SearchQuery())
+
+
+    def testThreadReuse(self):
+        """ Test that requests reuse the same attempt thread
+        """
+        straggler = StragglerTransport(0)
+        api       = clients.SearchAPIClient(
+                        transport=HedgingTransport(straggler,
+                                                   registry=
+                                                     base.MetricsRegistry()))
+        for i in range(10):
+            api.count(clients.SearchQuery())
+            time.sleep(0.01) # Let the attempt thread become idle again.
+        assert straggler.numRequests == 10
+        assert len(straggler.threads) == 1
+
+
+    def testAdaptiveDelay(self):
+        """ Test that the hedging delay follows the observed latencies
+        """
+        hedging = HedgingTransport(StragglerTransport(0), minSamples=5,
+                                   initialDelayMs=500, minDelayMs=1,
+                                   registry=base.MetricsRegistry())
+        api     = clients.SearchAPIClient(transport=hedging)
+
+        assert hedging.getDelay("search/count") == 0.5
+        for i in range(5):
+            api.count(clients.SearchQuery())
+        assert hedging.getDelay("search/count") < 0.1
+
+
+    def testLoserDoesNotChangeRequest(self):
+        """ Test that the losing attempt leaves the caller's request alone
+        """
+        hedging = HedgingTransport(StragglerTransport(0.2),
+                                   initialDelayMs=20,
+                                   registry=base.MetricsRegistry())
+        request = Request("GET", "http://localhost/search/count",
+                          "search/count")
+        hedging.send(request)
+        assert request.bytesReceived == 10
+        assert request.timings['read'] == 0.01
+
+        time.sleep(0.3) # Let the original attempt finish.
+        assert request.bytesReceived == 10
+        assert request.timings['read'] == 0.01
+
+#############################################################################
+
+def suite():
+    """ Create and return a test suite with all the tests we need to run.
+    """
+    loader = unittest.TestLoader()
+    return loader.loadTestsFromTestCase(HedgingTestCase)
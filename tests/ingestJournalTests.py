@@ -0,0 +1,169 @@
+""" ingestJournalTests.py
+
+    This Python module defines unit tests for the IngestJournal class.
+"""
+from threetaps.api import clients
+from threetaps.api import testing
+from threetaps.api.testing import syntheticData
+from threetaps.tools import ingestJournal
+from threetaps.tools import postingImporter
+
+import os
+import shutil
+import tempfile
+import unittest
+import simplejson as json
+
+#############################################################################
+
+class IngestJournalTestCase(unittest.TestCase):
+    """ This class implements the unit tests for the IngestJournal class.
+    """
+    def setUp(self):
+        """ Prepare to run our unit tests.
+        """
+        self._dir    = tempfile.mkdtemp()
+        self._path   = os.path.join(self._dir, "postings.journal")
+        self._server = testing.FakeServer(numPostings=0)
+        self._api    = clients.PostingAPIClient(
+                            transport=testing.FakeTransport(self._server))
+
+
+    def tearDown(self):
+        """ Clean up after our unit tests.
+        """
+        shutil.rmtree(self._dir)
+        self._api    = None
+        self._server = None
+
+
+    def testRecovery(self):
+        """ Test reading back a journal with a torn final record
+        """
+        journal = ingestJournal.IngestJournal(self._path, syncEvery=2)
+        for i in range(3):
+            batchId = journal.logBatch(json.dumps([{'heading' : str(i)}]), 1)
+            if batchId != 1:
+                journal.logResults(batchId, [{'postKey' : str(i)}])
+        journal.close()
+        assert journal.getStats()['syncs'] == 3
+
+        size = os.path.getsize(self._path)
+        f = open(self._path, "ab")
+        f.write('{"batch":3,"first":3,"count":1,"postings":[{"hea')
+        f.close()
+
+        journal = ingestJournal.IngestJournal(self._path)
+        assert os.path.getsize(self._path) == size
+        assert journal.getNumPostings() == 3
+        assert journal.getPending() == [(1, [{'heading' : "1"}])]
+        assert journal.logBatch("[]", 0) == 3
+        journal.close()
+
+
+    def testCorruptRecord(self):
+        """ Test that the acknowledgements after a corrupt record are kept
+        """
+        journal = ingestJournal.IngestJournal(self._path)
+        for i in range(2):
+            batchId = journal.logBatch(json.dumps([{'heading' : str(i)}]), 1)
+            journal._write("garbage\n") # Simulate a corrupt record.
+            journal.logResults(batchId, [{'postKey' : str(i)}])
+        journal.close()
+        size = os.path.getsize(self._path)
+
+        journal = ingestJournal.IngestJournal(self._path)
+        assert journal.getPending() == []
+        assert journal.getNumPostings() == 2
+        assert journal.getStats()['corrupt'] == 2
+        journal.close()
+        assert os.path.getsize(self._path) == size
+
+
+    def testCorruptBatchBody(self):
+        """ Test that a batch record with a corrupt body is skipped
+        """
+        journal = ingestJournal.IngestJournal(self._path)
+        journal.logBatch(json.dumps([{'heading' : "0"}]), 1)
+        journal._write('{"batch":1,"first":1,"count":1,"postings":[{"he}\n')
+        journal._nextBatchId = 2
+        journal.logBatch(json.dumps([{'heading' : "2"}]), 1)
+        journal.close()
+
+        journal = ingestJournal.IngestJournal(self._path)
+        assert journal.getPending() == [(0, [{'heading' : "0"}]),
+                                        (2, [{'heading' : "2"}])]
+        assert journal.getStats()['corrupt'] == 1
+        journal.close()
+
+
+    def testResumeStream(self):
+        """ Test that an interrupted createStream() resends only what's needed
+        """
+        postings = syntheticData.makePostings(250)
+
+        journal   = ingestJournal.IngestJournal(self._path)
+        responses = []
+        for response in self._api.createStream(postings, chunkSize=100,
+                                               journal=journal):
+            responses.append(response)
+            self._server.errorRate = 1.0 # Fail every chunk after the first.
+        journal.close()
+        assert responses[99]  == {'postKey' : "P0000099"}
+        assert responses[100] == None
+
+        self._server.errorRate = 0.0
+        journal   = ingestJournal.IngestJournal(self._path)
+        assert journal.getNumPostings() == 250
+        assert len(journal.getPending()) == 2
+        responses = list(self._api.createStream(postings, chunkSize=100,
+                                                journal=journal))
+        journal.close()
+        assert len(responses) == 150
+        assert responses[-1] == {'postKey' : "P0000249"}
+        assert self._api.get("P0000100")['posting'].heading \
+                    == postings[100].heading
+
+        journal = ingestJournal.IngestJournal(self._path)
+        assert list(self._api.createStream(postings, journal=journal)) == []
+        journal.close()
+        assert self._api.get("P0000250")['success'] == False
+
+
+    def testResumeImport(self):
+        """ Test resuming an interrupted import
+        """
+        path = os.path.join(self._dir, "postings.jsonl")
+        f = open(path, "w")
+        for i in range(100):
+            f.write(json.dumps({'source' : "CRAIG", 'heading' : str(i)}) + "\n")
+        f.close()
+
+        def interrupt(stats):
+            if stats['created'] >= 25:
+                raise KeyboardInterrupt()
+
+        importer = postingImporter.PostingImporter(self._api, chunkSize=10,
+                                                   maxWorkers=1,
+                                                   numProcesses=0)
+        journal = ingestJournal.IngestJournal(self._path)
+        self.assertRaises(KeyboardInterrupt, importer.importFile, path,
+                          progress=interrupt, progressInterval=0,
+                          journal=journal)
+        journal.close()
+
+        journal = ingestJournal.IngestJournal(self._path)
+        stats   = importer.importFile(path, journal=journal)
+        journal.close()
+        assert stats['skipped'] == 30
+        assert stats['created'] == 70
+        assert self._api.get("P0000099")['posting'].heading == "99"
+        assert self._api.get("P0000100")['success'] == False
+
+#############################################################################
+
+def suite():
+    """ Create and return a test suite with all the tests we need to run.
+    """
+    loader = unittest.TestLoader()
+    return loader.loadTestsFromTestCase(IngestJournalTestCase)
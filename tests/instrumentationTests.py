@@ -0,0 +1,114 @@
+""" instrumentationTests.py
+
+    This Python module defines unit tests for the request hooks and latency
+    histograms.
+"""
+from threetaps.api import base
+from threetaps.api import clients
+from threetaps.api import testing
+from threetaps.api.base.instrumentation import LatencyHistogram
+
+import unittest
+
+#############################################################################
+
+class RecordingHook(base.RequestHook):
+    """ A RequestHook which remembers the requests it is told about.
+    """
+    def __init__(self):
+        self.started  = []
+        self.finished = []
+        self.failed   = []
+
+
+    def preRequest(self, info):
+        self.started.append(info)
+
+
+    def postResponse(self, info):
+        self.finished.append(info)
+
+
+    def onError(self, info):
+        self.failed.append(info)
+
+#############################################################################
+
+class InstrumentationTestCase(unittest.TestCase):
+    """ This class implements the various unit tests for the instrumentation.
+    """
+    def testHistogramPercentiles(self):
+        """ Test that histogram percentiles are within the expected error
+        """
+        histogram = LatencyHistogram()
+        for i in range(1, 1001):
+            histogram.record(i / 1000.0)
+
+        assert histogram.getCount() == 1000
+        for fraction in [0.5, 0.9, 0.99]:
+            value = histogram.getPercentile(fraction)
+            assert abs(value - fraction) <= fraction * 2.0 / 128
+        assert histogram.getMax() == 1.0
+        assert abs(histogram.getMean() - 0.5005) < 0.0001
+
+
+    def testEmptyHistogram(self):
+        """ Test that an empty histogram has no percentiles
+        """
+        histogram = LatencyHistogram()
+        assert histogram.getPercentile(0.5) == None
+        assert histogram.getMean() == None
+        assert histogram.getBuckets() == []
+
+
+    def testHooks(self):
+        """ Test that hooks are told about each request
+        """
+        transport = testing.FakeTransport(testing.FakeServer(numPostings=20))
+        api       = clients.SearchAPIClient(transport=transport)
+        hook      = RecordingHook()
+        api.addHook(hook)
+
+        api.count(clients.SearchQuery(source="CRAIG"))
+
+        assert len(hook.started)  == 1
+        assert len(hook.finished) == 1
+        info = hook.finished[0]
+        assert info.client   == "SearchAPIClient"
+        assert info.endpoint == "search/count"
+        assert info.status   == 200
+        assert info.bytesReceived > 0
+        assert "total" in info.timings and "decode" in info.timings
+
+        api.removeHook(hook)
+        api.count(clients.SearchQuery(source="CRAIG"))
+        assert len(hook.started) == 1
+
+
+    def testAggregator(self):
+        """ Test that the aggregator summarizes requests by endpoint
+        """
+        transport  = testing.FakeTransport(testing.FakeServer(numPostings=20))
+        api        = clients.PostingAPIClient(transport=transport)
+        aggregator = base.LatencyAggregator()
+        base.addGlobalHook(aggregator)
+        try:
+            for i in range(5):
+                api.get("posting%d" % i)
+        finally:
+            base.removeGlobalHook(aggregator)
+
+        summary = aggregator.getSummary()
+        assert summary.keys() == ["posting/get"]
+        assert summary['posting/get']['count']  == 5
+        assert summary['posting/get']['errors'] == 0
+        assert summary['posting/get']['p99Ms'] != None
+        assert aggregator.getHistogram("posting/get").getCount() == 5
+
+#############################################################################
+
+def suite():
+    """ Create and return a test suite with all the tests we need to run.
+    """
+    loader = unittest.TestLoader()
+    return loader.loadTestsFromTestCase(InstrumentationTestCase)
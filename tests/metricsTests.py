@@ -0,0 +1,149 @@
+""" metricsTests.py
+
+    This Python module defines unit tests for the client-side metrics.
+"""
+from threetaps.api import base
+from threetaps.api import clients
+from threetaps.api import testing
+from threetaps.api.base import metrics
+
+import os
+import tempfile
+import threading
+import unittest
+import urllib
+
+#############################################################################
+
+class MetricsTestCase(unittest.TestCase):
+    """ This class implements the various unit tests for the metrics.
+    """
+    def testShardedCounter(self):
+        """ Test that counter updates from several threads are all counted
+        """
+        registry = base.MetricsRegistry()
+        counter  = registry.counter("test_events", "Events.", ("kind",))
+
+        def work():
+            for i in range(1000):
+                counter.inc(("a",))
+            counter.inc(("b",), 5)
+
+        threads = [threading.Thread(target=work) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert counter.getValues() == {("a",) : 4000, ("b",) : 20}
+
+
+    def testShortLivedThreads(self):
+        """ Test that many short-lived threads don't add more shards
+        """
+        registry = base.MetricsRegistry()
+        gauge    = registry.gauge("test_level", "Level.")
+
+        for i in range(200):
+            thread = threading.Thread(target=gauge.inc)
+            thread.start()
+            thread.join()
+
+        assert gauge.getValues() == {() : 200}
+        assert len(gauge._values._stripes) == 16
+
+
+    def testRender(self):
+        """ Test the OpenMetrics text format
+        """
+        registry = base.MetricsRegistry()
+        registry.counter("test_events", "Events.", ("kind",)).inc(('x"y',), 2)
+        registry.gauge("test_level", "Level.").setFunction(lambda: 1.5)
+
+        text = registry.render()
+        assert text == '# TYPE test_events counter\n' \
+                     + '# HELP test_events Events.\n' \
+                     + 'test_events_total{kind="x\\"y"} 2\n' \
+                     + '# TYPE test_level gauge\n' \
+                     + '# HELP test_level Level.\n' \
+                     + 'test_level 1.5\n' \
+                     + '# EOF\n'
+
+        self.assertRaises(RuntimeError, registry.gauge, "test_events", "")
+
+
+    def testMetricsHook(self):
+        """ Test that the MetricsHook records each request
+        """
+        registry  = base.MetricsRegistry()
+        transport = testing.FakeTransport(testing.FakeServer(numPostings=20))
+        api       = clients.SearchAPIClient(transport=transport)
+        api.addHook(base.MetricsHook(registry))
+
+        for i in range(3):
+            api.count(clients.SearchQuery(source="CRAIG"))
+
+        labels = ("SearchAPIClient", "search/count")
+        assert registry.getMetric("threetaps_requests").getValues() \
+                    == {labels : 3}
+        assert registry.getMetric("threetaps_request_errors").getValues() \
+                    == {}
+        assert registry.getMetric("threetaps_requests_in_flight") \
+                       .getValues() == {("SearchAPIClient",) : 0}
+        assert registry.getMetric("threetaps_request_duration_seconds") \
+                       .getHistogram(labels).getCount() == 3
+
+        text = registry.render()
+        assert 'threetaps_request_duration_seconds_count{client=' \
+               + '"SearchAPIClient",endpoint="search/count"} 3' in text
+
+
+    def testTrackCache(self):
+        """ Test that cache statistics are exported
+        """
+        registry = base.MetricsRegistry()
+        cache    = clients.GeocodeCache()
+        metrics.trackCache("geocoder", cache, registry)
+        cache.put("a", "AAA", 1.0, 1.0)
+        cache.get("a")
+        cache.get("b")
+
+        text = registry.render()
+        assert 'threetaps_cache_hits_total{cache="geocoder"} 1' in text
+        assert 'threetaps_cache_misses_total{cache="geocoder"} 1' in text
+        assert 'threetaps_cache_size{cache="geocoder"} 1' in text
+
+
+    def testExporters(self):
+        """ Test serving the metrics over HTTP and writing them to a file
+        """
+        registry = base.MetricsRegistry()
+        registry.counter("test_events", "Events.").inc()
+
+        server = base.MetricsServer(registry)
+        server.start()
+        try:
+            f = urllib.urlopen("http://127.0.0.1:%d/metrics" % server.port)
+            assert f.read() == registry.render()
+            assert f.info().gettype() == "application/openmetrics-text"
+            f.close()
+        finally:
+            server.stop()
+
+        handle,path = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            metrics.writeMetrics(path, registry)
+            f = open(path)
+            assert f.read() == registry.render()
+            f.close()
+        finally:
+            os.remove(path)
+
+#############################################################################
+
+def suite():
+    """ Create and return a test suite with all the tests we need to run.
+    """
+    loader = unittest.TestLoader()
+    return loader.loadTestsFromTestCase(MetricsTestCase)
@@ -4,6 +4,7 @@
 """
 from threetaps.api import clients
 from threetaps.api import models
+from threetaps.api import testing
 
 import datetime
 import time
@@ -40,11 +41,16 @@ class PostingAPIClientTestCase(unittest.TestCase):
         """
         # Create a new posting.
 
+        # The same time is used when the test is replayed from a cassette.
+
+        now = testing.volatileValue("postingAPIClientTests.now", time.time)
+
         posting = models.Posting(location="SFO",
                                  source="CRAIG",
                                  heading="Test Post",
-                                 externalID = "TEST" + str(time.time()),
-                                 timestamp=datetime.datetime.utcnow())
+                                 externalID = "TEST" + str(now),
+                                 timestamp=datetime.datetime.utcfromtimestamp(
+                                                                        now))
 
         response = self._api.create(posting)
 
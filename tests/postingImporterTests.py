@@ -0,0 +1,145 @@
+""" postingImporterTests.py
+
+    This Python module defines unit tests for the PostingImporter class.
+"""
+from threetaps.api import clients
+from threetaps.api import testing
+from threetaps.tools import postingImporter
+
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+import simplejson as json
+
+#############################################################################
+
+class PostingImporterTestCase(unittest.TestCase):
+    """ This class implements the unit tests for the PostingImporter class.
+    """
+    def setUp(self):
+        """ Prepare to run our unit tests.
+        """
+        self._dir    = tempfile.mkdtemp()
+        self._server = testing.FakeServer(numPostings=0)
+        self._api    = clients.PostingAPIClient(
+                            transport=testing.FakeTransport(self._server))
+
+
+    def tearDown(self):
+        """ Clean up after our unit tests.
+        """
+        shutil.rmtree(self._dir)
+        self._api    = None
+        self._server = None
+
+
+    def testImportJSONL(self):
+        """ Test importing a JSONL file, using worker processes
+        """
+        lines = []
+        for i in range(500):
+            lines.append(json.dumps({'source'    : "CRAIG",
+                                     'heading'   : "Posting %d" % i,
+                                     'price'     : "%d.50" % i,
+                                     'timestamp' : "2011/01/02 03:04:05 UTC",
+                                     'unknown'   : "ignored"}))
+        lines[10]  = "{not json"
+        lines[20]  = json.dumps({'heading' : "No source"})
+        lines[30]  = json.dumps({'source' : "CRAIG", 'price' : "cheap"})
+        path = self._writeFile("postings.jsonl", lines)
+
+        # A single sending thread, so that the fake server allocates the
+        # posting keys in file order.
+        importer = postingImporter.PostingImporter(self._api, chunkSize=64,
+                                                   maxWorkers=1,
+                                                   numProcesses=2,
+                                                   blockSize=1024)
+        rejectPath = os.path.join(self._dir, "rejects.jsonl")
+        stats = importer.importFile(path, rejectPath=rejectPath)
+
+        assert stats['rows']     == 500
+        assert stats['created']  == 497
+        assert stats['rejected'] == 3
+
+        # Parsing errors are written before the server's responses arrive.
+        rejects = [json.loads(line) for line in open(rejectPath)]
+        rejects.sort(key=lambda reject: reject['line'])
+        assert [reject['line'] for reject in rejects] == [11, 21, 31]
+        assert rejects[0]['row'] == "{not json"
+        assert rejects[1]['error'] == "Missing source"
+
+        posting = self._api.get("P0000000")['posting']
+        assert posting.heading   == "Posting 0"
+        assert posting.price     == 0.5
+        assert posting.timestamp == "2011/01/02 03:04:05 UTC"
+
+
+    def testImportCSV(self):
+        """ Test importing a CSV file with a column mapping
+        """
+        path = self._writeFile("postings.csv",
+                               ['src,title,price,images',
+                                'CRAIG,"First, with comma",10,a.jpg|b.jpg',
+                                'CRAIG,Second,,',
+                                'CRAIG,Too many columns,1,,extra',
+                                'E_BAY,Third,3.5,"[""c.jpg""]"'])
+
+        importer = postingImporter.PostingImporter(self._api,
+                                     numProcesses=0,
+                                     columnMap={'src'   : "source",
+                                                'title' : "heading"})
+        rejectPath = os.path.join(self._dir, "rejects.jsonl")
+        stats = importer.importFile(path, rejectPath=rejectPath)
+
+        assert stats['rows']     == 4
+        assert stats['created']  == 3
+        assert stats['rejected'] == 1
+        rejects = [json.loads(line) for line in open(rejectPath)]
+        assert rejects[0]['line'] == 4
+
+        first = self._api.get("P0000000")['posting']
+        assert first.heading == "First, with comma"
+        assert first.images  == ["a.jpg", "b.jpg"]
+        assert self._api.get("P0000001")['posting'].price == None
+        assert self._api.get("P0000002")['posting'].images == ["c.jpg"]
+
+
+    def testParseRow(self):
+        """ Test the conversion of individual values
+        """
+        fields = postingImporter.parseRow({'latitude'    : "1.5",
+                                           'clickCount'  : "7",
+                                           'expiration'  : "0",
+                                           'annotations' : '{"a":"b"}',
+                                           'body'        : ""})
+        assert fields == {'latitude'    : 1.5,
+                          'clickCount'  : 7,
+                          'expiration'  : datetime.datetime(1970, 1, 1),
+                          'annotations' : {"a" : "b"}}
+        self.assertRaises(ValueError, postingImporter.parseRow,
+                          {'timestamp' : "yesterday"})
+        self.assertRaises(RuntimeError, postingImporter.PostingImporter,
+                          self._api, columnMap={'a' : "nonsense"})
+
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _writeFile(self, name, lines):
+        """ Write the given lines to a file in our temporary directory.
+        """
+        path = os.path.join(self._dir, name)
+        f = open(path, "w")
+        f.write("\n".join(lines) + "\n")
+        f.close()
+        return path
+
+#############################################################################
+
+def suite():
+    """ Create and return a test suite with all the tests we need to run.
+    """
+    loader = unittest.TestLoader()
+    return loader.loadTestsFromTestCase(PostingImporterTestCase)
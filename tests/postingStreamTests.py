@@ -0,0 +1,77 @@
+""" postingStreamTests.py
+
+    This Python module defines unit tests for the streaming PostingAPIClient
+    methods.
+"""
+from threetaps.api import clients
+from threetaps.api import models
+from threetaps.api import testing
+from threetaps.api.testing import syntheticData
+
+import unittest
+
+#############################################################################
+
+class PostingStreamTestCase(unittest.TestCase):
+    """ This class implements the unit tests for createStream(),
+        updateStream() and deleteStream().
+    """
+    def setUp(self):
+        """ Prepare to run our unit tests.
+        """
+        self._server = testing.FakeServer(numPostings=0)
+        self._api    = clients.PostingAPIClient(
+                            transport=testing.FakeTransport(self._server))
+
+
+    def tearDown(self):
+        """ Clean up after our unit tests.
+        """
+        self._api    = None
+        self._server = None
+
+
+    def testStreams(self):
+        """ Test creating, updating and deleting postings from generators
+        """
+        numRead = [0]
+
+        def generatePostings():
+            for posting in syntheticData.makePostings(250):
+                numRead[0] = numRead[0] + 1
+                yield posting
+
+        postKeys = []
+        for response in self._api.createStream(generatePostings(),
+                                               chunkSize=100):
+            # We should never read more than one chunk ahead.
+            assert numRead[0] - len(postKeys) <= 100
+            postKeys.append(response['postKey'])
+        assert len(postKeys) == 250
+
+        updates = (models.Posting(postKey=postKey, heading="Updated")
+                   for postKey in postKeys)
+        assert list(self._api.updateStream(updates, chunkSize=100,
+                                           maxWorkers=2)) == [True] * 250
+        assert self._api.get(postKeys[-1])['posting'].heading == "Updated"
+
+        assert list(self._api.deleteStream(iter(postKeys),
+                                           chunkSize=100)) == [True] * 250
+        assert self._api.get(postKeys[0])['success'] == False
+
+
+    def testFailedChunk(self):
+        """ Test that None is yielded for each posting in a failed chunk
+        """
+        self._server.errorRate = 1.0
+        responses = list(self._api.createStream(
+                                syntheticData.makePostings(5), chunkSize=2))
+        assert responses == [None] * 5
+
+#############################################################################
+
+def suite():
+    """ Create and return a test suite with all the tests we need to run.
+    """
+    loader = unittest.TestLoader()
+    return loader.loadTestsFromTestCase(PostingStreamTestCase)
@@ -0,0 +1,102 @@
+""" queryFilterTests.py
+
+    This Python module defines unit tests for the QueryFilter class.
+"""
+from threetaps.api import clients
+from threetaps.api import models
+from threetaps.api import testing
+from threetaps.api.testing import syntheticData
+
+import datetime
+import unittest
+
+#############################################################################
+
+class QueryFilterTestCase(unittest.TestCase):
+    """ This class implements the unit tests for the QueryFilter class.
+    """
+    def testMatchesServer(self):
+        """ Test that the local filter agrees with the (fake) server
+        """
+        server   = testing.FakeServer(numPostings=300)
+        api      = clients.SearchAPIClient(
+                        transport=testing.FakeTransport(server))
+        postings = [models.Posting(**posting) for posting
+                    in syntheticData.makePostingDicts(300)]
+        columns  = _toColumns(postings)
+
+        queries = [clients.SearchQuery(),
+                   clients.SearchQuery(source="CRAIG"),
+                   clients.SearchQuery(category="VAUT+OR+VMOT",
+                                       location="SFO"),
+                   clients.SearchQuery(heading="Car"),
+                   clients.SearchQuery(body="vintage", source="EBAYC"),
+                   clients.SearchQuery(text="parking"),
+                   clients.SearchQuery(externalID="1000042")]
+
+        for query in queries:
+            response = api.search(query, rpp=-1, retvals=["postKey"])
+            expected = sorted([posting.postKey
+                               for posting in response['results']])
+            assert len(expected) > 0
+
+            queryFilter = clients.QueryFilter(query)
+            matches = [posting.postKey
+                       for posting in queryFilter.filter(postings)]
+            assert sorted(matches) == expected
+            assert [postings[i].postKey for i
+                    in queryFilter.filterColumns(columns)] == matches
+
+
+    def testTimestampsAndAnnotations(self):
+        """ Test the start, end and annotation criteria
+        """
+        postings = syntheticData.makePostings(300) # Datetime timestamps.
+        postings[10].annotations = None
+        postings[11].timestamp   = None
+        query = clients.SearchQuery(start=datetime.datetime(2011, 1, 1, 1),
+                                    end=datetime.datetime(2011, 1, 1, 3),
+                                    annotations={'color' : "red",
+                                                 'size'  : "M"})
+        expected = [i for i in range(len(postings))
+                    if postings[i].timestamp != None
+                    and datetime.datetime(2011, 1, 1, 1)
+                            <= postings[i].timestamp
+                            <= datetime.datetime(2011, 1, 1, 3)
+                    and postings[i].annotations
+                    and postings[i].annotations.get("color") == "red"
+                    and postings[i].annotations.get("size") == "M"]
+        assert len(expected) > 0
+
+        queryFilter = clients.QueryFilter(query)
+        assert [i for i in range(len(postings))
+                if queryFilter.matches(postings[i])] == expected
+        assert queryFilter.filterColumns(_toColumns(postings)) == expected
+
+        # Missing columns are treated as None.
+
+        assert queryFilter.filterColumns({'heading' : ["a", "b"]}) == []
+        assert clients.QueryFilter(clients.SearchQuery()).filterColumns(
+                                        {'heading' : ["a", "b"]}) == [0, 1]
+        assert not clients.QueryFilter(clients.SearchQuery(
+                        trustedAnnotations={'a' : "b"})).matches(postings[0])
+
+#############################################################################
+
+def _toColumns(postings):
+    """ Convert a list of Posting objects into a columnar batch.
+    """
+    columns = {}
+    for field in ["source", "category", "location", "heading", "body",
+                  "externalID", "timestamp", "annotations",
+                  "trustedAnnotations"]:
+        columns[field] = [getattr(posting, field) for posting in postings]
+    return columns
+
+#############################################################################
+
+def suite():
+    """ Create and return a test suite with all the tests we need to run.
+    """
+    loader = unittest.TestLoader()
+    return loader.loadTestsFromTestCase(QueryFilterTestCase)
@@ -0,0 +1,112 @@
+""" rateLimiterTests.py
+
+    This Python module defines unit tests for the client-side rate limiter.
+"""
+from threetaps.api import base
+from threetaps.api import clients
+from threetaps.api.base import rateLimiter
+from threetaps.api.base.transport import Transport
+
+import threading
+import time
+import unittest
+
+#############################################################################
+
+class ConcurrencyTransport(Transport):
+    """ A Transport which records the most requests it saw at once.
+    """
+    def __init__(self, status=200):
+        self.status      = status
+        self.inFlight    = 0
+        self.maxInFlight = 0
+        self._lock       = threading.Lock()
+
+
+    def send(self, request):
+        self._lock.acquire()
+        self.inFlight    = self.inFlight + 1
+        self.maxInFlight = max(self.maxInFlight, self.inFlight)
+        self._lock.release()
+        time.sleep(0.01)
+        self._lock.acquire()
+        self.inFlight = self.inFlight - 1
+        self._lock.release()
+        return {'status'       : self.status,
+                'contents'     : '{"count" : 1}',
+                'content-type' : "application/json"}
+
+#############################################################################
+
+class RateLimiterTestCase(unittest.TestCase):
+    """ This class implements the various unit tests for the rate limiter.
+    """
+    def testTokenBucket(self):
+        """ Test that the token bucket limits the request rate
+        """
+        bucket    = rateLimiter.TokenBucket(rate=50, burst=1)
+        startTime = time.time()
+        for i in range(6):
+            bucket.acquire()
+        assert time.time() - startTime >= 0.09
+
+
+    def testAIMD(self):
+        """ Test that the limit grows slowly and shrinks quickly
+        """
+        limit = rateLimiter.AdaptiveLimit(initialLimit=4, maxLimit=16)
+        for i in range(20):
+            limit.acquire()
+            limit.release(0.01, True)
+        assert limit.getLimit() > 4
+
+        before = limit.getLimit()
+        limit.acquire()
+        limit.release(0.01, False)
+        assert limit.getLimit() == before // 2
+
+
+    def testConcurrencyLimit(self):
+        """ Test that clients sharing a limiter respect its limit
+        """
+        limiter   = rateLimiter.RateLimiter(registry=base.MetricsRegistry(),
+                                            initialLimit=2, maxLimit=2)
+        transport = ConcurrencyTransport()
+
+        def work():
+            api = clients.SearchAPIClient(
+                        transport=rateLimiter.RateLimitingTransport(
+                                                        transport, limiter))
+            for i in range(5):
+                api.count(clients.SearchQuery())
+
+        threads = [threading.Thread(target=work) for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert transport.maxInFlight == 2
+        assert limiter.getLimit("search").getInFlight() == 0
+
+
+    def testBackoffOnErrors(self):
+        """ Test that server errors reduce the limit for that family only
+        """
+        limiter = rateLimiter.RateLimiter(registry=base.MetricsRegistry(),
+                                          initialLimit=8)
+        failing = rateLimiter.RateLimitingTransport(
+                                ConcurrencyTransport(503), limiter)
+
+        clients.SearchAPIClient(transport=failing).count(clients.SearchQuery())
+
+        assert limiter.getLimit("search").getLimit() == 4
+        assert limiter.getLimit("posting").getLimit() == 8
+
+#############################################################################
+
+def suite():
+    """ Create and return a test suite with all the tests we need to run.
+    """
+    loader = unittest.TestLoader()
+    return loader.loadTestsFromTestCase(RateLimiterTestCase)
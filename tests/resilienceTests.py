@@ -0,0 +1,156 @@
+""" resilienceTests.py
+
+    This Python module defines unit tests for the ResilientTransport.
+"""
+from threetaps.api import base
+from threetaps.api import clients
+from threetaps.api.base import resilience
+from threetaps.api.base.transport import Transport
+
+import time
+import unittest
+
+#############################################################################
+
+class FlakyTransport(Transport):
+    """ A Transport which fails a given number of times before succeeding.
+
+        If 'status' is None, failures raise 'error', or an IOError if no
+        error is given; otherwise they return the given HTTP status code.
+    """
+    def __init__(self, numFailures, status=None, error=None):
+        self.numFailures = numFailures
+        self.status      = status
+        self.error       = error
+        self.numRequests = 0
+
+
+    def send(self, request):
+        self.numRequests = self.numRequests + 1
+        if self.numRequests <= self.numFailures:
+            if self.error != None:
+                raise self.error
+            if self.status == None:
+                raise IOError("Connection refused")
+            return {'status'       : self.status,
+                    'contents'     : "Server Error",
+                    'content-type' : "text/plain"}
+        return {'status'       : 200,
+                'contents'     : '{"count" : 7}',
+                'content-type' : "application/json"}
+
+#############################################################################
+
+class ResilienceTestCase(unittest.TestCase):
+    """ This class implements the various unit tests for the resilience layer.
+    """
+    def setUp(self):
+        """ Prepare to run our unit tests.
+        """
+        self._registry = base.MetricsRegistry()
+        self._policy   = resilience.RetryPolicy(maxAttempts=3, baseDelayMs=1)
+
+
+    def tearDown(self):
+        """ Clean up after our unit tests.
+        """
+        self._registry = None
+        self._policy   = None
+
+
+    def testRetry(self):
+        """ Test that idempotent requests are retried
+        """
+        for status in [None, 503]:
+            flaky = FlakyTransport(2, status)
+            api   = clients.SearchAPIClient(
+                        transport=resilience.ResilientTransport(
+                            flaky, self._policy, registry=self._registry))
+
+            assert api.count(clients.SearchQuery()) == 7
+            assert flaky.numRequests == 3
+
+        retries = self._registry.getMetric("threetaps_retries")
+        assert retries.getValues() == {("search/count",) : 4}
+
+
+    def testNoRetryForUnsafePost(self):
+        """ Test that non-idempotent requests are not retried
+        """
+        flaky = FlakyTransport(1)
+        api   = clients.PostingAPIClient(
+                    transport=resilience.ResilientTransport(
+                        flaky, self._policy, registry=self._registry))
+
+        assert api.delete("ABC123") == False
+        assert flaky.numRequests == 1
+
+
+    def testCircuitBreaker(self):
+        """ Test that the circuit breaker fails fast, then recovers
+        """
+        flaky     = FlakyTransport(4)
+        transport = resilience.ResilientTransport(
+                        flaky, resilience.RetryPolicy(maxAttempts=1),
+                        failureThreshold=2, resetTimeoutMs=50,
+                        registry=self._registry)
+        api   = clients.SearchAPIClient(transport=transport)
+        query = clients.SearchQuery()
+
+        assert api.count(query) == None
+        assert api.count(query) == None
+        assert transport.getBreaker("search/count").getState() \
+                    == resilience.STATE_OPEN
+        assert api.count(query) == None
+        assert flaky.numRequests == 2
+        assert "threetaps_circuit_open{endpoint=\"search/count\"} 1" \
+                    in self._registry.render()
+
+        time.sleep(0.06)
+        assert api.count(query) == None # The trial request fails.
+        assert flaky.numRequests == 3
+
+        time.sleep(0.06)
+        flaky.numFailures = 3
+        assert api.count(query) == 7
+        assert transport.getBreaker("search/count").getState() \
+                    == resilience.STATE_CLOSED
+
+        rejections = self._registry.getMetric("threetaps_circuit_rejections")
+        assert rejections.getValues() == {("search/count",) : 1}
+
+
+    def testUnexpectedTrialError(self):
+        """ Test that a trial request raising a non-IOError is recorded
+        """
+        flaky     = FlakyTransport(3)
+        transport = resilience.ResilientTransport(
+                        flaky, resilience.RetryPolicy(maxAttempts=1),
+                        failureThreshold=2, resetTimeoutMs=50,
+                        registry=self._registry)
+        api   = clients.SearchAPIClient(transport=transport)
+        query = clients.SearchQuery()
+
+        api.count(query)
+        api.count(query)
+        assert transport.getBreaker("search/count").getState() \
+                    == resilience.STATE_OPEN
+
+        time.sleep(0.06)
+        flaky.error = ValueError("bad")
+        self.assertRaises(ValueError, api.count, query)
+        assert transport.getBreaker("search/count").getState() \
+                    == resilience.STATE_OPEN
+
+        time.sleep(0.06)
+        assert api.count(query) == 7
+        assert transport.getBreaker("search/count").getState() \
+                    == resilience.STATE_CLOSED
+
+#############################################################################
+
+def suite():
+    """ Create and return a test suite with all the tests we need to run.
+    """
+    loader = unittest.TestLoader()
+    return loader.loadTestsFromTestCase(ResilienceTestCase)
@@ -0,0 +1,118 @@
+""" searchMirrorTests.py
+
+    This Python module defines unit tests for the SearchMirror class.
+"""
+from threetaps.api import clients
+from threetaps.api import testing
+from threetaps.api.testing import syntheticData
+from threetaps.tools import searchMirror
+
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+#############################################################################
+
+class SearchMirrorTestCase(unittest.TestCase):
+    """ This class implements the unit tests for the SearchMirror class.
+    """
+    def setUp(self):
+        """ Prepare to run our unit tests.
+        """
+        self._dir       = tempfile.mkdtemp()
+        self._server    = testing.FakeServer(numPostings=500)
+        self._transport = testing.FakeTransport(self._server)
+        self._search    = clients.SearchAPIClient(transport=self._transport)
+        self._mirror    = searchMirror.SearchMirror(
+                                os.path.join(self._dir, "mirror.db"),
+                                self._search, pageSize=20)
+
+
+    def tearDown(self):
+        """ Clean up after our unit tests.
+        """
+        self._mirror.close()
+        shutil.rmtree(self._dir)
+        self._mirror = None
+        self._server = None
+
+
+    def testSync(self):
+        """ Test the initial and incremental syncs of a slice
+        """
+        query = clients.SearchQuery(category="VAUT+OR+VMOT")
+        self._mirror.addSlice("vehicles", query)
+        assert self._mirror.getWatermark("vehicles") == None
+
+        numVehicles = self._search.count(query)
+        assert self._mirror.sync() == {'vehicles' : numVehicles}
+        assert self._mirror.count() == numVehicles
+        watermark = self._mirror.getWatermark("vehicles")
+        assert watermark.startswith("2011/01/01")
+
+        # Add some newer postings, and check that only they (and those within
+        # the overlap period) are fetched.
+
+        postingAPI = clients.PostingAPIClient(transport=self._transport)
+        postingAPI.createMany(syntheticData.makePostings(
+                                100, seed=1,
+                                startTime=datetime.datetime(2012, 1, 1)))
+
+        numRequests = self._server.getNumRequests()
+        numFetched  = self._mirror.sync()['vehicles']
+        numNew      = self._search.count(query) - numVehicles
+        assert numNew <= numFetched <= numNew + 5
+        assert self._server.getNumRequests() - numRequests <= numNew / 20 + 2
+        assert self._mirror.getWatermark("vehicles") > watermark
+
+        expected = self._search.search(query, rpp=-1,
+                                       retvals=["postKey"])['results']
+        postings = self._mirror.search(query)
+        assert [posting.postKey for posting in postings] \
+                    == [posting.postKey for posting in expected]
+
+
+    def testLocalSearch(self):
+        """ Test searching the mirrored postings
+        """
+        self._mirror.addSlice("all", clients.SearchQuery())
+        self._mirror.sync()
+        numRequests = self._server.getNumRequests()
+
+        all = self._mirror.search()
+        assert len(all) == 500
+
+        query = clients.SearchQuery(location="SFO+OR+LAX", text="car",
+                                    annotations={'color' : "red"},
+                                    start=datetime.datetime(2011, 1, 1, 2))
+        expected = [posting.postKey for posting in all
+                    if posting.location in ["SFO", "LAX"]
+                    and "car" in (posting.heading + " " +
+                                  posting.body).lower()
+                    and posting.annotations['color'] == "red"
+                    and posting.timestamp >= "2011/01/01 02:00:00 UTC"
+                    and posting.price <= 2500]
+        results = self._mirror.search(query, maxPrice=2500)
+        assert [posting.postKey for posting in results] == expected
+        assert self._mirror.count(query, maxPrice=2500) == len(expected)
+        assert len(self._mirror.search(query, limit=2)) == min(2,
+                                                              len(expected))
+
+        sources = self._mirror.search(clients.SearchQuery(source="CRAIG"),
+                                      limit=5)
+        assert len(sources) == 5
+        assert [posting.source for posting in sources] == ["CRAIG"] * 5
+        assert self._server.getNumRequests() == numRequests
+
+        self.assertRaises(RuntimeError, self._mirror.search,
+                          clients.SearchQuery(trustedAnnotations={'a' : "b"}))
+
+#############################################################################
+
+def suite():
+    """ Create and return a test suite with all the tests we need to run.
+    """
+    loader = unittest.TestLoader()
+    return loader.loadTestsFromTestCase(SearchMirrorTestCase)
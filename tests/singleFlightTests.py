@@ -0,0 +1,140 @@
+""" singleFlightTests.py
+
+    This Python module defines unit tests for the SingleFlightTransport.
+"""
+from threetaps.api import base
+from threetaps.api import clients
+from threetaps.api.base.singleFlight import SingleFlightTransport
+from threetaps.api.base.transport import Transport
+
+import threading
+import time
+import unittest
+
+#############################################################################
+
+class SlowCountingTransport(Transport):
+    """ A Transport which answers slowly, and counts the requests it sees.
+
+        If 'error' is not None, it is raised instead of returning a response.
+    """
+    def __init__(self, delay=0.1, error=None):
+        self.numRequests = 0
+        self._delay      = delay
+        self._error      = error
+        self._lock       = threading.Lock()
+
+
+    def send(self, request):
+        self._lock.acquire()
+        self.numRequests = self.numRequests + 1
+        self._lock.release()
+        time.sleep(self._delay)
+        if self._error != None:
+            raise self._error
+        return {'status'       : 200,
+                'contents'     : '{"count" : 9}',
+                'content-type' : "application/json"}
+
+#############################################################################
+
+class SingleFlightTestCase(unittest.TestCase):
+    """ This class implements the various unit tests for single-flight
+        request deduplication.
+    """
+    def testInFlightSharing(self):
+        """ Test that concurrent identical GETs share one request
+        """
+        registry  = base.MetricsRegistry()
+        slow      = SlowCountingTransport()
+        transport = SingleFlightTransport(slow, registry=registry)
+        results   = []
+
+        def work():
+            api = clients.SearchAPIClient(transport=transport)
+            results.append(api.count(clients.SearchQuery(source="CRAIG")))
+
+        threads = [threading.Thread(target=work) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert results == [9] * 8
+        assert slow.numRequests == 1
+        assert registry.getMetric("threetaps_deduplicated_requests") \
+                    .getValues() == {("search/count", "inflight") : 7}
+
+
+    def testUnexpectedError(self):
+        """ Test that a non-IOError exception is shared, and not left in flight
+        """
+        slow      = SlowCountingTransport(error=ValueError("bad"))
+        transport = SingleFlightTransport(slow,
+                                          registry=base.MetricsRegistry())
+        errors    = []
+
+        def work():
+            api = clients.SearchAPIClient(transport=transport)
+            try:
+                api.count(clients.SearchQuery(source="CRAIG"))
+            except ValueError,e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+            assert not thread.isAlive()
+
+        assert len(errors) == 4
+        assert slow.numRequests == 1
+
+        # The failed call must not be left behind for later requests.
+
+        work()
+        assert len(errors) == 5
+        assert slow.numRequests == 2
+
+
+    def testMemo(self):
+        """ Test that remembered responses expire
+        """
+        slow = SlowCountingTransport(0)
+        api  = clients.SearchAPIClient(
+                    transport=SingleFlightTransport(slow, memoTTLMs=50,
+                                                    registry=
+                                                      base.MetricsRegistry()))
+        query = clients.SearchQuery(source="CRAIG")
+
+        api.count(query)
+        api.count(query)
+        api.count(clients.SearchQuery(source="EBAYM"))
+        assert slow.numRequests == 2
+
+        time.sleep(0.06)
+        api.count(query)
+        assert slow.numRequests == 3
+
+
+    def testPostNotShared(self):
+        """ Test that POST requests are always sent
+        """
+        slow = SlowCountingTransport(0)
+        api  = clients.StatusAPIClient(
+                    transport=SingleFlightTransport(slow, memoTTLMs=1000,
+                                                    registry=
+                                                      base.MetricsRegistry()))
+
+        api.sendRequest("status/get", "POST", postings="[]")
+        api.sendRequest("status/get", "POST", postings="[]")
+        assert slow.numRequests == 2
+
+#############################################################################
+
+def suite():
+    """ Create and return a test suite with all the tests we need to run.
+    """
+    loader = unittest.TestLoader()
+    return loader.loadTestsFromTestCase(SingleFlightTestCase)
@@ -4,6 +4,7 @@
 """
 from threetaps.api import clients
 from threetaps.api import models
+from threetaps.api import testing
 
 import time
 import unittest
@@ -34,7 +35,8 @@ class StatusAPIClientTestCase(unittest.TestCase):
         # for.
 
         source     = "CRAIG"
-        externalID = "TEST" + str(time.time())
+        externalID = "TEST" + str(testing.volatileValue(
+                                        "statusAPIClientTests.now", time.time))
 
         # Send in a status update for our dummy posting.
 
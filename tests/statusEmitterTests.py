@@ -0,0 +1,186 @@
+""" statusEmitterTests.py
+
+    This Python module defines unit tests for the StatusEmitter class.
+"""
+from threetaps.api import clients
+
+import os
+import tempfile
+import threading
+import unittest
+
+#############################################################################
+
+class RecordingStatusClient(clients.StatusAPIClient):
+    """ A StatusAPIClient which records updates rather than sending them.
+
+        If 'available' is False, every update fails as if the server couldn't
+        be reached.  If 'rejected' is True, the server rejects every update.
+        If 'gate' is set, each update waits for the gate to be opened before
+        returning.
+    """
+    def __init__(self, available=True, rejected=False):
+        clients.StatusAPIClient.__init__(self)
+        self.available = available
+        self.rejected  = rejected
+        self.gate      = None
+        self.batches   = []
+
+
+    def update(self, events):
+        if self.gate != None:
+            self.gate.wait()
+        if not self.available:
+            return None
+        if self.rejected:
+            return {'success' : False}
+        self.batches.append(events)
+        return {'success' : True}
+
+#############################################################################
+
+class StatusEmitterTestCase(unittest.TestCase):
+    """ This class implements the various unit tests for the StatusEmitter.
+    """
+    def _event(self, i):
+        """ Return a status event for testing.
+        """
+        return {'status'     : "found",
+                'externalID' : "TEST%d" % i,
+                'source'     : "CRAIG"}
+
+
+    def testBatching(self):
+        """ Test that emitted events are combined into batches
+        """
+        api     = RecordingStatusClient()
+        emitter = clients.StatusEmitter(api, maxBatchSize=10,
+                                        maxDelayMs=100)
+        for i in range(25):
+            emitter.emit(self._event(i))
+        emitter.close()
+
+        sent = [event['externalID'] for batch in api.batches
+                                    for event in batch]
+        assert sent == ["TEST%d" % i for i in range(25)]
+        assert max([len(batch) for batch in api.batches]) == 10
+        assert "timestamp" in api.batches[0][0]
+        assert emitter.getStats()['sent'] == 25
+
+
+    def testDropPolicy(self):
+        """ Test that events are dropped when the queue is full
+        """
+        api      = RecordingStatusClient()
+        api.gate = threading.Event()
+        emitter  = clients.StatusEmitter(api, maxBatchSize=1, maxQueueSize=2,
+                                         overflow="drop")
+
+        results = [emitter.emit(self._event(i)) for i in range(10)]
+        api.gate.set()
+        emitter.close()
+
+        assert False in results
+        stats = emitter.getStats()
+        assert stats['dropped'] == results.count(False)
+        assert stats['sent'] + stats['dropped'] == 10
+
+
+    def testSpillAndReplay(self):
+        """ Test that failed batches are spilled to disk and replayed
+        """
+        handle,path = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            api     = RecordingStatusClient(available=False)
+            emitter = clients.StatusEmitter(api, maxDelayMs=10,
+                                            overflow="spill", spillPath=path)
+            for i in range(5):
+                emitter.emit(self._event(i))
+            emitter.flush()
+            assert emitter.getStats()['spilled'] == 5
+
+            api.available = True
+            assert emitter.replaySpill() == 5
+            emitter.close()
+
+            assert emitter.getStats()['sent'] == 5
+            assert os.path.getsize(path) == 0
+        finally:
+            os.remove(path)
+
+
+    def testRejectedNotSpilled(self):
+        """ Test that batches rejected by the server aren't spilled
+        """
+        handle,path = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            api     = RecordingStatusClient(rejected=True)
+            emitter = clients.StatusEmitter(api, maxDelayMs=10,
+                                            overflow="spill", spillPath=path)
+            for i in range(5):
+                emitter.emit(self._event(i))
+            emitter.close()
+
+            stats = emitter.getStats()
+            assert stats['spilled'] == 0
+            assert stats['failed'] == 5
+            assert os.path.getsize(path) == 0
+        finally:
+            os.remove(path)
+
+
+    def testMalformedEvent(self):
+        """ Test that a malformed event doesn't stop the background thread
+        """
+        api     = RecordingStatusClient()
+        emitter = clients.StatusEmitter(api, maxBatchSize=2, maxDelayMs=10,
+                                        maxQueueSize=1)
+        emitter.emit(self._event(0))
+        emitter.emit({'status' : "found", 'externalID' : 42,
+                      'source' : "CRAIG"})
+        for i in range(1, 4):
+            emitter.emit(self._event(i))
+        emitter.close()
+
+        stats = emitter.getStats()
+        assert stats['failed'] == 1
+        assert stats['sent'] == 4
+
+
+    def testEmitDuringClose(self):
+        """ Test that every accepted event is sent when closing
+        """
+        api     = RecordingStatusClient()
+        emitter = clients.StatusEmitter(api, maxDelayMs=10, maxQueueSize=5)
+
+        def emit():
+            i = 0
+            while True:
+                try:
+                    emitter.emit(self._event(i))
+                except RuntimeError:
+                    return # Closed.
+                i = i + 1
+
+        threads = [threading.Thread(target=emit) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        emitter.close()
+        for thread in threads:
+            thread.join(5)
+            assert not thread.isAlive()
+
+        stats = emitter.getStats()
+        assert stats['emitted'] > 0
+        assert stats['sent'] == stats['emitted']
+        assert stats['queued'] == 0
+
+#############################################################################
+
+def suite():
+    """ Create and return a test suite with all the tests we need to run.
+    """
+    loader = unittest.TestLoader()
+    return loader.loadTestsFromTestCase(StatusEmitterTestCase)
@@ -0,0 +1,104 @@
+""" statusGetManyTests.py
+
+    This Python module defines unit tests for the StatusAPIClient.getMany()
+    method.
+"""
+from threetaps.api import clients
+from threetaps.api import models
+from threetaps.api.base import Transport
+
+import cgi
+import unittest
+
+import simplejson as json
+
+#############################################################################
+
+class EchoTransport(Transport):
+    """ A Transport which answers status/get requests locally.
+
+        Each posting is given a single "found" event.  Any chunk containing
+        the external ID "bad" fails, and no history is returned for a posting
+        with the external ID "missing".
+    """
+    def __init__(self):
+        self.chunkSizes = []
+
+
+    def send(self, request):
+        postings = json.loads(cgi.parse_qs(request.body)['postings'][0])
+        self.chunkSizes.append(len(postings))
+
+        results = []
+        for posting in postings:
+            if posting['externalID'] == "bad":
+                raise IOError("Bad request")
+            if posting['externalID'] == "missing":
+                continue
+            event = {'timestamp' : "2011/01/02 03:04:05 UTC"}
+            results.append({'exists'     : True,
+                            'externalID' : posting['externalID'],
+                            'source'     : posting['source'],
+                            'history'    : {'found' : [event]}})
+        return {'status'       : 200,
+                'contents'     : json.dumps(results),
+                'content-type' : "application/json"}
+
+#############################################################################
+
+class StatusGetManyTestCase(unittest.TestCase):
+    """ This class implements the unit tests for StatusAPIClient.getMany().
+    """
+    def testGetMany(self):
+        """ Test that histories are streamed back in order
+        """
+        transport = EchoTransport()
+        api       = clients.StatusAPIClient(transport=transport)
+
+        def postings():
+            for i in range(95):
+                yield models.Posting(source="CRAIG", externalID=str(i))
+
+        histories = api.getMany(postings(), chunkSize=10, maxWorkers=3)
+        externalIDs = [history['externalID'] for history in histories]
+
+        assert externalIDs == [str(i) for i in range(95)]
+        assert sorted(transport.chunkSizes) == [5] + [10] * 9
+
+
+    def testFailedChunk(self):
+        """ Test that a failed chunk yields None for each of its postings
+        """
+        transport = EchoTransport()
+        api       = clients.StatusAPIClient(transport=transport)
+
+        postings = [models.Posting(source="CRAIG", externalID=externalID)
+                    for externalID in ["a", "b", "bad", "d", "e"]]
+
+        histories = list(api.getMany(postings, chunkSize=2, maxWorkers=2))
+
+        assert [h != None for h in histories] == \
+                    [True, True, False, False, True]
+        assert histories[0]['history']['found'][0]['timestamp'].year == 2011
+
+
+    def testShortChunk(self):
+        """ Test that a chunk with missing histories yields None for each
+        """
+        api = clients.StatusAPIClient(transport=EchoTransport())
+
+        postings = [models.Posting(source="CRAIG", externalID=externalID)
+                    for externalID in ["a", "missing", "c", "d"]]
+
+        histories = list(api.getMany(postings, chunkSize=2, maxWorkers=2))
+
+        assert histories[:2] == [None, None]
+        assert [h['externalID'] for h in histories[2:]] == ["c", "d"]
+
+#############################################################################
+
+def suite():
+    """ Create and return a test suite with all the tests we need to run.
+    """
+    loader = unittest.TestLoader()
+    return loader.loadTestsFromTestCase(StatusGetManyTestCase)
@@ -0,0 +1,82 @@
+""" systemStatusMonitorTests.py
+
+    This Python module defines unit tests for the SystemStatusMonitor class.
+"""
+from threetaps.api import clients
+
+import time
+import unittest
+
+#############################################################################
+
+class ScriptedStatusClient(clients.StatusAPIClient):
+    """ A StatusAPIClient which returns a scripted series of system statuses.
+
+        Once the script runs out, the last status is returned repeatedly.
+    """
+    def __init__(self, statuses):
+        clients.StatusAPIClient.__init__(self)
+        self.statuses = list(statuses)
+        self.numCalls = 0
+
+
+    def system(self):
+        self.numCalls = self.numCalls + 1
+        if len(self.statuses) > 1:
+            return self.statuses.pop(0)
+        return self.statuses[0]
+
+#############################################################################
+
+class SystemStatusMonitorTestCase(unittest.TestCase):
+    """ This class implements the unit tests for the SystemStatusMonitor.
+    """
+    def testCachedStatus(self):
+        """ Test that getStatus() doesn't contact the server
+        """
+        api     = ScriptedStatusClient([{'code' : 200, 'message' : "OK"}])
+        monitor = clients.SystemStatusMonitor(api, interval=60)
+        monitor.start()
+        try:
+            for i in range(10):
+                assert monitor.getStatus()['code'] == 200
+                assert monitor.isHealthy()
+            assert api.numCalls == 1
+        finally:
+            monitor.stop()
+
+
+    def testSubscribers(self):
+        """ Test that subscribers are told when the status code changes
+        """
+        api = ScriptedStatusClient([{'code' : 200, 'message' : "OK"},
+                                    {'code' : 200, 'message' : "Still OK"},
+                                    None,
+                                    {'code' : 503, 'message' : "Down"},
+                                    {'code' : 200, 'message' : "OK"}])
+        changes = []
+        def callback(oldStatus, newStatus):
+            if newStatus == None:
+                changes.append(None)
+            else:
+                changes.append(newStatus['code'])
+
+        monitor = clients.SystemStatusMonitor(api, interval=0.01)
+        monitor.subscribe(callback)
+        monitor.start()
+        try:
+            while api.numCalls < 5:
+                time.sleep(0.01)
+            assert monitor.waitUntilHealthy(timeout=5)
+        finally:
+            monitor.stop()
+
+        assert changes == [200, None, 503, 200]
+
+#############################################################################
+
+def suite():
+    """ Create and return a test suite with all the tests we need to run.
+    """
+    loader = unittest.TestLoader()
+    return loader.loadTestsFromTestCase(SystemStatusMonitorTestCase)
@@ -0,0 +1,144 @@
+""" transportTests.py
+
+    This Python module defines unit tests for the HTTP transports.
+"""
+from threetaps.api import clients
+from threetaps.api import testing
+from threetaps.api.base import instrumentation
+from threetaps.api.base import transport
+
+import StringIO
+import unittest
+import zlib
+
+#############################################################################
+
+class TransportTestCase(unittest.TestCase):
+    """ This class implements the various unit tests for the transports.
+    """
+    def setUp(self):
+        """ Prepare to run our unit tests.
+        """
+        self._httpServer = testing.FakeHTTPServer(
+                                testing.FakeServer(numPostings=100))
+        self._httpServer.start()
+
+
+    def tearDown(self):
+        """ Clean up after our unit tests.
+        """
+        self._httpServer.stop()
+        self._httpServer = None
+
+
+    def testCompressedResponse(self):
+        """ Test that compressed responses are decompressed
+        """
+        plain      = self._search(transport.HTTPTransport(
+                                            acceptCompression=False))
+        compressed = self._search(transport.HTTPTransport())
+
+        assert plain[0] == compressed[0]
+        assert compressed[1] < plain[1] / 2
+
+
+    def testHookWireBytes(self):
+        """ Test that hooks see the compressed size of a response
+        """
+        infos = []
+
+        class SizeHook(instrumentation.RequestHook):
+            def postResponse(self, info):
+                infos.append(info)
+
+        api = clients.SearchAPIClient(url=self._httpServer.url,
+                                      port=self._httpServer.port,
+                                      transport=transport.HTTPTransport())
+        api.addHook(SizeHook())
+        response = api.sendRequest("search", rpp=-1)
+
+        assert infos[0].bytesReceived < len(response['contents']) / 2
+
+
+    def testCompressedRequest(self):
+        """ Test that large request bodies are compressed
+        """
+        requests = []
+
+        class RecordingTransport(transport.HTTPTransport):
+            def send(self, request):
+                response = transport.HTTPTransport.send(self, request)
+                requests.append(request)
+                return response
+
+        api = clients.GeocoderAPIClient(url=self._httpServer.url,
+                                        port=self._httpServer.port,
+                                        transport=RecordingTransport(
+                                                compressThreshold=100))
+        geocodeRequests = [clients.GeocodeRequest(city="Boston %d" % i)
+                           for i in range(20)]
+
+        responses = api.geocode(geocodeRequests)
+
+        assert len(responses) == 20
+        assert requests[0].bytesSent < len(requests[0].body)
+
+
+    def testLargeResponse(self):
+        """ Test that large responses are received into a reusable buffer
+        """
+        httpTransport = transport.HTTPTransport(acceptCompression=False)
+        api = clients.SearchAPIClient(url=self._httpServer.url,
+                                      port=self._httpServer.port,
+                                      transport=httpTransport)
+
+        for i in range(2):
+            response = api.search(clients.SearchQuery(), rpp=-1,
+                                  retvals=["heading", "body"])
+            assert len(response['results']) == 100
+        assert len(httpTransport._buffers.buffer) > 10000
+
+
+    def testRawDeflate(self):
+        """ Test that raw deflate data without a zlib header is accepted
+        """
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+        data       = compressor.compress("hello " * 100) + compressor.flush()
+
+        contents,numBytes = transport._readCompressed(StringIO.StringIO(data),
+                                                      "deflate", 16)
+        assert contents == "hello " * 100
+        assert numBytes == len(data)
+
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _search(self, httpTransport):
+        """ Search the fake server using the given transport.
+
+            We return a (results, bytesReceived) tuple.
+        """
+        sizes = []
+
+        class SizeTransport(transport.Transport):
+            def send(self, request):
+                response = httpTransport.send(request)
+                sizes.append(request.bytesReceived)
+                return response
+
+        api = clients.SearchAPIClient(url=self._httpServer.url,
+                                      port=self._httpServer.port,
+                                      transport=SizeTransport())
+        response = api.search(clients.SearchQuery(), rpp=-1,
+                              retvals=["heading", "body"])
+        return ([posting.heading for posting in response['results']],
+                sizes[0])
+
+#############################################################################
+
+def suite():
+    """ Create and return a test suite with all the tests we need to run.
+    """
+    loader = unittest.TestLoader()
+    return loader.loadTestsFromTestCase(TransportTestCase)
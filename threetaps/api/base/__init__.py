@@ -3,3 +3,17 @@
     threetaps.api.base package initialization file.
 """
 from threetaps.api.base.apiClient import APIClient
+from threetaps.api.base.transport import Transport
+from threetaps.api.base.instrumentation import RequestHook
+from threetaps.api.base.instrumentation import LatencyAggregator
+from threetaps.api.base.instrumentation import addGlobalHook
+from threetaps.api.base.instrumentation import removeGlobalHook
+from threetaps.api.base.metrics import MetricsHook
+from threetaps.api.base.metrics import MetricsRegistry
+from threetaps.api.base.metrics import MetricsServer
+from threetaps.api.base.resilience import ResilientTransport
+from threetaps.api.base.resilience import RetryPolicy
+from threetaps.api.base.hedging import HedgingTransport
+from threetaps.api.base.rateLimiter import RateLimiter
+from threetaps.api.base.rateLimiter import RateLimitingTransport
+from threetaps.api.base.singleFlight import SingleFlightTransport
@@ -3,9 +3,14 @@
     This Python module implements the APIClient class.
 """
 from threetaps.api.base import constants
+from threetaps.api.base.instrumentation import RequestInfo, endpointName
+from threetaps.api.base.instrumentation import getGlobalHooks
+from threetaps.api.base.transport import Request, getDefaultTransport
 
 import logging
+import time
 import urllib
+import simplejson as json
 
 #############################################################################
 
@@ -15,17 +20,59 @@ class APIClient:
         All of our API client objects are derived from this base class.
     """
     def __init__(self, url=constants.DEFAULT_API_URL,
-                       port=constants.DEFAULT_API_PORT):
+                       port=constants.DEFAULT_API_PORT,
+                       transport=None):
         """ Standard initializer.
 
             The API client will use the given URL and HTTP port to access the
-            3taps APIs.
+            3taps APIs.  If a 'transport' is supplied, it is the Transport
+            object to use to send HTTP requests; otherwise, the process-wide
+            default transport will be used.
         """
         self._url         = url
         self._port        = port
+        self._transport   = transport
+        self._hooks       = []
         self._logRequests = False
 
 
+    def setTransport(self, transport):
+        """ Set the Transport object to use to send HTTP requests.
+
+            If 'transport' is None, the process-wide default transport will be
+            used.
+        """
+        self._transport = transport
+
+
+    def getTransport(self):
+        """ Return the Transport object used to send HTTP requests.
+        """
+        if self._transport != None:
+            return self._transport
+        return getDefaultTransport()
+
+
+    def addHook(self, hook):
+        """ Register a RequestHook to be called for each request we make.
+
+            The hook's methods will be called before each HTTP request is
+            sent, and after the response has been received (or the request
+            has failed).  Use addGlobalHook() in the
+            threetaps.api.base.instrumentation module to register a hook for
+            every API client in the process.
+        """
+        if hook not in self._hooks:
+            self._hooks.append(hook)
+
+
+    def removeHook(self, hook):
+        """ Remove a RequestHook previously registered using addHook().
+        """
+        if hook in self._hooks:
+            self._hooks.remove(hook)
+
+
     def enableLogging(self):
         """ Turn on logging of HTTP requests.
 
@@ -80,6 +127,36 @@ class APIClient:
 
             If a connection cannot be made to the server, we return None.
         """
+        response,results = self._sendRequest(endpoint, type, params, False)
+        return response
+
+
+    def sendJSONRequest(self, endpoint, type="GET", **params):
+        """ Send an HTTP request to the 3taps API, and decode the response.
+
+            The parameters are the same as for sendRequest().  Upon
+            completion, we return the JSON-format data returned by the server,
+            decoded into Python objects.  If a connection cannot be made to
+            the server, or the server returns an HTTP status code other than
+            200, we return None.
+        """
+        response,results = self._sendRequest(endpoint, type, params, True)
+        return results
+
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _sendRequest(self, endpoint, type, params, decode):
+        """ Send an HTTP request to the 3taps API.
+
+            This implements sendRequest() and sendJSONRequest().  If 'decode'
+            is True, a successful response is decoded from JSON format.
+
+            We return a (response, results) tuple, where 'response' is the
+            dictionary returned by sendRequest() and 'results' is the decoded
+            response, or None.
+        """
         url = self._url + ":" + str(self._port) + "/" + endpoint
 
         postData = None # initially.
@@ -99,24 +176,56 @@ class APIClient:
             else:
                 logging.info("HTTP %s %s" % (type, url))
 
+        request = Request(type, url, endpoint.split("?")[0], postData)
+
+        hooks = self._hooks + getGlobalHooks()
+        if len(hooks) > 0:
+            info = RequestInfo(self.__class__.__name__,
+                               endpointName(endpoint), type,
+                               len(url) + len(postData or ""))
+            info.timings = request.timings
+            for hook in hooks:
+                hook.preRequest(info)
+            startTime = time.time()
+        else:
+            info = None
+
         try:
-            connection = urllib.urlopen(url, postData)
+            response = self.getTransport().send(request)
         except IOError,e:
             if self._logRequests:
                 logging.error(repr(e))
-            return None
-
-        status      = connection.code
-        contents    = connection.read()
-        contentType = connection.info().gettype()
-
-        connection.close()
+            if info != None:
+                info.error = e
+                info.timings['total'] = time.time() - startTime
+                for hook in hooks:
+                    hook.onError(info)
+            return (None, None)
 
         if self._logRequests:
             logging.info(" -> status=%d, content-type=%s, contents=%d bytes" %
-                         (status, contentType, len(contents)))
-
-        return {'status'       : status,
-                'contents'     : contents,
-                'content-type' : contentType}
-
+                         (response['status'], response['content-type'],
+                          len(response['contents'])))
+
+        results = None
+        if decode and response['status'] == 200:
+            decodeStartTime = time.time()
+            results = json.loads(response['contents'])
+            if info != None:
+                info.timings['decode'] = time.time() - decodeStartTime
+
+        if info != None:
+            info.status = response['status']
+            if request.bytesSent != None:
+                info.bytesSent = len(url) + request.bytesSent
+            if request.bytesReceived != None:
+                info.bytesReceived = request.bytesReceived
+            else:
+                info.bytesReceived = len(response['contents'])
+            if isinstance(results, dict):
+                info.execTimeMs = results.get("execTimeMs")
+            info.timings['total'] = time.time() - startTime
+            for hook in hooks:
+                hook.postResponse(info)
+
+        return (response, results)
@@ -0,0 +1,160 @@
+""" threetaps.api.base.chunking
+
+    This Python module implements various helpers used by the API clients to
+    split large requests into chunks that can be sent to the 3taps server
+    separately.
+"""
+from multiprocessing.pool import ThreadPool
+
+import collections
+import itertools
+import threading
+
+#############################################################################
+
+def chunked(items, chunkSize):
+    """ Split the given items into chunks of at most 'chunkSize' items each.
+
+        'items' can be a list or any other iterable.  We return an iterator
+        which yields a list of items for each chunk in turn.  Note that the
+        items are only read from 'items' as each chunk is requested.
+    """
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, chunkSize))
+        if len(chunk) == 0:
+            return
+        yield chunk
+
+#############################################################################
+
+def concurrentMap(function, items, maxWorkers):
+    """ Apply a function to each item, using several threads at once.
+
+        'function' is called once for each entry in 'items', using up to
+        'maxWorkers' threads.  We return an iterator which yields the results
+        in the same order as the items.
+
+        Items are only read from 'items' as threads become free, so at most
+        'maxWorkers' items (and their results) are held in memory at once,
+        no matter how many items there are.
+    """
+    if maxWorkers <= 1:
+        for item in items:
+            yield function(item)
+        return
+
+    pool = ThreadPool(maxWorkers)
+    try:
+        pending = collections.deque() # AsyncResult objects, in order.
+        for item in items:
+            pending.append(pool.apply_async(function, (item,)))
+            if len(pending) >= maxWorkers:
+                yield pending.popleft().get()
+        while len(pending) > 0:
+            yield pending.popleft().get()
+    finally:
+        pool.close()
+        pool.join()
+
+#############################################################################
+
+class ChunkStats:
+    """ Statistics about the chunks sent to the 3taps server.
+
+        A ChunkStats object is updated by the API clients each time a chunk
+        of a larger request is sent to the server.  It is safe to update a
+        ChunkStats object from several threads at once.
+    """
+    def __init__(self):
+        """ Standard initializer.
+        """
+        self._lock = threading.Lock()
+        self.reset()
+
+
+    def reset(self):
+        """ Clear our statistics.
+        """
+        self._lock.acquire()
+        try:
+            self._numChunks   = 0
+            self._numFailures = 0
+            self._numItems    = 0
+            self._totalTime   = 0.0
+            self._minTime     = None
+            self._maxTime     = None
+        finally:
+            self._lock.release()
+
+
+    def record(self, numItems, elapsed, success):
+        """ Record the sending of a single chunk.
+
+            'numItems' is the number of items in the chunk, 'elapsed' is the
+            time it took to send the chunk and receive the response, in
+            seconds, and 'success' is True if and only if the chunk was
+            processed successfully.
+        """
+        self._lock.acquire()
+        try:
+            self._numChunks = self._numChunks + 1
+            self._numItems  = self._numItems + numItems
+            self._totalTime = self._totalTime + elapsed
+            if not success:
+                self._numFailures = self._numFailures + 1
+            if self._minTime == None or elapsed < self._minTime:
+                self._minTime = elapsed
+            if self._maxTime == None or elapsed > self._maxTime:
+                self._maxTime = elapsed
+        finally:
+            self._lock.release()
+
+
+    def getStats(self):
+        """ Return a dictionary summarizing our statistics.
+
+            The returned dictionary will have the following entries:
+
+                'chunks'
+
+                    The number of chunks which have been sent, including
+                    retries.
+
+                'failures'
+
+                    The number of chunks which failed.
+
+                'items'
+
+                    The total number of items sent in all chunks.
+
+                'minMs'
+
+                    The fastest chunk latency, in milliseconds.
+
+                'maxMs'
+
+                    The slowest chunk latency, in milliseconds.
+
+                'meanMs'
+
+                    The average chunk latency, in milliseconds.
+
+            The latency values will be None if no chunks have been sent.
+        """
+        self._lock.acquire()
+        try:
+            stats = {'chunks'   : self._numChunks,
+                     'failures' : self._numFailures,
+                     'items'    : self._numItems,
+                     'minMs'    : None,
+                     'maxMs'    : None,
+                     'meanMs'   : None}
+            if self._numChunks > 0:
+                stats['minMs']  = self._minTime * 1000.0
+                stats['maxMs']  = self._maxTime * 1000.0
+                stats['meanMs'] = self._totalTime * 1000.0 / self._numChunks
+            return stats
+        finally:
+            self._lock.release()
@@ -0,0 +1,59 @@
+""" threetaps.api.base.future
+
+    This Python module implements the Future class, which is used to hand the
+    result of a background operation back to the thread which asked for it.
+"""
+import threading
+
+#############################################################################
+
+class Future:
+    """ A placeholder for the result of an operation running in the background.
+
+        The thread performing the operation calls setResult() or setError()
+        once the operation has finished; any thread can call result() to wait
+        for the outcome.
+    """
+    def __init__(self):
+        """ Standard initializer.
+        """
+        self._event  = threading.Event()
+        self._result = None
+        self._error  = None
+
+
+    def setResult(self, result):
+        """ Record the result of the operation, and wake up any waiters.
+        """
+        self._result = result
+        self._event.set()
+
+
+    def setError(self, error):
+        """ Record that the operation failed with the given exception.
+
+            The exception will be raised again by result().
+        """
+        self._error = error
+        self._event.set()
+
+
+    def done(self):
+        """ Return True if and only if the operation has finished.
+        """
+        return self._event.isSet()
+
+
+    def result(self, timeout=None):
+        """ Wait for the operation to finish, and return its result.
+
+            If 'timeout' is given, it is the maximum number of seconds to
+            wait.  If the operation hasn't finished by then, we raise a
+            RuntimeError.  If the operation failed, the exception passed to
+            setError() is raised.
+        """
+        if not self._event.wait(timeout):
+            raise RuntimeError("Timed out waiting for result")
+        if self._error != None:
+            raise self._error
+        return self._result
@@ -0,0 +1,299 @@
+""" threetaps.api.base.hedging
+
+    This Python module implements a Transport which reduces tail latency by
+    "hedging" slow requests: if the response to an idempotent request hasn't
+    arrived within the usual time, a duplicate request is sent, and whichever
+    response arrives first is used.
+
+    To hedge the requests made by a single API client, wrap its transport:
+
+        api = threetaps.api.clients.SearchAPIClient()
+        api.setTransport(HedgingTransport(api.getTransport()))
+"""
+from threetaps.api.base.instrumentation import LatencyHistogram, endpointName
+from threetaps.api.base.metrics import getDefaultRegistry
+from threetaps.api.base.transport import Request, Transport
+from threetaps.api.base.transport import getDefaultTransport
+
+import Queue
+import threading
+import time
+
+#############################################################################
+
+class HedgingTransport(Transport):
+    """ A Transport which sends a duplicate of any slow idempotent request.
+
+        Only GET requests are hedged.  For each endpoint, we keep a
+        LatencyHistogram of the time taken by the original requests; once a
+        request has taken longer than the given 'percentile' of this
+        histogram, a duplicate request is sent.  Until 'minSamples' requests
+        have been made to an endpoint, 'initialDelayMs' is used instead.  The
+        hedging delay is never less than 'minDelayMs'.
+
+        To limit the extra load placed on the server, each request earns
+        'maxExtraLoad' hedging credits, and each duplicate request costs one
+        credit.  For example, a 'maxExtraLoad' of 0.05 means that at most one
+        request in twenty (plus a small initial burst) is duplicated.
+
+        We record the following metrics, labelled by endpoint, in the given
+        MetricsRegistry:
+
+            threetaps_hedged_requests_total
+
+                The number of duplicate requests sent.
+
+            threetaps_hedge_wins_total
+
+                The number of times the duplicate request's response arrived
+                first.
+    """
+    def __init__(self, transport=None, percentile=0.95, minSamples=20,
+                 initialDelayMs=100, minDelayMs=5, maxExtraLoad=0.05,
+                 maxBurst=10, maxIdleThreads=16, registry=None):
+        """ Standard initializer.
+
+            'transport' is the Transport to send requests through; if this is
+            None, the current process-wide default transport is used.
+            'maxBurst' is the largest number of unused hedging credits that
+            can be saved up.  At most 'maxIdleThreads' attempt threads are
+            kept waiting for more requests.  If 'registry' is None, the
+            process-wide MetricsRegistry is used.
+        """
+        if transport == None:
+            transport = getDefaultTransport()
+        if registry == None:
+            registry = getDefaultRegistry()
+
+        self._transport    = transport
+        self._percentile   = percentile
+        self._minSamples   = minSamples
+        self._initialDelay = initialDelayMs / 1000.0
+        self._minDelay     = minDelayMs / 1000.0
+        self._maxExtraLoad = maxExtraLoad
+        self._maxBurst     = maxBurst
+        self._credits      = float(maxBurst)
+        self._histograms   = {} # Maps endpoint name to LatencyHistogram.
+        self._maxIdle      = maxIdleThreads
+        self._idleThreads  = [] # _AttemptThread objects waiting for work.
+        self._lock         = threading.Lock()
+
+        self._hedges = registry.counter("threetaps_hedged_requests",
+                                        "Number of duplicate requests sent " +
+                                        "to reduce tail latency.",
+                                        ("endpoint",))
+        self._wins   = registry.counter("threetaps_hedge_wins",
+                                        "Number of duplicate requests " +
+                                        "which answered first.",
+                                        ("endpoint",))
+
+
+    def send(self, request):
+        """ Send the given Request object, hedging it if it is slow.
+        """
+        if request.method != "GET":
+            return self._transport.send(request)
+
+        endpoint  = endpointName(request.endpoint)
+        histogram = self._getHistogram(endpoint)
+        delay     = self.getDelay(endpoint)
+        self._earnCredit()
+
+        # If we couldn't send a duplicate anyway, there is no point in
+        # sending the request from another thread.
+
+        if not self._hasCredit():
+            startTime = time.time()
+            response  = self._transport.send(request)
+            histogram.record(time.time() - startTime)
+            return response
+
+        # Both attempts are sent as copies of the request, so that the losing
+        # attempt can't change the caller's request once we have returned.
+
+        results  = Queue.Queue()
+        original = _copyRequest(request)
+        self._startAttempt(original, results, histogram)
+        pending  = 1
+
+        try:
+            outcome = results.get(timeout=delay)
+        except Queue.Empty:
+            if self._spendCredit():
+                self._hedges.inc((endpoint,))
+                self._startAttempt(_copyRequest(request), results, None)
+                pending = pending + 1
+            outcome = results.get()
+        pending = pending - 1
+
+        # If the first attempt to finish failed, wait for the other one.
+
+        while outcome[2] != None and pending > 0:
+            outcome = results.get()
+            pending = pending - 1
+
+        attempt,response,error = outcome
+        if attempt is not original:
+            self._wins.inc((endpoint,))
+        request.timings.update(attempt.timings)
+        request.bytesSent     = attempt.bytesSent
+        request.bytesReceived = attempt.bytesReceived
+
+        if error != None:
+            raise error
+        return response
+
+
+    def getDelay(self, endpoint):
+        """ Return the number of seconds to wait before hedging a request.
+        """
+        histogram = self._getHistogram(endpoint)
+        if histogram.getCount() < self._minSamples:
+            return max(self._minDelay, self._initialDelay)
+        return max(self._minDelay, histogram.getPercentile(self._percentile))
+
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _startAttempt(self, request, results, histogram):
+        """ Start sending the given Request object in a background thread.
+
+            Once the request finishes, a (request, response, error) tuple is
+            added to the 'results' queue, whether the request succeeded or
+            raised an exception.  If 'histogram' is not None, the time taken
+            by the request is recorded in it.
+
+            Attempt threads are reused, so that we don't start a new thread
+            for every request, and so that each thread's receive buffer is
+            kept from one request to the next.
+        """
+        def attempt():
+            startTime = time.time()
+            try:
+                outcome = (request, self._transport.send(request), None)
+            except Exception,e:
+                outcome = (request, None, e)
+            if histogram != None:
+                histogram.record(time.time() - startTime)
+            results.put(outcome)
+
+        self._lock.acquire()
+        try:
+            if len(self._idleThreads) > 0:
+                thread = self._idleThreads.pop()
+            else:
+                thread = None
+        finally:
+            self._lock.release()
+
+        if thread == None:
+            thread = _AttemptThread(self)
+            thread.start()
+        thread.submit(attempt)
+
+
+    def _threadIdle(self, thread):
+        """ Respond to an attempt thread finishing its request.
+
+            We return True if the thread should wait for another request, or
+            False if it should exit because enough threads are already idle.
+        """
+        self._lock.acquire()
+        try:
+            if len(self._idleThreads) >= self._maxIdle:
+                return False
+            self._idleThreads.append(thread)
+            return True
+        finally:
+            self._lock.release()
+
+
+    def _getHistogram(self, endpoint):
+        """ Return the LatencyHistogram for the given endpoint.
+        """
+        histogram = self._histograms.get(endpoint)
+        if histogram == None:
+            self._lock.acquire()
+            try:
+                histogram = self._histograms.get(endpoint)
+                if histogram == None:
+                    histogram = LatencyHistogram()
+                    self._histograms[endpoint] = histogram
+            finally:
+                self._lock.release()
+        return histogram
+
+
+    def _earnCredit(self):
+        """ Add the hedging credit earned by a single request.
+        """
+        self._lock.acquire()
+        try:
+            self._credits = min(self._maxBurst,
+                                self._credits + self._maxExtraLoad)
+        finally:
+            self._lock.release()
+
+
+    def _hasCredit(self):
+        """ Return True if we have a hedging credit to spend.
+        """
+        self._lock.acquire()
+        try:
+            return self._credits >= 1
+        finally:
+            self._lock.release()
+
+
+    def _spendCredit(self):
+        """ Spend one hedging credit, if we have one.
+
+            We return True if a duplicate request can be sent.
+        """
+        self._lock.acquire()
+        try:
+            if self._credits < 1:
+                return False
+            self._credits = self._credits - 1
+            return True
+        finally:
+            self._lock.release()
+
+#############################################################################
+
+def _copyRequest(request):
+    """ Return a new Request object for sending the given request again.
+    """
+    return Request(request.method, request.url, request.endpoint,
+                   request.body, dict(request.headers))
+
+#############################################################################
+
+class _AttemptThread(threading.Thread):
+    """ A reusable background thread which sends requests for a
+        HedgingTransport.
+    """
+    def __init__(self, hedging):
+        """ Standard initializer.
+        """
+        threading.Thread.__init__(self, name="HedgingTransport")
+        self.setDaemon(True)
+        self._hedging = hedging
+        self._tasks   = Queue.Queue()
+
+
+    def submit(self, task):
+        """ Ask this thread to call the given function.
+        """
+        self._tasks.put(task)
+
+
+    def run(self):
+        """ Call each submitted function in turn.
+        """
+        while True:
+            task = self._tasks.get()
+            task()
+            if not self._hedging._threadIdle(self):
+                break
@@ -0,0 +1,395 @@
+""" threetaps.api.base.instrumentation
+
+    This Python module implements the hooks which let callers observe the
+    HTTP requests made by the API clients, along with a built-in hook which
+    aggregates request latencies into per-endpoint histograms.
+"""
+import math
+import threading
+
+#############################################################################
+
+class RequestInfo:
+    """ Information about a single HTTP request made by an API client.
+
+        A RequestInfo object has the following attributes:
+
+            client
+
+                The name of the APIClient subclass making the request, for
+                example "SearchAPIClient".
+
+            endpoint
+
+                The name of the endpoint being called, for example
+                "search/count".  Any posting keys or category codes in the
+                URL are left out, so that requests to the same API call share
+                the same endpoint name.
+
+            method
+
+                The HTTP method used, either "GET" or "POST".
+
+            bytesSent
+
+                The number of bytes in the request's URL and body.  If the
+                transport reports the number of body bytes actually sent,
+                after any compression, that number is used for the body.
+
+            bytesReceived
+
+                The number of bytes in the response body, as received over
+                the network (before any decompression) if the transport
+                reports it, or None if no response was received.
+
+            status
+
+                The HTTP status code returned by the server, or None.
+
+            execTimeMs
+
+                The server-side execution time reported in the response, if
+                any, in milliseconds.
+
+            timings
+
+                A dictionary mapping the phases of the request to the number
+                of seconds spent in that phase.  The following phases are
+                recorded, where known:
+
+                    connect
+
+                        Opening the connection to the server.
+
+                    firstByte
+
+                        Sending the request and waiting for the response
+                        headers.
+
+                    read
+
+                        Reading the response body.
+
+                    decode
+
+                        Decoding the JSON-format response.
+
+                    total
+
+                        The time taken by the request as a whole.
+
+            error
+
+                The exception raised if the request failed, or None.
+    """
+    def __init__(self, client, endpoint, method, bytesSent):
+        """ Standard initializer.
+        """
+        self.client        = client
+        self.endpoint      = endpoint
+        self.method        = method
+        self.bytesSent     = bytesSent
+        self.bytesReceived = None
+        self.status        = None
+        self.execTimeMs    = None
+        self.timings       = {}
+        self.error         = None
+
+#############################################################################
+
+class RequestHook:
+    """ The base class for an object which observes HTTP requests.
+
+        Hooks are registered using APIClient.addHook() for a single client,
+        or addGlobalHook() for every client in the process.  Subclasses
+        override whichever of the following methods they need; each is passed
+        the RequestInfo object for the request.  Note that hooks may be called
+        from several threads at once.
+    """
+    def preRequest(self, info):
+        """ Called before a request is sent to the server.
+        """
+        pass
+
+
+    def postResponse(self, info):
+        """ Called once a response has been received and decoded.
+        """
+        pass
+
+
+    def onError(self, info):
+        """ Called if the server could not be contacted.
+        """
+        pass
+
+#############################################################################
+
+_globalHooks = []
+
+def addGlobalHook(hook):
+    """ Register a RequestHook to be called for every APIClient.
+    """
+    if hook not in _globalHooks:
+        _globalHooks.append(hook)
+
+
+def removeGlobalHook(hook):
+    """ Remove a RequestHook previously registered using addGlobalHook().
+    """
+    if hook in _globalHooks:
+        _globalHooks.remove(hook)
+
+
+def getGlobalHooks():
+    """ Return the list of RequestHooks registered for every APIClient.
+    """
+    return _globalHooks
+
+
+def endpointName(endpoint):
+    """ Return the endpoint name to use for the given relative URL.
+
+        We strip any query parameters, and keep at most the first two parts
+        of the URL path, so that "posting/get/3F8TNQ" becomes "posting/get".
+    """
+    return "/".join(endpoint.split("?")[0].split("/")[:2])
+
+#############################################################################
+
+class LatencyHistogram:
+    """ A histogram of latency values, in the style of an HDR histogram.
+
+        Values are recorded into logarithmic buckets, each of which is split
+        into 2^'precisionBits' linear sub-buckets.  This keeps the relative
+        error of any reported percentile below 2^(1-precisionBits), while
+        using a small, bounded amount of memory no matter how many values are
+        recorded.  Values are stored with a resolution of one microsecond.
+
+        A LatencyHistogram can be updated from several threads at once.
+    """
+    def __init__(self, precisionBits=7):
+        """ Standard initializer.
+        """
+        self._precisionBits = precisionBits
+        self._buckets       = {} # Maps bucket index to count.
+        self._lock          = threading.Lock()
+        self._count         = 0
+        self._total         = 0
+        self._max           = 0
+
+
+    def record(self, seconds):
+        """ Record a single latency value, measured in seconds.
+        """
+        micros = max(0, int(seconds * 1000000))
+        shift  = max(0, micros.bit_length() - self._precisionBits)
+        index  = (shift << self._precisionBits) + (micros >> shift)
+
+        self._lock.acquire()
+        try:
+            self._buckets[index] = self._buckets.get(index, 0) + 1
+            self._count = self._count + 1
+            self._total = self._total + micros
+            if micros > self._max:
+                self._max = micros
+        finally:
+            self._lock.release()
+
+
+    def getCount(self):
+        """ Return the number of values recorded.
+        """
+        return self._count
+
+
+    def getPercentile(self, fraction):
+        """ Return the given percentile of the recorded values, in seconds.
+
+            'fraction' should be between 0 and 1; for example, 0.99 returns
+            the 99th percentile.  If no values have been recorded, we return
+            None.
+        """
+        self._lock.acquire()
+        try:
+            if self._count == 0:
+                return None
+            target = max(1, int(math.ceil(fraction * self._count)))
+            seen   = 0
+            for index in sorted(self._buckets.keys()):
+                seen = seen + self._buckets[index]
+                if seen >= target:
+                    return min(self._valueOf(index), self._max) / 1000000.0
+            return self._max / 1000000.0
+        finally:
+            self._lock.release()
+
+
+    def getMean(self):
+        """ Return the mean of the recorded values, in seconds, or None.
+        """
+        if self._count == 0:
+            return None
+        return self._total / 1000000.0 / self._count
+
+
+    def getMax(self):
+        """ Return the largest recorded value, in seconds, or None.
+        """
+        if self._count == 0:
+            return None
+        return self._max / 1000000.0
+
+
+    def getBuckets(self):
+        """ Return a sorted list of (upperBound, count) tuples.
+
+            Each tuple gives the upper bound of a non-empty bucket, in
+            seconds, and the number of values recorded in that bucket.
+        """
+        self._lock.acquire()
+        try:
+            buckets = []
+            for index in sorted(self._buckets.keys()):
+                buckets.append((self._valueOf(index) / 1000000.0,
+                                self._buckets[index]))
+            return buckets
+        finally:
+            self._lock.release()
+
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _valueOf(self, index):
+        """ Return the highest value, in microseconds, in the given bucket.
+        """
+        shift = index >> self._precisionBits
+        base  = index - (shift << self._precisionBits)
+        return ((base + 1) << shift) - 1
+
+#############################################################################
+
+class LatencyAggregator(RequestHook):
+    """ A RequestHook which aggregates request statistics by endpoint.
+
+        For each endpoint, we keep a LatencyHistogram of the total request
+        time, along with counts of the requests, errors and bytes
+        transferred.
+    """
+    def __init__(self):
+        """ Standard initializer.
+        """
+        self._lock      = threading.Lock()
+        self._endpoints = {} # Maps endpoint name to statistics dictionary.
+
+
+    def postResponse(self, info):
+        """ Record a completed request.
+        """
+        stats = self._statsFor(info.endpoint)
+        stats['histogram'].record(info.timings.get("total", 0))
+        self._lock.acquire()
+        try:
+            stats['count']         = stats['count'] + 1
+            stats['bytesSent']     = stats['bytesSent'] + info.bytesSent
+            stats['bytesReceived'] = stats['bytesReceived'] \
+                                   + (info.bytesReceived or 0)
+            if info.status != 200:
+                stats['errors'] = stats['errors'] + 1
+        finally:
+            self._lock.release()
+
+
+    def onError(self, info):
+        """ Record a request which failed to reach the server.
+        """
+        stats = self._statsFor(info.endpoint)
+        self._lock.acquire()
+        try:
+            stats['count']  = stats['count'] + 1
+            stats['errors'] = stats['errors'] + 1
+        finally:
+            self._lock.release()
+
+
+    def getHistogram(self, endpoint):
+        """ Return the LatencyHistogram for the given endpoint, or None.
+        """
+        stats = self._endpoints.get(endpoint)
+        if stats == None:
+            return None
+        return stats['histogram']
+
+
+    def getSummary(self):
+        """ Return a summary of the requests made to each endpoint.
+
+            We return a dictionary mapping each endpoint name to a dictionary
+            with the following entries:
+
+                'count'
+
+                    The number of requests made to this endpoint.
+
+                'errors'
+
+                    The number of requests which failed.
+
+                'bytesSent'
+
+                    The total number of bytes sent to this endpoint.
+
+                'bytesReceived'
+
+                    The total number of bytes received from this endpoint.
+
+                'p50Ms', 'p90Ms', 'p99Ms', 'maxMs', 'meanMs'
+
+                    The latency percentiles, maximum and mean for the
+                    requests which received a response, in milliseconds.
+        """
+        self._lock.acquire()
+        try:
+            endpoints = dict(self._endpoints)
+        finally:
+            self._lock.release()
+
+        summary = {}
+        for endpoint,stats in endpoints.items():
+            histogram = stats['histogram']
+            entry = {'count'         : stats['count'],
+                     'errors'        : stats['errors'],
+                     'bytesSent'     : stats['bytesSent'],
+                     'bytesReceived' : stats['bytesReceived']}
+            for key,value in [("p50Ms", histogram.getPercentile(0.50)),
+                              ("p90Ms", histogram.getPercentile(0.90)),
+                              ("p99Ms", histogram.getPercentile(0.99)),
+                              ("maxMs", histogram.getMax()),
+                              ("meanMs", histogram.getMean())]:
+                if value != None:
+                    value = value * 1000.0
+                entry[key] = value
+            summary[endpoint] = entry
+        return summary
+
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _statsFor(self, endpoint):
+        """ Return the statistics dictionary for the given endpoint.
+        """
+        self._lock.acquire()
+        try:
+            stats = self._endpoints.get(endpoint)
+            if stats == None:
+                stats = {'count'         : 0,
+                         'errors'        : 0,
+                         'bytesSent'     : 0,
+                         'bytesReceived' : 0,
+                         'histogram'     : LatencyHistogram()}
+                self._endpoints[endpoint] = stats
+            return stats
+        finally:
+            self._lock.release()
@@ -0,0 +1,641 @@
+""" threetaps.api.base.metrics
+
+    This Python module implements a registry of client-side metrics, which
+    can be exported in the OpenMetrics text format used by Prometheus.
+
+    The MetricsHook class records the requests made by the API clients into a
+    MetricsRegistry.  To collect metrics for every API client in the process
+    and serve them over HTTP, use something like:
+
+        registry = threetaps.api.base.metrics.getDefaultRegistry()
+        threetaps.api.base.addGlobalHook(MetricsHook(registry))
+        MetricsServer(registry, port=9133).start()
+
+    Counters and gauges spread their values over a fixed number of "stripes",
+    each with its own lock, so that threads updating the same metric rarely
+    contend with each other.  The stripes are only added up when the metrics
+    are rendered.
+"""
+from threetaps.api.base.instrumentation import LatencyHistogram, RequestHook
+
+import BaseHTTPServer
+import itertools
+import os
+import SocketServer
+import tempfile
+import threading
+
+#############################################################################
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+#############################################################################
+
+class _ShardedValues:
+    """ A set of numeric values which can be updated with little contention.
+
+        The values are split into 'numStripes' dictionaries, each protected
+        by its own lock.  Each thread is assigned one stripe, in turn, the
+        first time it updates the values, so that concurrent updates rarely
+        wait for each other.  The stripes are only combined when the values
+        are read.
+
+        Because the number of stripes is fixed, the memory used and the time
+        taken to read the values don't grow with the number of threads which
+        have updated them, even when many short-lived threads are used.
+    """
+    def __init__(self, numStripes=16):
+        """ Standard initializer.
+        """
+        self._local   = threading.local()
+        self._stripes = [({}, threading.Lock()) for i in range(numStripes)]
+        self._next    = itertools.count() # Used to assign stripes in turn.
+
+
+    def add(self, key, amount):
+        """ Add 'amount' to the value with the given key.
+        """
+        try:
+            values,lock = self._local.stripe
+        except AttributeError:
+            values,lock = self._assignStripe()
+
+        lock.acquire()
+        try:
+            values[key] = values.get(key, 0) + amount
+        finally:
+            lock.release()
+
+
+    def getValues(self):
+        """ Return a dictionary mapping each key to its total value.
+        """
+        totals = {}
+        for values,lock in self._stripes:
+            lock.acquire()
+            try:
+                items = values.items()
+            finally:
+                lock.release()
+            for key,value in items:
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _assignStripe(self):
+        """ Choose, and return, the stripe for the current thread.
+        """
+        stripe = self._stripes[self._next.next() % len(self._stripes)]
+        self._local.stripe = stripe
+        return stripe
+
+#############################################################################
+
+class Metric:
+    """ The base class for a metric held in a MetricsRegistry.
+
+        Each metric has a name, a help string, and a list of label names.
+        The values of a metric are identified by a tuple of label values, in
+        the same order as the label names.
+
+        As well as the values recorded directly, a metric can have values
+        which are calculated when the metric is rendered; see setFunction().
+    """
+    type = None
+
+    def __init__(self, name, help, labelNames=()):
+        """ Standard initializer.
+        """
+        self.name       = name
+        self.help       = help
+        self.labelNames = tuple(labelNames)
+        self._functions = {} # Maps label values to function.
+
+
+    def setFunction(self, function, labelValues=()):
+        """ Calculate the value for the given labels by calling 'function'.
+
+            The function is called, with no parameters, each time the metric
+            is rendered, and should return the current value.
+        """
+        self._functions[tuple(labelValues)] = function
+
+
+    def getSamples(self):
+        """ Return a list of the samples to render for this metric.
+
+            Each sample is a (suffix, labels, value) tuple, where 'suffix' is
+            added to the metric's name and 'labels' is a list of (name, value)
+            tuples.
+        """
+        samples = []
+        values  = self.getValues()
+        for labelValues in sorted(values.keys()):
+            samples.append((self._suffix(),
+                            zip(self.labelNames, labelValues),
+                            values[labelValues]))
+        return samples
+
+
+    def getValues(self):
+        """ Return a dictionary mapping label values to the current value.
+        """
+        values = {}
+        for labelValues,function in self._functions.items():
+            values[labelValues] = function()
+        return values
+
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _suffix(self):
+        """ Return the suffix to add to our name for each sample.
+        """
+        return ""
+
+#############################################################################
+
+class Counter(Metric):
+    """ A metric whose values only ever go up.
+    """
+    type = "counter"
+
+    def __init__(self, name, help, labelNames=()):
+        """ Standard initializer.
+        """
+        Metric.__init__(self, name, help, labelNames)
+        self._values = _ShardedValues()
+
+
+    def inc(self, labelValues=(), amount=1):
+        """ Add 'amount' to the value for the given labels.
+        """
+        self._values.add(labelValues, amount)
+
+
+    def getValues(self):
+        """ Return a dictionary mapping label values to the current value.
+        """
+        values = self._values.getValues()
+        values.update(Metric.getValues(self))
+        return values
+
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _suffix(self):
+        """ Return the suffix to add to our name for each sample.
+        """
+        return "_total"
+
+#############################################################################
+
+class Gauge(Metric):
+    """ A metric whose values can go up and down.
+
+        A gauge's values are either adjusted using inc() and dec(), or
+        calculated as needed using setFunction().
+    """
+    type = "gauge"
+
+    def __init__(self, name, help, labelNames=()):
+        """ Standard initializer.
+        """
+        Metric.__init__(self, name, help, labelNames)
+        self._values = _ShardedValues()
+
+
+    def inc(self, labelValues=(), amount=1):
+        """ Add 'amount' to the value for the given labels.
+        """
+        self._values.add(labelValues, amount)
+
+
+    def dec(self, labelValues=(), amount=1):
+        """ Subtract 'amount' from the value for the given labels.
+        """
+        self._values.add(labelValues, -amount)
+
+
+    def getValues(self):
+        """ Return a dictionary mapping label values to the current value.
+        """
+        values = self._values.getValues()
+        values.update(Metric.getValues(self))
+        return values
+
+#############################################################################
+
+class Summary(Metric):
+    """ A metric which records the distribution of a set of latencies.
+
+        Each set of label values has its own LatencyHistogram, from which we
+        render the given quantiles along with the count and sum of the
+        recorded values.
+    """
+    type = "summary"
+
+    def __init__(self, name, help, labelNames=(), quantiles=(0.5, 0.9, 0.99)):
+        """ Standard initializer.
+        """
+        Metric.__init__(self, name, help, labelNames)
+        self._quantiles  = quantiles
+        self._histograms = {} # Maps label values to LatencyHistogram.
+        self._lock       = threading.Lock()
+
+
+    def observe(self, seconds, labelValues=()):
+        """ Record a single latency value, measured in seconds.
+        """
+        histogram = self._histograms.get(labelValues)
+        if histogram == None:
+            self._lock.acquire()
+            try:
+                histogram = self._histograms.get(labelValues)
+                if histogram == None:
+                    histogram = LatencyHistogram()
+                    self._histograms[labelValues] = histogram
+            finally:
+                self._lock.release()
+        histogram.record(seconds)
+
+
+    def getHistogram(self, labelValues=()):
+        """ Return the LatencyHistogram for the given labels, or None.
+        """
+        return self._histograms.get(tuple(labelValues))
+
+
+    def getSamples(self):
+        """ Return a list of the samples to render for this metric.
+        """
+        samples = []
+        for labelValues in sorted(self._histograms.keys()):
+            histogram = self._histograms[labelValues]
+            labels    = zip(self.labelNames, labelValues)
+            count     = histogram.getCount()
+            if count == 0:
+                continue
+            for quantile in self._quantiles:
+                samples.append(("", labels + [("quantile", str(quantile))],
+                                histogram.getPercentile(quantile)))
+            samples.append(("_sum", labels, histogram.getMean() * count))
+            samples.append(("_count", labels, count))
+        return samples
+
+#############################################################################
+
+class MetricsRegistry:
+    """ A collection of metrics, which can be rendered as OpenMetrics text.
+    """
+    def __init__(self):
+        """ Standard initializer.
+        """
+        self._metrics = {} # Maps metric name to Metric object.
+        self._lock    = threading.Lock()
+
+
+    def counter(self, name, help, labelNames=()):
+        """ Return the Counter with the given name, creating it if necessary.
+        """
+        return self._getOrCreate(Counter, name, help, labelNames)
+
+
+    def gauge(self, name, help, labelNames=()):
+        """ Return the Gauge with the given name, creating it if necessary.
+        """
+        return self._getOrCreate(Gauge, name, help, labelNames)
+
+
+    def summary(self, name, help, labelNames=()):
+        """ Return the Summary with the given name, creating it if necessary.
+        """
+        return self._getOrCreate(Summary, name, help, labelNames)
+
+
+    def getMetric(self, name):
+        """ Return the metric with the given name, or None.
+        """
+        return self._metrics.get(name)
+
+
+    def render(self):
+        """ Return our metrics as a string in the OpenMetrics text format.
+        """
+        self._lock.acquire()
+        try:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        finally:
+            self._lock.release()
+
+        lines = []
+        for metric in metrics:
+            lines.append("# TYPE %s %s" % (metric.name, metric.type))
+            lines.append("# HELP %s %s" % (metric.name,
+                                           _escape(metric.help, False)))
+            for suffix,labels,value in metric.getSamples():
+                if value == None:
+                    continue
+                if len(labels) > 0:
+                    labelText = ",".join(['%s="%s"' % (labelName,
+                                                         _escape(labelValue))
+                                          for labelName,labelValue in labels])
+                    lines.append("%s%s{%s} %s" % (metric.name, suffix,
+                                                  labelText,
+                                                  _formatValue(value)))
+                else:
+                    lines.append("%s%s %s" % (metric.name, suffix,
+                                              _formatValue(value)))
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _getOrCreate(self, metricClass, name, help, labelNames):
+        """ Return the named metric, creating it if it doesn't exist.
+
+            We raise a RuntimeError if a metric of a different type, or with
+            different labels, already exists with the given name.
+        """
+        self._lock.acquire()
+        try:
+            metric = self._metrics.get(name)
+            if metric == None:
+                metric = metricClass(name, help, labelNames)
+                self._metrics[name] = metric
+            elif metric.__class__ != metricClass \
+                    or metric.labelNames != tuple(labelNames):
+                raise RuntimeError("Metric %s already exists with a " % name
+                                   + "different type or labels")
+            return metric
+        finally:
+            self._lock.release()
+
+#############################################################################
+
+_defaultRegistry = MetricsRegistry()
+
+def getDefaultRegistry():
+    """ Return the process-wide MetricsRegistry.
+    """
+    return _defaultRegistry
+
+#############################################################################
+
+class MetricsHook(RequestHook):
+    """ A RequestHook which records request metrics into a MetricsRegistry.
+
+        We record the following metrics, labelled by the name of the
+        APIClient subclass and the endpoint being called:
+
+            threetaps_requests_total
+
+                The number of requests made.
+
+            threetaps_request_errors_total
+
+                The number of requests which failed, either because the
+                server could not be contacted or because it returned an HTTP
+                status code other than 200.
+
+            threetaps_request_duration_seconds
+
+                A summary of the time taken by each request.
+
+            threetaps_request_sent_bytes_total and
+            threetaps_request_received_bytes_total
+
+                The number of bytes sent and received.
+
+            threetaps_requests_in_flight
+
+                The number of requests currently waiting for a response,
+                labelled by client only.  Compare this with the number of
+                worker threads to see how saturated a client's pool is.
+    """
+    def __init__(self, registry=None):
+        """ Standard initializer.
+
+            If 'registry' is None, the process-wide registry is used.
+        """
+        if registry == None:
+            registry = getDefaultRegistry()
+
+        labels = ("client", "endpoint")
+        self._requests = registry.counter("threetaps_requests",
+                                          "Number of HTTP requests made.",
+                                          labels)
+        self._errors   = registry.counter("threetaps_request_errors",
+                                          "Number of HTTP requests which " +
+                                          "failed.", labels)
+        self._duration = registry.summary("threetaps_request_duration_seconds",
+                                          "Time taken by each HTTP request.",
+                                          labels)
+        self._sent     = registry.counter("threetaps_request_sent_bytes",
+                                          "Number of bytes sent.", labels)
+        self._received = registry.counter("threetaps_request_received_bytes",
+                                          "Number of bytes received.", labels)
+        self._inFlight = registry.gauge("threetaps_requests_in_flight",
+                                        "Number of HTTP requests waiting " +
+                                        "for a response.", ("client",))
+
+
+    def preRequest(self, info):
+        """ Record the start of a request.
+        """
+        self._inFlight.inc((info.client,))
+
+
+    def postResponse(self, info):
+        """ Record a completed request.
+        """
+        labels = (info.client, info.endpoint)
+        self._inFlight.dec((info.client,))
+        self._requests.inc(labels)
+        self._sent.inc(labels, info.bytesSent)
+        self._received.inc(labels, info.bytesReceived or 0)
+        self._duration.observe(info.timings.get("total", 0), labels)
+        if info.status != 200:
+            self._errors.inc(labels)
+
+
+    def onError(self, info):
+        """ Record a request which failed to reach the server.
+        """
+        labels = (info.client, info.endpoint)
+        self._inFlight.dec((info.client,))
+        self._requests.inc(labels)
+        self._sent.inc(labels, info.bytesSent)
+        self._errors.inc(labels)
+
+#############################################################################
+
+def trackCache(name, cache, registry=None):
+    """ Export the statistics for a cache, such as a GeocodeCache.
+
+        'cache' can be any object with a getStats() method which returns a
+        dictionary with 'hits', 'misses' and 'size' entries.  The statistics
+        are exported with a "cache" label set to 'name'.
+    """
+    if registry == None:
+        registry = getDefaultRegistry()
+
+    _trackStats(registry, "threetaps_cache_", "cache", name, cache.getStats,
+                [("hits",   Counter, "Number of cache lookups which hit."),
+                 ("misses", Counter, "Number of cache lookups which missed."),
+                 ("size",   Gauge,   "Number of entries in the cache.")])
+
+
+def trackEmitter(name, emitter, registry=None):
+    """ Export the statistics for a StatusEmitter.
+
+        The statistics are exported with an "emitter" label set to 'name'.
+        The "threetaps_emitter_queued" gauge shows how close the emitter's
+        queue is to being full.
+    """
+    if registry == None:
+        registry = getDefaultRegistry()
+
+    _trackStats(registry, "threetaps_emitter_", "emitter", name,
+                emitter.getStats,
+                [("emitted", Counter, "Number of status events emitted."),
+                 ("sent",    Counter, "Number of status events sent."),
+                 ("failed",  Counter, "Number of status events which " +
+                                      "could not be sent."),
+                 ("dropped", Counter, "Number of status events dropped."),
+                 ("spilled", Counter, "Number of status events spilled to " +
+                                      "disk."),
+                 ("queued",  Gauge,   "Number of status events waiting to " +
+                                      "be sent.")])
+
+#############################################################################
+
+class MetricsServer:
+    """ Serve the contents of a MetricsRegistry over HTTP.
+
+        The metrics are served from a background thread, in the OpenMetrics
+        text format, in response to any GET request.  If 'port' is zero, a
+        free port is chosen automatically; the chosen port is available as
+        our 'port' attribute.
+    """
+    def __init__(self, registry=None, port=0, host="127.0.0.1"):
+        """ Standard initializer.
+
+            If 'registry' is None, the process-wide registry is used.
+        """
+        if registry == None:
+            registry = getDefaultRegistry()
+
+        self._httpServer = _ThreadingHTTPServer((host, port),
+                                                _MetricsRequestHandler)
+        self._httpServer.registry = registry
+        self._thread = None
+
+        self.port = self._httpServer.server_address[1]
+
+
+    def start(self):
+        """ Start serving metrics in the background.
+        """
+        self._thread = threading.Thread(target=self._httpServer.serve_forever,
+                                        name="MetricsServer")
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+
+    def stop(self):
+        """ Stop serving metrics.
+        """
+        if self._thread != None:
+            self._httpServer.shutdown()
+            self._httpServer.server_close()
+            self._thread.join()
+            self._thread = None
+
+
+def writeMetrics(path, registry=None):
+    """ Write the contents of a MetricsRegistry to the given file.
+
+        The file is replaced atomically, so it can safely be read by another
+        process (such as the Prometheus node exporter's textfile collector)
+        while it is being written.
+    """
+    if registry == None:
+        registry = getDefaultRegistry()
+
+    directory = os.path.dirname(os.path.abspath(path))
+    handle,tempPath = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        f = os.fdopen(handle, "w")
+        f.write(registry.render())
+        f.close()
+        os.rename(tempPath, path)
+    except:
+        os.remove(tempPath)
+        raise
+
+#############################################################################
+
+class _ThreadingHTTPServer(SocketServer.ThreadingMixIn,
+                           BaseHTTPServer.HTTPServer):
+    """ An HTTP server which handles each request in a separate thread.
+    """
+    daemon_threads      = True
+    allow_reuse_address = True
+
+#############################################################################
+
+class _MetricsRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """ Respond to each GET request with the rendered metrics.
+    """
+    def do_GET(self):
+        contents = self.server.registry.render()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(contents)))
+        self.end_headers()
+        self.wfile.write(contents)
+
+
+    def log_message(self, format, *args):
+        pass
+
+#############################################################################
+
+def _trackStats(registry, prefix, labelName, name, getStats, entries):
+    """ Export the values returned by a getStats() function.
+
+        'entries' is a list of (key, metricClass, help) tuples, one for each
+        value to export.  Each value is exported as a metric named 'prefix'
+        plus the key, with the given label set to 'name'.
+    """
+    for key,metricClass,help in entries:
+        if metricClass == Counter:
+            metric = registry.counter(prefix + key, help, (labelName,))
+        else:
+            metric = registry.gauge(prefix + key, help, (labelName,))
+        metric.setFunction(lambda key=key: getStats()[key], (name,))
+
+
+def _escape(text, quotes=True):
+    """ Escape the given text for use in an OpenMetrics label or help string.
+    """
+    text = str(text).replace("\\", "\\\\").replace("\n", "\\n")
+    if quotes:
+        text = text.replace('"', '\\"')
+    return text
+
+
+def _formatValue(value):
+    """ Return the given numeric value formatted for OpenMetrics.
+    """
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
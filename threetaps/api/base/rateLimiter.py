@@ -0,0 +1,347 @@
+""" threetaps.api.base.rateLimiter
+
+    This Python module implements a client-side rate limiter and adaptive
+    concurrency controller, which stops the API clients in a process from
+    overloading the 3taps server between them.
+
+    Each family of endpoints ("search", "posting", "status", "geocoder",
+    "reference" and so on) has a budget of its own.  A budget can limit the
+    rate at which requests are sent, using a token bucket, and always limits
+    the number of requests in flight at once.  The concurrency limit is
+    adjusted automatically in the style of TCP congestion control: it grows
+    slowly while responses are healthy, and is cut sharply when requests fail
+    or their latency rises ("additive increase, multiplicative decrease").
+
+    To make every API client in the process share the same limits, wrap the
+    default transport:
+
+        from threetaps.api.base import transport
+        transport.setDefaultTransport(RateLimitingTransport())
+"""
+from threetaps.api.base.instrumentation import endpointName
+from threetaps.api.base.metrics import getDefaultRegistry
+from threetaps.api.base.transport import Transport, getDefaultTransport
+
+import threading
+import time
+
+#############################################################################
+
+# The HTTP status codes which indicate that the server is overloaded.
+
+OVERLOAD_STATUSES = [429, 500, 502, 503, 504]
+
+#############################################################################
+
+class TokenBucket:
+    """ Limit the rate of some operation, while allowing short bursts.
+
+        The bucket holds up to 'burst' tokens, and is refilled at 'rate'
+        tokens per second.  Each operation takes one token, waiting for the
+        bucket to refill if it is empty.
+    """
+    def __init__(self, rate, burst):
+        """ Standard initializer.
+        """
+        self._rate       = float(rate)
+        self._burst      = float(burst)
+        self._tokens     = float(burst)
+        self._lastRefill = time.time()
+        self._lock       = threading.Lock()
+
+
+    def acquire(self):
+        """ Take a token from the bucket, waiting for one if necessary.
+        """
+        while True:
+            self._lock.acquire()
+            try:
+                now = time.time()
+                self._tokens = min(self._burst, self._tokens +
+                                   (now - self._lastRefill) * self._rate)
+                self._lastRefill = now
+                if self._tokens >= 1:
+                    self._tokens = self._tokens - 1
+                    return
+                wait = (1 - self._tokens) / self._rate
+            finally:
+                self._lock.release()
+            time.sleep(wait)
+
+#############################################################################
+
+class AdaptiveLimit:
+    """ An AIMD-style limit on the number of concurrent requests.
+
+        Callers call acquire() before sending a request, which waits until
+        fewer than the current limit of requests are in flight, and release()
+        once the request has finished.
+
+        Each healthy response increases the limit by 1/limit, so the limit
+        grows by about one for each full "window" of requests.  A failed
+        request, or a response whose latency is more than 'latencyTolerance'
+        times the long-term average, multiplies the limit by 'backoff'.  To
+        avoid over-reacting to a burst of failures, the limit is cut at most
+        once for each recent average latency.
+    """
+    def __init__(self, initialLimit=8, minLimit=1, maxLimit=64, backoff=0.5,
+                 latencyTolerance=2.0):
+        """ Standard initializer.
+        """
+        self._limit            = float(initialLimit)
+        self._minLimit         = minLimit
+        self._maxLimit         = maxLimit
+        self._backoff          = backoff
+        self._latencyTolerance = latencyTolerance
+        self._inFlight         = 0
+        self._shortLatency     = None # Fast-moving average latency.
+        self._longLatency      = None # Slow-moving average latency.
+        self._lastBackoff      = 0
+        self._condition        = threading.Condition()
+
+
+    def acquire(self):
+        """ Wait until another request can be sent.
+        """
+        self._condition.acquire()
+        try:
+            while self._inFlight >= int(self._limit):
+                self._condition.wait()
+            self._inFlight = self._inFlight + 1
+        finally:
+            self._condition.release()
+
+
+    def release(self, latency, success):
+        """ Record a finished request, and adjust the limit.
+
+            'latency' is the number of seconds taken by the request, and
+            'success' is True if the server handled the request normally.
+        """
+        self._condition.acquire()
+        try:
+            self._inFlight = self._inFlight - 1
+
+            if success:
+                if self._shortLatency == None:
+                    self._shortLatency = latency
+                    self._longLatency  = latency
+                else:
+                    self._shortLatency = 0.8  * self._shortLatency \
+                                       + 0.2  * latency
+                    self._longLatency  = 0.99 * self._longLatency \
+                                       + 0.01 * latency
+
+            overloaded = not success or \
+                         self._shortLatency > self._latencyTolerance \
+                                            * self._longLatency
+
+            now = time.time()
+            if overloaded:
+                if now - self._lastBackoff >= (self._shortLatency or 0):
+                    self._limit = max(self._minLimit,
+                                      self._limit * self._backoff)
+                    self._lastBackoff = now
+            else:
+                self._limit = min(self._maxLimit,
+                                  self._limit + 1.0 / self._limit)
+
+            self._condition.notifyAll()
+        finally:
+            self._condition.release()
+
+
+    def getLimit(self):
+        """ Return the current concurrency limit.
+        """
+        return int(self._limit)
+
+
+    def getInFlight(self):
+        """ Return the number of requests currently in flight.
+        """
+        return self._inFlight
+
+#############################################################################
+
+class RateLimiter:
+    """ A set of request budgets, one for each family of endpoints.
+
+        The endpoint family is the first part of the endpoint's URL, for
+        example "search" or "posting".  Each family starts out with a budget
+        created from the keyword parameters given to our initializer; use
+        setBudget() to give a family different limits.
+
+        The budget for a family has the following settings:
+
+            'rate' and 'burst'
+
+                If 'rate' is not None, requests are limited to 'rate' per
+                second, with bursts of up to 'burst' requests.
+
+            'initialLimit', 'minLimit', 'maxLimit', 'backoff' and
+            'latencyTolerance'
+
+                The settings for the family's AdaptiveLimit.
+
+        We export the "threetaps_concurrency_limit" and
+        "threetaps_concurrency_in_flight" gauges, labelled by family, to the
+        given MetricsRegistry.
+    """
+    def __init__(self, registry=None, **settings):
+        """ Standard initializer.
+
+            If 'registry' is None, the process-wide MetricsRegistry is used.
+        """
+        if registry == None:
+            registry = getDefaultRegistry()
+
+        self._settings = settings
+        self._budgets  = {} # Maps family to (TokenBucket, AdaptiveLimit).
+        self._lock     = threading.Lock()
+
+        self._limitGauge    = registry.gauge("threetaps_concurrency_limit",
+                                             "Number of concurrent requests " +
+                                             "allowed.", ("family",))
+        self._inFlightGauge = registry.gauge("threetaps_concurrency_in_flight",
+                                             "Number of requests in flight.",
+                                             ("family",))
+
+
+    def setBudget(self, family, **settings):
+        """ Replace the budget for the given endpoint family.
+
+            The keyword parameters are as described above; any which are not
+            given are taken from the settings passed to our initializer.
+        """
+        allSettings = dict(self._settings)
+        allSettings.update(settings)
+        self._lock.acquire()
+        try:
+            self._createBudget(family, allSettings)
+        finally:
+            self._lock.release()
+
+
+    def acquire(self, endpoint):
+        """ Wait until a request can be sent to the given endpoint.
+
+            We return an object which must be passed to release() once the
+            request has finished.
+        """
+        bucket,limit = self._getBudget(endpoint.split("/")[0])
+        if bucket != None:
+            bucket.acquire()
+        limit.acquire()
+        return limit
+
+
+    def release(self, token, latency, success):
+        """ Record that a request has finished.
+
+            'token' is the value returned by acquire(), 'latency' is the
+            number of seconds taken by the request, and 'success' is True if
+            the server handled the request normally.
+        """
+        token.release(latency, success)
+
+
+    def getLimit(self, family):
+        """ Return the AdaptiveLimit for the given endpoint family.
+        """
+        return self._getBudget(family)[1]
+
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _getBudget(self, family):
+        """ Return the (TokenBucket, AdaptiveLimit) tuple for a family.
+
+            The TokenBucket will be None if the family's rate is unlimited.
+        """
+        budget = self._budgets.get(family)
+        if budget == None:
+            self._lock.acquire()
+            try:
+                budget = self._budgets.get(family)
+                if budget == None:
+                    budget = self._createBudget(family, self._settings)
+            finally:
+                self._lock.release()
+        return budget
+
+
+    def _createBudget(self, family, settings):
+        """ Create and return the budget for a family.
+
+            Note that the caller must hold our lock.
+        """
+        settings = dict(settings)
+        rate     = settings.pop("rate", None)
+        burst    = settings.pop("burst", 1)
+        if rate != None:
+            bucket = TokenBucket(rate, burst)
+        else:
+            bucket = None
+        limit = AdaptiveLimit(**settings)
+
+        self._budgets[family] = (bucket, limit)
+        self._limitGauge.setFunction(limit.getLimit, (family,))
+        self._inFlightGauge.setFunction(limit.getInFlight, (family,))
+        return (bucket, limit)
+
+#############################################################################
+
+_sharedLimiter = None
+_sharedLock    = threading.Lock()
+
+def getSharedRateLimiter():
+    """ Return the process-wide RateLimiter, creating it if necessary.
+    """
+    global _sharedLimiter
+    _sharedLock.acquire()
+    try:
+        if _sharedLimiter == None:
+            _sharedLimiter = RateLimiter()
+        return _sharedLimiter
+    finally:
+        _sharedLock.release()
+
+#############################################################################
+
+class RateLimitingTransport(Transport):
+    """ A Transport which sends each request through a RateLimiter.
+
+        Requests which fail with an IOError, or which return one of the
+        OVERLOAD_STATUSES, are reported to the limiter as failures.
+    """
+    def __init__(self, transport=None, limiter=None):
+        """ Standard initializer.
+
+            'transport' is the Transport to send requests through; if this is
+            None, the current process-wide default transport is used.  If
+            'limiter' is None, the process-wide RateLimiter is used, so that
+            every RateLimitingTransport shares the same budgets.
+        """
+        if transport == None:
+            transport = getDefaultTransport()
+        if limiter == None:
+            limiter = getSharedRateLimiter()
+
+        self._transport = transport
+        self._limiter   = limiter
+
+
+    def send(self, request):
+        """ Send the given Request object, once the limiter allows it.
+        """
+        token     = self._limiter.acquire(endpointName(request.endpoint))
+        startTime = time.time()
+        success   = False
+        try:
+            response = self._transport.send(request)
+            success  = response['status'] not in OVERLOAD_STATUSES
+            return response
+        finally:
+            self._limiter.release(token, time.time() - startTime, success)
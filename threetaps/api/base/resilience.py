@@ -0,0 +1,302 @@
+""" threetaps.api.base.resilience
+
+    This Python module implements a Transport which makes the API clients
+    more resilient to brief server problems, by retrying failed requests and
+    failing fast while an endpoint is known to be down.
+
+    To use it for every API client in the process, wrap the default
+    transport:
+
+        from threetaps.api.base import transport
+        transport.setDefaultTransport(ResilientTransport())
+"""
+from threetaps.api.base.instrumentation import endpointName
+from threetaps.api.base.metrics import getDefaultRegistry
+from threetaps.api.base.transport import Transport, getDefaultTransport
+
+import random
+import threading
+import time
+
+#############################################################################
+
+# The POST endpoints which can safely be retried, because they don't change
+# anything on the server.
+
+SAFE_POST_ENDPOINTS = ["status/get", "geocoder/geocode"]
+
+# The HTTP status codes which indicate a temporary server problem.
+
+RETRYABLE_STATUSES = [500, 502, 503, 504]
+
+# The states of a CircuitBreaker.
+
+STATE_CLOSED    = "closed"    # Requests are sent as normal.
+STATE_OPEN      = "open"      # Requests fail immediately.
+STATE_HALF_OPEN = "half-open" # A single trial request is allowed through.
+
+#############################################################################
+
+class CircuitOpenError(IOError):
+    """ The exception raised when a request is rejected by a CircuitBreaker.
+
+        This is a subclass of IOError, so the API clients treat it in the
+        same way as a failure to contact the server.
+    """
+    pass
+
+#############################################################################
+
+class RetryPolicy:
+    """ Decide which failed requests to retry, and how long to wait first.
+
+        A request is only retried if it is idempotent: that is, it is a GET
+        request, or a POST to one of the 'safeEndpoints'.  A request is
+        retried if the server cannot be contacted, or it returns one of the
+        'retryStatuses', up to a total of 'maxAttempts' attempts.
+
+        Before each retry we wait for a random time of up to
+        'baseDelayMs' * 2^(retry number), capped at 'maxDelayMs'.  The random
+        "jitter" stops clients which failed at the same moment from retrying
+        at the same moment as well.
+    """
+    def __init__(self, maxAttempts=3, baseDelayMs=100, maxDelayMs=5000,
+                 retryStatuses=RETRYABLE_STATUSES,
+                 safeEndpoints=SAFE_POST_ENDPOINTS):
+        """ Standard initializer.
+        """
+        self.maxAttempts   = maxAttempts
+        self.baseDelayMs   = baseDelayMs
+        self.maxDelayMs    = maxDelayMs
+        self.retryStatuses = retryStatuses
+        self.safeEndpoints = safeEndpoints
+
+
+    def isIdempotent(self, request):
+        """ Return True if the given Request object can safely be retried.
+        """
+        if request.method == "GET":
+            return True
+        return endpointName(request.endpoint) in self.safeEndpoints
+
+
+    def getDelay(self, retry):
+        """ Return the number of seconds to wait before the given retry.
+
+            'retry' is zero for the first retry, one for the second, and so
+            on.
+        """
+        ceiling = min(self.maxDelayMs, self.baseDelayMs * (2 ** retry))
+        return random.uniform(0, ceiling) / 1000.0
+
+#############################################################################
+
+class CircuitBreaker:
+    """ Keep track of failures for an endpoint, and fail fast when it's down.
+
+        The breaker starts out "closed", allowing requests through.  Once
+        'failureThreshold' requests in a row have failed, the breaker "opens"
+        and rejects requests without sending them.  After 'resetTimeoutMs'
+        milliseconds the breaker becomes "half-open", and lets a single trial
+        request through: if this succeeds the breaker closes again, and if it
+        fails the breaker opens for another 'resetTimeoutMs'.
+    """
+    def __init__(self, failureThreshold=5, resetTimeoutMs=30000):
+        """ Standard initializer.
+        """
+        self._failureThreshold = failureThreshold
+        self._resetTimeout     = resetTimeoutMs / 1000.0
+        self._lock             = threading.Lock()
+        self._state            = STATE_CLOSED
+        self._failures         = 0
+        self._openedAt         = None
+        self._trialInProgress  = False
+
+
+    def allowRequest(self):
+        """ Return True if a request should be sent.
+        """
+        self._lock.acquire()
+        try:
+            if self._state == STATE_OPEN:
+                if time.time() - self._openedAt < self._resetTimeout:
+                    return False
+                self._state = STATE_HALF_OPEN
+                self._trialInProgress = False
+            if self._state == STATE_HALF_OPEN:
+                if self._trialInProgress:
+                    return False
+                self._trialInProgress = True
+            return True
+        finally:
+            self._lock.release()
+
+
+    def recordSuccess(self):
+        """ Record a request which succeeded.
+        """
+        self._lock.acquire()
+        try:
+            self._state           = STATE_CLOSED
+            self._failures        = 0
+            self._trialInProgress = False
+        finally:
+            self._lock.release()
+
+
+    def recordFailure(self):
+        """ Record a request which failed.
+        """
+        self._lock.acquire()
+        try:
+            self._failures = self._failures + 1
+            if self._state == STATE_HALF_OPEN \
+                    or self._failures >= self._failureThreshold:
+                self._state           = STATE_OPEN
+                self._openedAt        = time.time()
+                self._trialInProgress = False
+        finally:
+            self._lock.release()
+
+
+    def getState(self):
+        """ Return the current state of the breaker.
+
+            We return one of STATE_CLOSED, STATE_OPEN or STATE_HALF_OPEN.
+        """
+        self._lock.acquire()
+        try:
+            if self._state == STATE_OPEN \
+                    and time.time() - self._openedAt >= self._resetTimeout:
+                return STATE_HALF_OPEN
+            return self._state
+        finally:
+            self._lock.release()
+
+#############################################################################
+
+class ResilientTransport(Transport):
+    """ A Transport which retries failed requests, with a circuit breaker.
+
+        Requests are passed on to another Transport.  Failed idempotent
+        requests are retried according to a RetryPolicy, and each endpoint
+        has a CircuitBreaker which rejects requests, by raising a
+        CircuitOpenError, while the endpoint is failing.
+
+        We record the following metrics, labelled by endpoint, in the given
+        MetricsRegistry:
+
+            threetaps_retries_total
+
+                The number of requests which were retried.
+
+            threetaps_circuit_rejections_total
+
+                The number of requests rejected by an open circuit breaker.
+
+            threetaps_circuit_open
+
+                1 if the endpoint's circuit breaker is open or half-open, 0 if
+                it is closed.
+    """
+    def __init__(self, transport=None, retryPolicy=None, failureThreshold=5,
+                 resetTimeoutMs=30000, registry=None):
+        """ Standard initializer.
+
+            'transport' is the Transport to send requests through; if this is
+            None, the current process-wide default transport is used.  If
+            'retryPolicy' is None, a RetryPolicy with the default settings is
+            used.  'failureThreshold' and 'resetTimeoutMs' are passed to each
+            endpoint's CircuitBreaker.  If 'registry' is None, the
+            process-wide MetricsRegistry is used.
+        """
+        if transport == None:
+            transport = getDefaultTransport()
+        if retryPolicy == None:
+            retryPolicy = RetryPolicy()
+        if registry == None:
+            registry = getDefaultRegistry()
+
+        self._transport        = transport
+        self._retryPolicy      = retryPolicy
+        self._failureThreshold = failureThreshold
+        self._resetTimeoutMs   = resetTimeoutMs
+        self._breakers         = {} # Maps endpoint name to CircuitBreaker.
+        self._lock             = threading.Lock()
+
+        self._retries    = registry.counter("threetaps_retries",
+                                            "Number of requests retried.",
+                                            ("endpoint",))
+        self._rejections = registry.counter("threetaps_circuit_rejections",
+                                            "Number of requests rejected " +
+                                            "by an open circuit breaker.",
+                                            ("endpoint",))
+        self._circuitOpen = registry.gauge("threetaps_circuit_open",
+                                           "Whether the endpoint's circuit " +
+                                           "breaker is open.", ("endpoint",))
+
+
+    def send(self, request):
+        """ Send the given Request object, retrying it if necessary.
+        """
+        endpoint = endpointName(request.endpoint)
+        breaker  = self.getBreaker(endpoint)
+        attempt  = 1
+
+        while True:
+            if not breaker.allowRequest():
+                self._rejections.inc((endpoint,))
+                raise CircuitOpenError("Circuit breaker open for " + endpoint)
+
+            # The outcome must always be recorded, so that a half-open
+            # breaker's trial request can't be left in progress forever.  An
+            # unexpected exception counts as a failure, and isn't retried.
+
+            succeeded = False
+            try:
+                try:
+                    response = self._transport.send(request)
+                    error    = None
+                except IOError,e:
+                    response = None
+                    error    = e
+                succeeded = error == None and response['status'] \
+                                not in self._retryPolicy.retryStatuses
+            finally:
+                if succeeded:
+                    breaker.recordSuccess()
+                else:
+                    breaker.recordFailure()
+
+            if succeeded:
+                return response
+
+            if attempt >= self._retryPolicy.maxAttempts \
+                    or not self._retryPolicy.isIdempotent(request):
+                if error != None:
+                    raise error
+                return response
+
+            self._retries.inc((endpoint,))
+            time.sleep(self._retryPolicy.getDelay(attempt - 1))
+            attempt = attempt + 1
+
+
+    def getBreaker(self, endpoint):
+        """ Return the CircuitBreaker for the given endpoint name.
+        """
+        breaker = self._breakers.get(endpoint)
+        if breaker == None:
+            self._lock.acquire()
+            try:
+                breaker = self._breakers.get(endpoint)
+                if breaker == None:
+                    breaker = CircuitBreaker(self._failureThreshold,
+                                             self._resetTimeoutMs)
+                    self._breakers[endpoint] = breaker
+                    self._circuitOpen.setFunction(
+                        lambda: int(breaker.getState() != STATE_CLOSED),
+                        (endpoint,))
+            finally:
+                self._lock.release()
+        return breaker
@@ -0,0 +1,168 @@
+""" threetaps.api.base.singleFlight
+
+    This Python module implements a Transport which stops identical GET
+    requests from being sent to the 3taps server at the same time.
+
+    When several threads make the same GET request at once, only the first
+    request is sent; the others wait for it to finish, and share its
+    response.  Successful responses can also be remembered for a short time,
+    so that a burst of identical requests which don't quite overlap still
+    only reaches the server once.
+
+    To deduplicate the requests made by every API client in the process, wrap
+    the default transport:
+
+        from threetaps.api.base import transport
+        transport.setDefaultTransport(SingleFlightTransport(memoTTLMs=1000))
+"""
+from threetaps.api.base.instrumentation import endpointName
+from threetaps.api.base.metrics import getDefaultRegistry
+from threetaps.api.base.transport import Transport, getDefaultTransport
+
+import collections
+import threading
+import time
+
+#############################################################################
+
+class _Call:
+    """ A GET request which is currently in flight.
+    """
+    def __init__(self, request):
+        """ Standard initializer.
+        """
+        self.request  = request
+        self.response = None
+        self.error    = None
+        self.done     = threading.Event()
+
+#############################################################################
+
+class SingleFlightTransport(Transport):
+    """ A Transport which shares one response between identical GET requests.
+
+        GET requests with the same URL which are in flight at the same time
+        share a single request to the server.  If 'memoTTLMs' is greater than
+        zero, successful responses are also remembered for that many
+        milliseconds, and returned for any identical GET request made in the
+        meantime.  At most 'maxMemoEntries' responses are remembered; the
+        least recently used response is discarded when the memo is full.
+
+        POST requests are always passed straight through.
+
+        We record the number of requests which were answered without going
+        to the server in the "threetaps_deduplicated_requests_total" counter,
+        labelled by endpoint and by "source", which is either "inflight" or
+        "memo".
+    """
+    def __init__(self, transport=None, memoTTLMs=0, maxMemoEntries=1000,
+                 registry=None):
+        """ Standard initializer.
+
+            'transport' is the Transport to send requests through; if this is
+            None, the current process-wide default transport is used.  If
+            'registry' is None, the process-wide MetricsRegistry is used.
+        """
+        if transport == None:
+            transport = getDefaultTransport()
+        if registry == None:
+            registry = getDefaultRegistry()
+
+        self._transport      = transport
+        self._memoTTL        = memoTTLMs / 1000.0
+        self._maxMemoEntries = maxMemoEntries
+        self._lock           = threading.Lock()
+        self._inFlight       = {} # Maps URL to _Call object.
+        self._memo           = collections.OrderedDict() # URL -> (expiry,
+                                                         #        response).
+
+        self._deduplicated = registry.counter(
+                                "threetaps_deduplicated_requests",
+                                "Number of GET requests answered without " +
+                                "contacting the server.",
+                                ("endpoint", "source"))
+
+
+    def send(self, request):
+        """ Send the given Request object, unless an identical one is in
+            flight.
+        """
+        if request.method != "GET":
+            return self._transport.send(request)
+
+        key = request.url
+
+        self._lock.acquire()
+        try:
+            memo = self._memo.get(key)
+            if memo != None:
+                expiry,response = memo
+                if expiry > time.time():
+                    del self._memo[key]
+                    self._memo[key] = memo # Mark as recently used.
+                    self._count(request, "memo")
+                    return dict(response)
+                del self._memo[key]
+
+            call = self._inFlight.get(key)
+            if call == None:
+                call = _Call(request)
+                self._inFlight[key] = call
+                leader = True
+            else:
+                leader = False
+        finally:
+            self._lock.release()
+
+        if not leader:
+            call.done.wait()
+            self._count(request, "inflight")
+            request.timings.update(call.request.timings)
+            if call.error != None:
+                raise call.error
+            return dict(call.response)
+
+        # Whatever happens to our request, the waiting followers must be
+        # released, and the call removed so that later requests aren't
+        # attached to it.
+
+        try:
+            try:
+                call.response = self._transport.send(request)
+            except Exception,e:
+                call.error = e
+                raise
+        finally:
+            self._lock.acquire()
+            try:
+                del self._inFlight[key]
+                if call.error == None and call.response['status'] == 200 \
+                        and self._memoTTL > 0:
+                    self._memo[key] = (time.time() + self._memoTTL,
+                                       call.response)
+                    while len(self._memo) > self._maxMemoEntries:
+                        self._memo.popitem(last=False)
+            finally:
+                self._lock.release()
+            call.done.set()
+
+        return call.response
+
+
+    def clearMemo(self):
+        """ Forget all remembered responses.
+        """
+        self._lock.acquire()
+        try:
+            self._memo.clear()
+        finally:
+            self._lock.release()
+
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _count(self, request, source):
+        """ Record a request answered without contacting the server.
+        """
+        self._deduplicated.inc((endpointName(request.endpoint), source))
@@ -0,0 +1,344 @@
+""" threetaps.api.base.transport
+
+    This Python module defines the Transport interface, which is used by the
+    API clients to send HTTP requests to the 3taps server, along with the
+    standard httplib- and urllib-based implementations of this interface.
+"""
+import httplib
+import threading
+import time
+import urllib
+import urlparse
+import zlib
+
+#############################################################################
+
+# HTTPTransport keeps a buffer for reading responses in each thread, unless
+# the buffer would be larger than this many bytes.
+
+MAX_REUSED_BUFFER = 16 * 1024 * 1024
+
+#############################################################################
+
+class Request:
+    """ An HTTP request to be sent by a Transport.
+
+        A Request object has the following attributes:
+
+            method
+
+                The HTTP method to use, either "GET" or "POST".
+
+            url
+
+                The full URL to send the request to, including any query
+                parameters.
+
+            endpoint
+
+                The URL of the request relative to the API's base URL, without
+                any query parameters; for example, "search/count".
+
+            body
+
+                The form-encoded body of a POST request, or None.
+
+            headers
+
+                A dictionary of additional HTTP headers to send.
+
+            timings
+
+                A dictionary which the Transport fills in with the number of
+                seconds spent in each phase of the request.  Refer to the
+                RequestInfo class for the list of phases.
+
+            bytesSent, bytesReceived
+
+                The number of bytes of request and response body actually
+                sent over the network, after any compression.  These are
+                filled in by the Transport, if it knows them.
+    """
+    def __init__(self, method, url, endpoint, body=None, headers=None):
+        """ Standard initializer.
+        """
+        if headers == None:
+            headers = {}
+
+        self.method   = method
+        self.url      = url
+        self.endpoint = endpoint
+        self.body     = body
+        self.headers  = headers
+        self.timings  = {}
+
+        self.bytesSent     = None
+        self.bytesReceived = None
+
+#############################################################################
+
+class Transport:
+    """ The base class for an object which sends HTTP requests.
+
+        A Transport sends a Request object to a server, and returns the
+        server's response.  The APIClient uses a Transport for every request
+        it makes, so a different Transport can be used to talk to a fake
+        server, record requests, and so on.
+    """
+    def send(self, request):
+        """ Send the given Request object, and return the server's response.
+
+            We return a dictionary with the following entries:
+
+                status
+
+                    The HTTP status code returned by the server.
+
+                contents
+
+                    The unprocessed text returned by the server.
+
+                content-type
+
+                    The HTTP content-type value returned by the server.
+
+            If the server cannot be contacted, we raise an IOError.
+        """
+        raise NotImplementedError()
+
+#############################################################################
+
+class HTTPTransport(Transport):
+    """ A Transport which uses the httplib module to send HTTP requests.
+
+        This is the default transport.  Using httplib directly lets us time
+        the connection, time-to-first-byte and read phases of each request
+        separately.
+
+        If 'acceptCompression' is True, we ask the server to gzip or deflate
+        its responses, and decompress them as they are read.  If
+        'compressThreshold' is not None, request bodies of at least that many
+        bytes are sent gzip-compressed; only enable this if the server
+        accepts compressed requests.
+    """
+    def __init__(self, timeout=None, acceptCompression=True,
+                 compressThreshold=None):
+        """ Standard initializer.
+
+            'timeout' is the socket timeout to use, in seconds, or None to use
+            the system default.
+        """
+        self._timeout           = timeout
+        self._acceptCompression = acceptCompression
+        self._compressThreshold = compressThreshold
+        self._buffers           = threading.local()
+
+
+    def send(self, request):
+        """ Send the given Request object, and return the server's response.
+        """
+        url  = urlparse.urlsplit(request.url)
+        path = url.path
+        if url.query:
+            path = path + "?" + url.query
+
+        if url.scheme == "https":
+            connection = httplib.HTTPSConnection(url.hostname, url.port,
+                                                 timeout=self._timeout)
+        else:
+            connection = httplib.HTTPConnection(url.hostname, url.port,
+                                                timeout=self._timeout)
+
+        headers = dict(request.headers)
+        body    = request.body
+        if body != None:
+            headers['Content-Type'] = "application/x-www-form-urlencoded"
+            if self._compressThreshold != None \
+                    and len(body) >= self._compressThreshold:
+                body = compress(body)
+                headers['Content-Encoding'] = "gzip"
+        if self._acceptCompression:
+            headers['Accept-Encoding'] = "gzip, deflate"
+
+        try:
+            startTime = time.time()
+            connection.connect()
+            connectTime = time.time()
+            connection.request(request.method, path, body, headers)
+            response = connection.getresponse()
+            firstByteTime = time.time()
+            encoding = response.getheader("Content-Encoding", "").lower()
+            if encoding in ["gzip", "deflate"]:
+                contents,numBytes = _readCompressed(response, encoding)
+            else:
+                contents = self._readBody(response)
+                numBytes = len(contents)
+            readTime = time.time()
+        except httplib.HTTPException,e:
+            raise IOError(repr(e))
+        except zlib.error,e:
+            raise IOError("Invalid compressed response: " + str(e))
+        finally:
+            connection.close()
+
+        request.timings['connect']   = connectTime   - startTime
+        request.timings['firstByte'] = firstByteTime - connectTime
+        request.timings['read']      = readTime      - firstByteTime
+        request.bytesSent            = len(body or "")
+        request.bytesReceived        = numBytes
+
+        contentType = response.getheader("Content-Type", "text/plain")
+        contentType = contentType.split(";")[0].strip().lower()
+
+        return {'status'       : response.status,
+                'contents'     : contents,
+                'content-type' : contentType}
+
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _readBody(self, response):
+        """ Read the body of an uncompressed HTTP response.
+
+            httplib reads a response body in pieces, copying each piece
+            several times before joining them together.  When the response
+            has a Content-Length, we instead receive the body straight from
+            the socket into a buffer of the right size, so that the only
+            copy is the final string we return.  Each thread keeps its buffer
+            for the next request, unless it is larger than MAX_REUSED_BUFFER
+            bytes.
+        """
+        length = response.length
+        socket = _rawSocket(response)
+        if length == None or socket == None:
+            return response.read()
+
+        buffer = getattr(self._buffers, "buffer", None)
+        if buffer == None or len(buffer) < length:
+            buffer = bytearray(length)
+            if length <= MAX_REUSED_BUFFER:
+                self._buffers.buffer = buffer
+
+        view = memoryview(buffer)
+        pos  = 0
+        while pos < length:
+            numBytes = socket.recv_into(view[pos:length])
+            if numBytes == 0:
+                raise httplib.IncompleteRead(view[:pos].tobytes(),
+                                             length - pos)
+            pos = pos + numBytes
+
+        response.length = 0
+        response.close()
+        return view[:length].tobytes()
+
+#############################################################################
+
+class URLLibTransport(Transport):
+    """ A Transport which uses the urllib module to send HTTP requests.
+
+        Unlike the HTTPTransport, this honours the proxy settings in the
+        environment.  Because urllib doesn't report when the connection was
+        opened, the time taken to connect is included in the 'firstByte'
+        timing.  Compressed requests and responses are not supported.
+    """
+    def send(self, request):
+        """ Send the given Request object, and return the server's response.
+        """
+        startTime  = time.time()
+        connection = urllib.urlopen(request.url, request.body)
+        firstByteTime = time.time()
+
+        status      = connection.code
+        contents    = connection.read()
+        contentType = connection.info().gettype()
+
+        connection.close()
+
+        request.timings['firstByte'] = firstByteTime - startTime
+        request.timings['read']      = time.time() - firstByteTime
+
+        return {'status'       : status,
+                'contents'     : contents,
+                'content-type' : contentType}
+
+#############################################################################
+
+def compress(data):
+    """ Return the given string, compressed in gzip format.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _rawSocket(response):
+    """ Return the socket an httplib response body can be received from.
+
+        httplib reads the status line and headers of a response one byte at a
+        time, so once they have been read, the rest of the response can be
+        received directly from the socket.  If the response is buffered, so
+        that part of the body may already have been read, we return None.
+    """
+    fp = response.fp
+    if getattr(fp, "_rbufsize", None) != 1 or fp._rbuf.tell() != 0:
+        return None
+    socket = getattr(fp, "_sock", None)
+    if not hasattr(socket, "recv_into"):
+        return None
+    return socket
+
+
+def _readCompressed(response, encoding, chunkSize=65536):
+    """ Read and decompress the body of an HTTP response.
+
+        'encoding' is the response's content encoding, either "gzip" or
+        "deflate".  The body is decompressed a chunk at a time as it is read,
+        so the compressed body is never held in memory all at once.  We
+        return a (contents, numBytes) tuple, where 'numBytes' is the size of
+        the compressed body.
+    """
+    if encoding == "gzip":
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    else:
+        decompressor = zlib.decompressobj(zlib.MAX_WBITS)
+
+    pieces   = []
+    numBytes = 0
+    while True:
+        chunk = response.read(chunkSize)
+        if not chunk:
+            break
+        if numBytes == 0 and encoding == "deflate":
+            try:
+                piece = decompressor.decompress(chunk)
+            except zlib.error:
+                # Some servers send raw deflate data, without the zlib
+                # header.
+                decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+                piece = decompressor.decompress(chunk)
+        else:
+            piece = decompressor.decompress(chunk)
+        numBytes = numBytes + len(chunk)
+        pieces.append(piece)
+    pieces.append(decompressor.flush())
+    return ("".join(pieces), numBytes)
+
+#############################################################################
+
+_defaultTransport = HTTPTransport()
+
+def getDefaultTransport():
+    """ Return the Transport used by API clients which don't have their own.
+    """
+    return _defaultTransport
+
+
+def setDefaultTransport(transport):
+    """ Set the Transport used by API clients which don't have their own.
+
+        This changes the transport used by every APIClient in the process,
+        other than those which have been given a transport of their own.
+    """
+    global _defaultTransport
+    _defaultTransport = transport
@@ -5,12 +5,19 @@
     Note that we load the various APIClient subclasses into this namespace, to
     make them easier to access.
 """
-from threetaps.api.clients.geocoderAPIClient  import GeocoderAPIClient
-from threetaps.api.clients.geocoderAPIClient  import GeocodeRequest
-from threetaps.api.clients.geocoderAPIClient  import GeocodeResponse
-from threetaps.api.clients.postingAPIClient   import PostingAPIClient
-from threetaps.api.clients.referenceAPIClient import ReferenceAPIClient
-from threetaps.api.clients.searchAPIClient    import SearchAPIClient
-from threetaps.api.clients.searchAPIClient    import SearchQuery
-from threetaps.api.clients.statusAPIClient    import StatusAPIClient
+from threetaps.api.clients.geocoderAPIClient   import GeocoderAPIClient
+from threetaps.api.clients.geocoderAPIClient   import GeocodeRequest
+from threetaps.api.clients.geocoderAPIClient   import GeocodeResponse
+from threetaps.api.clients.geocodeBatcher      import GeocodeBatcher
+from threetaps.api.clients.geocodeCache        import GeocodeCache
+from threetaps.api.clients.postingAPIClient    import CreateResult
+from threetaps.api.clients.postingAPIClient    import PostingAPIClient
+from threetaps.api.clients.queryFilter         import QueryFilter
+from threetaps.api.clients.referenceAPIClient  import ReferenceAPIClient
+from threetaps.api.clients.searchAPIClient     import SearchAPIClient
+from threetaps.api.clients.searchAPIClient     import SearchQuery
+from threetaps.api.clients.statusAPIClient     import StatusAPIClient
+from threetaps.api.clients.statusEmitter       import StatusEmitter
+from threetaps.api.clients.systemStatusMonitor import SystemStatusMonitor
+from threetaps.api.clients.systemStatusMonitor import getSharedMonitor
 
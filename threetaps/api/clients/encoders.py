@@ -0,0 +1,135 @@
+""" threetaps.api.clients.encoders
+
+    This Python module generates the functions which convert Posting and
+    SearchQuery objects into the dictionaries sent to the 3taps server.
+
+    Rather than testing each attribute in turn every time an object is
+    converted, each encoder is described by a table of fields, from which we
+    generate and compile a specialised Python function once, when this
+    module is loaded.
+"""
+import urllib
+import simplejson as json
+
+#############################################################################
+
+# The ways in which a field's value can be encoded:
+
+PLAIN     = "plain"     # Copy the value as-is, if it isn't None.
+NON_EMPTY = "nonEmpty"  # Copy a list or dictionary, if it isn't empty.
+TIMESTAMP = "timestamp" # Format a datetime.datetime object.
+QUOTED    = "quoted"    # URL-quote a string.
+JSON      = "json"      # Encode the value in JSON format.
+
+# The fields to include when encoding a Posting object, as a list of
+# (attribute, kind) tuples:
+
+POSTING_FIELDS = [("postKey",            PLAIN),
+                  ("location",           PLAIN),
+                  ("category",           PLAIN),
+                  ("source",             PLAIN),
+                  ("heading",            PLAIN),
+                  ("body",               PLAIN),
+                  ("latitude",           PLAIN),
+                  ("longitude",          PLAIN),
+                  ("language",           PLAIN),
+                  ("price",              PLAIN),
+                  ("currency",           PLAIN),
+                  ("images",             NON_EMPTY),
+                  ("externalID",         PLAIN),
+                  ("externalURL",        PLAIN),
+                  ("accountName",        PLAIN),
+                  ("accountID",          PLAIN),
+                  ("timestamp",          TIMESTAMP),
+                  ("expiration",         TIMESTAMP),
+                  ("annotations",        NON_EMPTY),
+                  ("trustedAnnotations", NON_EMPTY),
+                  ("clickCount",         PLAIN)]
+
+# The fields to include when encoding a SearchQuery object:
+
+QUERY_FIELDS = [("source",             PLAIN),
+                ("category",           PLAIN),
+                ("location",           PLAIN),
+                ("heading",            QUOTED),
+                ("body",               QUOTED),
+                ("text",               QUOTED),
+                ("externalID",         PLAIN),
+                ("start",              TIMESTAMP),
+                ("end",                TIMESTAMP),
+                ("annotations",        JSON),
+                ("trustedAnnotations", JSON)]
+
+#############################################################################
+
+def compileEncoder(fields, name="encode"):
+    """ Generate a function which encodes an object as a dictionary.
+
+        'fields' is a list of (attribute, kind) tuples, as described above.
+        The returned function accepts a single object, and returns a
+        dictionary mapping each attribute name to its encoded value, leaving
+        out attributes which are None (or empty, for NON_EMPTY fields).
+    """
+    lines = ["def %s(obj):" % name,
+             "    result = {}"]
+    for attribute,kind in fields:
+        lines.append("    value = obj.%s" % attribute)
+        if kind == NON_EMPTY:
+            lines.append("    if value:")
+        else:
+            lines.append("    if value is not None:")
+
+        if kind in [PLAIN, NON_EMPTY]:
+            encoded = "value"
+        elif kind == TIMESTAMP:
+            encoded = "_formatTimestamp(value)"
+        elif kind == QUOTED:
+            encoded = "_quote(value)"
+        elif kind == JSON:
+            encoded = "_dumps(value)"
+        else:
+            raise RuntimeError("Unknown field kind: " + repr(kind))
+        lines.append("        result[%r] = %s" % (attribute, encoded))
+    lines.append("    return result")
+
+    namespace = {'_formatTimestamp' : formatTimestamp,
+                 '_quote'           : urllib.quote_plus,
+                 '_dumps'           : json.dumps}
+    exec compile("\n".join(lines) + "\n", "<%s>" % name, "exec") in namespace
+    return namespace[name]
+
+
+def formatTimestamp(timestamp):
+    """ Format a datetime.datetime object in the form used by 3taps.
+
+        This is equivalent to timestamp.strftime("%Y/%m/%d %H:%M:%S UTC"),
+        but several times faster.
+    """
+    return "%04d/%02d/%02d %02d:%02d:%02d UTC" % (timestamp.year,
+                                                  timestamp.month,
+                                                  timestamp.day,
+                                                  timestamp.hour,
+                                                  timestamp.minute,
+                                                  timestamp.second)
+
+#############################################################################
+
+encodePosting = compileEncoder(POSTING_FIELDS, "encodePosting")
+encodeQuery   = compileEncoder(QUERY_FIELDS, "encodeQuery")
+
+# A JSON encoder which converts Posting objects as it meets them, without
+# first building a list of dictionaries.
+
+_postingsEncoder = json.JSONEncoder(default=encodePosting,
+                                    separators=(",", ":"))
+
+def encodePostings(postings):
+    """ Return the given Posting objects, encoded as a JSON array.
+
+        'postings' can be any iterable.  Dictionaries in the list are encoded
+        as they are.
+    """
+    if not isinstance(postings, (list, tuple)):
+        postings = list(postings)
+    return _postingsEncoder.encode(postings)
+
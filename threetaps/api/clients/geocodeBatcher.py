@@ -0,0 +1,142 @@
+""" threetaps.api.clients.geocodeBatcher
+
+    This Python module implements the GeocodeBatcher class, which collects
+    geocoding requests from many threads and sends them to the geocoder in
+    batches.
+"""
+from threetaps.api.base.future import Future
+
+import Queue
+import threading
+import time
+
+#############################################################################
+
+class GeocodeBatcher:
+    """ Combine geocoding requests from concurrent callers into batches.
+
+        Callers submit one GeocodeRequest at a time, and receive a Future for
+        the matching GeocodeResponse.  A background thread collects the
+        submitted requests until either 'maxBatchSize' requests have arrived
+        or 'maxDelayMs' milliseconds have passed since the first request in
+        the batch, and then sends the whole batch to the server using a
+        single call to GeocoderAPIClient.geocode().
+
+        While a batch is being geocoded, the next batch continues to collect
+        requests, so batches naturally grow larger as the load increases.
+    """
+    def __init__(self, client, maxBatchSize=100, maxDelayMs=50,
+                 agentID=None, authID=None):
+        """ Standard initializer.
+
+            'client' is the GeocoderAPIClient to send the batches through.
+            'agentID' and 'authID' are passed on to each geocode() call.
+        """
+        self._client       = client
+        self._maxBatchSize = maxBatchSize
+        self._maxDelay     = maxDelayMs / 1000.0
+        self._agentID      = agentID
+        self._authID       = authID
+        self._queue        = Queue.Queue()
+        self._closed       = False
+        self._lock         = threading.Lock() # Guards _closed and the queue.
+
+        self._thread = threading.Thread(target=self._run,
+                                        name="GeocodeBatcher")
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+
+    def submit(self, request):
+        """ Submit a GeocodeRequest object for geocoding.
+
+            We return a Future object.  Calling its result() method will wait
+            for the request to be geocoded and return the GeocodeResponse
+            object for this request.
+        """
+        future = Future()
+
+        # The check and the put must happen together, so that no request can
+        # be queued after close() has queued the stop marker.
+
+        self._lock.acquire()
+        try:
+            if self._closed:
+                raise RuntimeError("GeocodeBatcher has been closed")
+            self._queue.put((request, future))
+        finally:
+            self._lock.release()
+        return future
+
+
+    def geocode(self, request, timeout=None):
+        """ Geocode a single GeocodeRequest object, waiting for the result.
+
+            This is a convenience method which submits the request and then
+            waits up to 'timeout' seconds for the GeocodeResponse object.
+        """
+        return self.submit(request).result(timeout)
+
+
+    def close(self):
+        """ Stop accepting requests, and wait for the pending ones to finish.
+        """
+        self._lock.acquire()
+        try:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        finally:
+            self._lock.release()
+        self._thread.join()
+
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _run(self):
+        """ Collect requests into batches, and geocode each batch in turn.
+
+            This is run in our background thread.
+        """
+        finished = False
+        while not finished:
+            entry = self._queue.get()
+            if entry == None:
+                break
+
+            batch    = [entry]
+            deadline = time.time() + self._maxDelay
+            while len(batch) < self._maxBatchSize:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = self._queue.get(True, remaining)
+                except Queue.Empty:
+                    break
+                if entry == None:
+                    finished = True
+                    break
+                batch.append(entry)
+
+            self._geocodeBatch(batch)
+
+
+    def _geocodeBatch(self, batch):
+        """ Geocode a batch of (request, future) tuples.
+
+            Each future is given the GeocodeResponse for its request.
+        """
+        requests = [request for request,future in batch]
+        try:
+            responses = self._client.geocode(requests, self._agentID,
+                                             self._authID)
+        except Exception,e:
+            for request,future in batch:
+                future.setError(e)
+            return
+
+        for (request,future),response in zip(batch, responses):
+            future.setResult(response)
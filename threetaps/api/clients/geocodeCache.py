@@ -0,0 +1,202 @@
+""" threetaps.api.clients.geocodeCache
+
+    This Python module implements the GeocodeCache class, which caches the
+    results of geocoding requests so that the same location doesn't have to be
+    geocoded more than once.
+"""
+import collections
+import sqlite3
+import threading
+import simplejson as json
+
+#############################################################################
+
+# The GeocodeRequest attributes which hold free-form strings.  These are
+# case-folded and have their whitespace collapsed before being used as part of
+# a cache key, so that "San  Francisco " and "san francisco" are treated as
+# the same request.
+
+TEXT_FIELDS = ["country", "state", "city", "locality", "street", "postal",
+               "text"]
+
+#############################################################################
+
+def normalizeRequest(request):
+    """ Return the normalized cache key for the given GeocodeRequest object.
+
+        Two GeocodeRequest objects which only differ in the case or spacing of
+        their text fields will have the same cache key.  Text fields which
+        aren't strings, such as a postal code given as a number, are
+        converted to strings first.  The latitude and longitude values (if
+        any) are included in the key unchanged.
+
+        The returned key is a string, suitable for storing on disk.
+    """
+    key = [request.latitude, request.longitude]
+    for field in TEXT_FIELDS:
+        value = getattr(request, field)
+        if value != None:
+            if not isinstance(value, basestring):
+                value = str(value)
+            value = " ".join(value.split()).lower()
+            if value == "":
+                value = None
+        key.append(value)
+    return json.dumps(key)
+
+#############################################################################
+
+class GeocodeCache:
+    """ A cache of geocoding results, keyed by normalized GeocodeRequest.
+
+        The cache holds the most recently used results in memory, discarding
+        the least recently used entry once 'maxEntries' results have been
+        stored.  If a 'path' is supplied, every result is also written to an
+        SQLite database at that path, which acts as a second, persistent tier
+        behind the in-memory cache; entries which have been discarded from
+        memory will be loaded back from disk as required.
+
+        A single GeocodeCache can safely be shared between several
+        GeocoderAPIClient objects and threads.
+    """
+    def __init__(self, maxEntries=10000, path=None):
+        """ Standard initializer.
+
+            'maxEntries' is the maximum number of results to hold in memory,
+            and 'path' is the (optional) path to the on-disk cache database.
+        """
+        self._maxEntries = maxEntries
+        self._entries    = collections.OrderedDict() # Maps key to result.
+        self._lock       = threading.Lock()
+        self._hits       = 0
+        self._misses     = 0
+
+        if path != None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS geocode (" +
+                             "key TEXT PRIMARY KEY, code TEXT, " +
+                             "latitude REAL, longitude REAL)")
+            self._db.commit()
+        else:
+            self._db = None
+
+
+    def get(self, key):
+        """ Return the cached result for the given key.
+
+            'key' should be a cache key, as returned by normalizeRequest().
+            If there is a cached result for this key, we return a
+            (code, latitude, longitude) tuple.  Otherwise, we return None.
+        """
+        self._lock.acquire()
+        try:
+            result = self._entries.pop(key, None)
+            if result == None and self._db != None:
+                row = self._db.execute("SELECT code,latitude,longitude " +
+                                       "FROM geocode WHERE key=?",
+                                       (key,)).fetchone()
+                if row != None:
+                    result = tuple(row)
+
+            if result == None:
+                self._misses = self._misses + 1
+                return None
+
+            self._hits = self._hits + 1
+            self._remember(key, result)
+            return result
+        finally:
+            self._lock.release()
+
+
+    def put(self, key, code, latitude, longitude):
+        """ Store a geocoding result in the cache.
+
+            'key' should be a cache key, as returned by normalizeRequest(), and
+            'code', 'latitude' and 'longitude' are the values returned by the
+            geocoder for that key.
+        """
+        self.putMany([(key, code, latitude, longitude)])
+
+
+    def putMany(self, entries):
+        """ Store several geocoding results in the cache at once.
+
+            'entries' should be a list of (key, code, latitude, longitude)
+            tuples, as passed to put().  The results are written to the
+            on-disk cache in a single transaction, so this is much faster
+            than calling put() for each result.
+        """
+        self._lock.acquire()
+        try:
+            for key,code,latitude,longitude in entries:
+                self._entries.pop(key, None)
+                self._remember(key, (code, latitude, longitude))
+            if self._db != None and len(entries) > 0:
+                self._db.executemany("INSERT OR REPLACE INTO geocode " +
+                                     "(key,code,latitude,longitude) " +
+                                     "VALUES (?,?,?,?)", entries)
+                self._db.commit()
+        finally:
+            self._lock.release()
+
+
+    def clear(self):
+        """ Remove all the entries from the cache, including the disk tier.
+        """
+        self._lock.acquire()
+        try:
+            self._entries.clear()
+            if self._db != None:
+                self._db.execute("DELETE FROM geocode")
+                self._db.commit()
+        finally:
+            self._lock.release()
+
+
+    def close(self):
+        """ Close the on-disk cache database, if there is one.
+        """
+        self._lock.acquire()
+        try:
+            if self._db != None:
+                self._db.close()
+                self._db = None
+        finally:
+            self._lock.release()
+
+
+    def getStats(self):
+        """ Return a dictionary with statistics about our cache usage.
+
+            The returned dictionary will have the following entries:
+
+                'hits'
+
+                    The number of times a cached result was found.
+
+                'misses'
+
+                    The number of times a result was not in the cache.
+
+                'size'
+
+                    The number of results currently held in memory.
+        """
+        return {'hits'   : self._hits,
+                'misses' : self._misses,
+                'size'   : len(self._entries)}
+
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _remember(self, key, result):
+        """ Add the given result to our in-memory cache.
+
+            If the cache is full, the least recently used entry is discarded.
+            Note that the caller must hold our lock.
+        """
+        self._entries[key] = result
+        while len(self._entries) > self._maxEntries:
+            self._entries.popitem(last=False)
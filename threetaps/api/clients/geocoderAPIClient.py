@@ -4,7 +4,13 @@
     related classes.
 """
 from threetaps.api.base import APIClient
+from threetaps.api.base import constants
+from threetaps.api.base.chunking import chunked, concurrentMap, ChunkStats
+from threetaps.api.clients.geocodeCache import GeocodeCache
+from threetaps.api.clients.geocodeCache import normalizeRequest
 
+import threading
+import time
 import simplejson as json
 
 #############################################################################
@@ -12,6 +18,93 @@ import simplejson as json
 class GeocoderAPIClient(APIClient):
     """ A client for the 3taps Geocoder API.
     """
+    def __init__(self, url=constants.DEFAULT_API_URL,
+                       port=constants.DEFAULT_API_PORT,
+                       transport=None):
+        """ Standard initializer.
+
+            The API client will use the given URL and HTTP port to access the
+            3taps APIs, sending requests through the given transport (if
+            any).
+        """
+        APIClient.__init__(self, url, port, transport)
+        self._cache             = None
+        self._chunkSize         = None
+        self._maxWorkers        = 1
+        self._maxFailedRequests = None
+        self._chunkStats        = ChunkStats()
+
+
+    def enableCaching(self, cache=None):
+        """ Turn on caching of geocoding results.
+
+            'cache' should be the GeocodeCache object to use.  If this is not
+            supplied, a new in-memory GeocodeCache will be created.  Note that
+            the same GeocodeCache object can be shared by several
+            GeocoderAPIClients.
+
+            Once caching has been enabled, geocode() will only ask the server
+            to geocode requests which are not already in the cache.
+        """
+        if cache == None:
+            cache = GeocodeCache()
+        self._cache = cache
+
+
+    def disableCaching(self):
+        """ Turn off caching of geocoding results.
+        """
+        self._cache = None
+
+
+    def getCache(self):
+        """ Return the GeocodeCache object we are using, if any.
+        """
+        return self._cache
+
+
+    def enableChunking(self, chunkSize=1000, maxWorkers=4,
+                       maxFailedRequests=50):
+        """ Turn on chunking of large geocoding requests.
+
+            Once chunking has been enabled, geocode() will split its list of
+            requests into chunks of at most 'chunkSize' requests, and send up
+            to 'maxWorkers' of these chunks to the server at once.
+
+            If the server rejects a chunk, it is split in half and each half
+            is retried separately, so that a single bad request can only cause
+            itself to fail rather than the whole batch.  Chunks which fail
+            because the server couldn't be reached, or returned a server
+            error, are not split.  To avoid hammering a server which is down,
+            at most 'maxFailedRequests' requests can fail during each call to
+            geocode(); any requests left unsent after that are not geocoded.
+        """
+        self._chunkSize         = chunkSize
+        self._maxWorkers        = maxWorkers
+        self._maxFailedRequests = maxFailedRequests
+
+
+    def disableChunking(self):
+        """ Turn off chunking of large geocoding requests.
+
+            All the requests passed to geocode() will be sent to the server at
+            once, and if this fails none of the requests will be geocoded.
+        """
+        self._chunkSize         = None
+        self._maxWorkers        = 1
+        self._maxFailedRequests = None
+
+
+    def getChunkStats(self):
+        """ Return statistics about the requests sent to the geocoder.
+
+            We return a dictionary with statistics about the latency of the
+            chunks sent to the server.  Refer to ChunkStats.getStats() for a
+            description of the returned dictionary.
+        """
+        return self._chunkStats.getStats()
+
+
     def geocode(self, requests, agentID=None, authID=None):
         """ Ask the geocoder to geocode one or more postings.
 
@@ -34,9 +127,139 @@ class GeocoderAPIClient(APIClient):
 
             Note that the 'agentID' and 'authID' values are currently ignored.
 
+            Requests which only differ in the case or spacing of their text
+            fields are only sent to the server once, and if caching has been
+            enabled, requests which have already been geocoded are answered
+            directly from the cache.  If chunking has been enabled, large lists
+            of requests are sent to the server in chunks.
+
             Upon completion, we return a list of GeocodeResponse objects, one
             for each entry in the 'requests' list.
         """
+        results   = [None] * len(requests) # (code,lat,long) for each request.
+        unique    = []                     # List of (key, request) tuples.
+        positions = {}                     # Maps key to list of indexes.
+
+        for i,request in enumerate(requests):
+            key = normalizeRequest(request)
+            if key in positions:
+                positions[key].append(i)
+                continue
+            if self._cache != None:
+                cached = self._cache.get(key)
+                if cached != None:
+                    results[i] = cached
+                    continue
+            positions[key] = [i]
+            unique.append((key, request))
+
+        if len(unique) > 0:
+            geocoded = self._sendGeocode([request for key,request in unique],
+                                         agentID, authID)
+            toCache  = [] # List of (key, code, latitude, longitude) tuples.
+            for (key,request),result in zip(unique, geocoded):
+                if result == None:
+                    continue
+                toCache.append((key,) + result)
+                for i in positions[key]:
+                    results[i] = result
+            if self._cache != None:
+                self._cache.putMany(toCache)
+
+        responses = []
+        for result in results:
+            if result == None:
+                # An error occurred -> can't geocode this request.
+                responses.append(GeocodeResponse())
+            else:
+                code,latitude,longitude = result
+                responses.append(GeocodeResponse(code=code,
+                                                 latitude=latitude,
+                                                 longitude=longitude))
+        return responses
+
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _sendGeocode(self, requests, agentID, authID):
+        """ Geocode a list of GeocodeRequest objects, chunking as required.
+
+            Upon completion, we return a list of (code, latitude, longitude)
+            tuples, one for each entry in the 'requests' list.  The list entry
+            will be None for any request which could not be geocoded.
+        """
+        if self._chunkSize == None:
+            results,rejected = self._sendChunk(requests, agentID, authID)
+            if results == None:
+                results = [None] * len(requests)
+            return results
+
+        budget = _FailureBudget(self._maxFailedRequests)
+
+        def geocodeChunk(chunk):
+            return self._sendIsolatedChunk(chunk, agentID, authID, budget)
+
+        chunks = list(chunked(requests, self._chunkSize))
+
+        results = []
+        for chunkResult in concurrentMap(geocodeChunk, chunks,
+                                         min(self._maxWorkers, len(chunks))):
+            results.extend(chunkResult)
+        return results
+
+
+    def _sendIsolatedChunk(self, requests, agentID, authID, budget):
+        """ Geocode a chunk of requests, isolating any failures.
+
+            If the server rejects the chunk, we split it in half and try again
+            with each half, so that only the bad request(s) end up failing.
+            'budget' is the _FailureBudget for the current geocode() call; no
+            more requests are sent once it has been used up.  We return a
+            list of (code, latitude, longitude) tuples, with None for the
+            requests which could not be geocoded.
+        """
+        if budget.isExhausted():
+            return [None] * len(requests)
+
+        results,rejected = self._sendChunk(requests, agentID, authID)
+        if results != None:
+            return results
+
+        budget.recordFailure()
+        if not rejected or len(requests) == 1:
+            return [None] * len(requests)
+
+        middle = len(requests) / 2
+        return self._sendIsolatedChunk(requests[:middle], agentID, authID,
+                                       budget) \
+             + self._sendIsolatedChunk(requests[middle:], agentID, authID,
+                                       budget)
+
+
+    def _sendChunk(self, requests, agentID, authID):
+        """ Send a list of GeocodeRequest objects to the geocoder.
+
+            We return a (results, rejected) tuple, as described for
+            _sendGeocodeRequest().
+        """
+        startTime        = time.time()
+        results,rejected = self._sendGeocodeRequest(requests, agentID, authID)
+        elapsed          = time.time() - startTime
+
+        self._chunkStats.record(len(requests), elapsed, results != None)
+        return (results, rejected)
+
+
+    def _sendGeocodeRequest(self, requests, agentID, authID):
+        """ Send a single geocoding request to the server.
+
+            We return a (results, rejected) tuple.  'results' is a list of
+            (code, latitude, longitude) tuples, one for each entry in the
+            'requests' list, or None if an error occurred.  'rejected' is True
+            if the server rejected the request itself (with an HTTP 4xx
+            status code), rather than failing to answer it.
+        """
         data = []
         for request in requests:
             posting = {}
@@ -69,21 +292,56 @@ class GeocoderAPIClient(APIClient):
 
         response = self.sendRequest("geocoder/geocode", "POST", **args)
 
-        if (response == None) or (response['status'] != 200):
-            # An error occurred -> can't geocode anything.
-            responses = []
-            for i in range(len(requests)):
-                responses.append(GeocodeResponse())
-            return responses
+        if response == None:
+            return (None, False) # Couldn't reach the server.
+
+        if response['status'] != 200:
+            return (None, 400 <= response['status'] < 500)
 
         results = json.loads(response['contents'])
+        if len(results) != len(requests):
+            return (None, False) # Should never happen.
 
-        responses = []
+        geocoded = []
         for code,latitude,longitude in results:
-            responses.append(GeocodeResponse(code=code,
-                                             latitude=latitude,
-                                             longitude=longitude))
-        return responses
+            geocoded.append((code, latitude, longitude))
+        return (geocoded, False)
+
+#############################################################################
+
+class _FailureBudget:
+    """ The number of failed requests allowed during one geocode() call.
+
+        This is shared between the threads sending the call's chunks.  A
+        limit of None allows any number of failures.
+    """
+    def __init__(self, maxFailures):
+        """ Standard initializer.
+        """
+        self._maxFailures = maxFailures
+        self._numFailures = 0
+        self._lock        = threading.Lock()
+
+
+    def recordFailure(self):
+        """ Record a failed request.
+        """
+        self._lock.acquire()
+        try:
+            self._numFailures = self._numFailures + 1
+        finally:
+            self._lock.release()
+
+
+    def isExhausted(self):
+        """ Return True if no more requests should be sent.
+        """
+        self._lock.acquire()
+        try:
+            return self._maxFailures != None \
+               and self._numFailures >= self._maxFailures
+        finally:
+            self._lock.release()
 
 #############################################################################
 
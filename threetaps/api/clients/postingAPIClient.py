@@ -4,7 +4,12 @@
 """
 from threetaps.api.base   import APIClient
 from threetaps.api.models import Posting
+from threetaps.api.base.chunking import chunked, concurrentMap
+from threetaps.api.base.resilience import RetryPolicy
+from threetaps.api.clients.encoders import encodePosting, encodePostings
 
+import itertools
+import time
 import simplejson as json
 
 #############################################################################
@@ -37,12 +42,11 @@ class PostingAPIClient(APIClient):
             Note that if the 3taps server cannot be contacted for some reason,
             we return None.
         """
-        response = self.sendRequest("posting/get/" + postKey)
+        results = self.sendJSONRequest("posting/get/" + postKey)
 
-        if (response == None) or (response['status'] != 200):
+        if results == None:
             return None # An error occurred.
 
-        results = json.loads(response['contents'])
         if "code" in results and "message" in results:
             # We received an error object rather than the desired posting ->
             # the posting doesn't exist.
@@ -109,22 +113,110 @@ class PostingAPIClient(APIClient):
                     an "error" entry in the response dictionary.
 
             Note that if the 3taps server cannot be contacted for some reason,
-            we return None.
+            we return None.  To create a very large number of postings, use
+            createStream() instead.
         """
-        postingDicts = []
-        for posting in postings:
-            postingDicts.append(self._postingToDict(posting))
+        return self._createChunk(postings)
+
+
+    def createStream(self, postings, chunkSize=1000, maxWorkers=1,
+                     journal=None):
+        """ Create a large number of new postings in the 3taps system.
+
+            'postings' can be a list or any other iterable yielding Posting
+            objects, such as a generator reading postings from a file.  The
+            postings are sent to the server in chunks of at most 'chunkSize'
+            postings, with up to 'maxWorkers' chunks being sent at once.
+            Postings are only read from 'postings' as they are needed, so at
+            most 'maxWorkers' chunks are held in memory at any time.
+
+            We return an iterator which yields the response for each posting
+            in turn, in the same order as the 'postings'.  Each response is a
+            dictionary in the format returned by createMany().  If a chunk
+            could not be sent to the server, None is yielded for each posting
+            in that chunk.
+
+            If 'journal' is given, it should be a
+            threetaps.tools.IngestJournal object.  Each chunk is recorded in
+            the journal before it is sent, and the server's responses are
+            recorded afterwards.  If the journal was left behind by an earlier
+            run which didn't finish, the batches which the server didn't
+            acknowledge are resent first, and their responses yielded before
+            any others.  The postings already recorded in the journal are
+            then skipped, so 'postings' must yield the same postings in the
+            same order as it did for the earlier run.
+        """
+        if journal == None:
+            batches = ((None, len(chunk), chunk)
+                       for chunk in chunked(postings, chunkSize))
+        else:
+            batches = self._journalBatches(postings, chunkSize, journal)
+
+        def createChunk(batch):
+            batchId,numPostings,chunk = batch
+            responses = self._createChunk(chunk)
+            if journal != None and responses != None:
+                journal.logResults(batchId, responses)
+            return (numPostings, responses)
+
+        for numPostings,responses in concurrentMap(createChunk, batches,
+                                                   maxWorkers):
+            if responses == None:
+                for i in range(numPostings):
+                    yield None
+            else:
+                for response in responses:
+                    yield response
+
+
+    def createWithRetries(self, postings, chunkSize=1000, retryPolicy=None,
+                          maxFailedRequests=50):
+        """ Create postings, retrying those which fail for temporary reasons.
+
+            'postings' should be a list or other iterable of Posting objects,
+            which are sent to the server in chunks of at most 'chunkSize'
+            postings.  We return a CreateResult object describing the outcome
+            for each posting.
+
+            If the server rejects a posting with an error code which is in
+            'retryPolicy.retryStatuses', that posting is retried; postings
+            rejected with any other code are not.  If an entire request
+            fails, its chunk is split in half and each half sent separately,
+            so that a "poison" posting which makes the whole request fail is
+            isolated without holding back the others.  Once a single posting
+            has been isolated like this, it is counted as a poison posting if
+            the server rejected it with an HTTP 4xx status code, or if it has
+            failed on its own during more than one attempt.
+
+            The retryable postings are re-chunked and sent again, up to a
+            total of 'retryPolicy.maxAttempts' attempts, waiting between
+            attempts as described by the RetryPolicy.  If 'retryPolicy' is
+            None, the default RetryPolicy is used.  To avoid hammering a
+            server which is down, at most 'maxFailedRequests' requests can
+            fail during each attempt; any postings left unsent after that are
+            treated as retryable.
+        """
+        if retryPolicy == None:
+            retryPolicy = RetryPolicy()
 
-        postingData = json.dumps(postingDicts)
+        result  = CreateResult(list(postings))
+        pending = range(len(result.postings))
 
-        response = self.sendRequest("posting/create", "POST",
-                                    postings=postingData)
+        for attempt in range(retryPolicy.maxAttempts):
+            if attempt > 0:
+                time.sleep(retryPolicy.getDelay(attempt - 1))
 
-        if (response == None) or (response['status'] != 200):
-            return None # An error occurred.
+            failures = [0] # Number of failed requests in this attempt.
+            for chunk in chunked(pending, chunkSize):
+                self._createBisecting(result, chunk, retryPolicy, failures,
+                                      maxFailedRequests)
 
-        results = json.loads(response['contents'])
-        return results
+            result.numAttempts = attempt + 1
+            pending = result._getUnfinished()
+            if len(pending) == 0:
+                break
+
+        return result
 
 
     def update(self, posting):
@@ -152,24 +244,22 @@ class PostingAPIClient(APIClient):
             Upon completion, we return True if and only if the update request
             was successful.
         """
-        updates = []
-        for posting in postings:
-            postingDict = self._postingToDict(posting)
-            if 'postKey' in postingDict:
-                postKey = postingDict['postKey']
-                del postingDict['postKey']
-                updates.append((postKey, postingDict))
+        return self._updateChunk(postings)
 
-        data = json.dumps(updates)
 
-        response = self.sendRequest("posting/update", "POST",
-                                    data=data)
+    def updateStream(self, postings, chunkSize=1000, maxWorkers=1):
+        """ Update a large number of postings in the 3taps system.
 
-        if (response == None) or (response['status'] != 200):
-            return False # An error occurred.
+            'postings' can be a list or any other iterable yielding Posting
+            objects, which are sent to the server in chunks as described for
+            createStream().
 
-        results = json.loads(response['contents'])
-        return results['success']
+            We return an iterator which yields True or False for each posting
+            in turn, depending on whether the update request for that
+            posting's chunk was successful.
+        """
+        return self._sendStream(self._updateChunk, postings, chunkSize,
+                                maxWorkers)
 
 
     def delete(self, postKey):
@@ -189,16 +279,22 @@ class PostingAPIClient(APIClient):
             completion, we return True if and only if all the postings were
             successfully deleted.
         """
-        data = json.dumps(postKeys)
+        return self._deleteChunk(postKeys)
 
-        response = self.sendRequest("posting/delete", "POST",
-                                    data=data)
 
-        if (response == None) or (response['status'] != 200):
-            return False # An error occurred.
+    def deleteStream(self, postKeys, chunkSize=1000, maxWorkers=1):
+        """ Delete a large number of postings from the 3taps system.
 
-        results = json.loads(response['contents'])
-        return results['success']
+            'postKeys' can be a list or any other iterable yielding posting
+            keys, which are sent to the server in chunks as described for
+            createStream().
+
+            We return an iterator which yields True or False for each posting
+            key in turn, depending on whether the postings in that key's chunk
+            were successfully deleted.
+        """
+        return self._sendStream(self._deleteChunk, postKeys, chunkSize,
+                                maxWorkers)
 
     # =====================
     # == PRIVATE METHODS ==
@@ -210,51 +306,316 @@ class PostingAPIClient(APIClient):
             We create a dictionary with key/value entries matching the contents
             of the given Posting object.
         """
-        postDict = {}
-        if posting.postKey != None:
-            postDict['postKey'] = posting.postKey
-        if posting.location != None:
-            postDict['location'] = posting.location
-        if posting.category != None:
-            postDict['category'] = posting.category
-        if posting.source != None:
-            postDict['source'] = posting.source
-        if posting.heading != None:
-            postDict['heading'] = posting.heading
-        if posting.body != None:
-            postDict['body'] = posting.body
-        if posting.latitude != None:
-            postDict['latitude'] = posting.latitude
-        if posting.longitude != None:
-            postDict['longitude'] = posting.longitude
-        if posting.language != None:
-            postDict['language'] = posting.language
-        if posting.price != None:
-            postDict['price'] = posting.price
-        if posting.currency != None:
-            postDict['currency'] = posting.currency
-        if posting.images != None and len(posting.images) > 0:
-            postDict['images'] = posting.images
-        if posting.externalID != None:
-            postDict['externalID'] = posting.externalID
-        if posting.externalURL != None:
-            postDict['externalURL'] = posting.externalURL
-        if posting.accountName != None:
-            postDict['accountName'] = posting.accountName
-        if posting.accountID != None:
-            postDict['accountID'] = posting.accountID
-        if posting.timestamp != None:
-            postDict['timestamp'] = \
-                posting.timestamp.strftime("%Y/%m/%d %H:%M:%S UTC")
-        if posting.expiration != None:
-            postDict['expiration'] = \
-                posting.expiration.strftime("%Y/%m/%d %H:%M:%S UTC")
-        if posting.annotations != None and len(posting.annotations) > 0:
-            postDict['annotations'] = posting.annotations
-        if posting.trustedAnnotations != None \
-           and len(posting.trustedAnnotations) > 0:
-            postDict['trustedAnnotations'] = posting.trustedAnnotations
-        if posting.clickCount != None:
-            postDict['clickCount'] = posting.clickCount
-        return postDict
+        return encodePosting(posting)
+
+
+    def _createChunk(self, postings):
+        """ Send a single posting/create request.
+
+            'postings' is a list of postings, or a string holding the
+            postings already encoded as a JSON array.  We return the list of
+            responses, or None if an error occurred.
+        """
+        if isinstance(postings, basestring):
+            postingData = postings
+        else:
+            postingData = encodePostings(postings)
+
+        return self.sendJSONRequest("posting/create", "POST",
+                                    postings=postingData)
+
+
+    def _sendCreateRequest(self, postings):
+        """ Send a single posting/create request for createWithRetries().
+
+            We return a (responses, rejected) tuple.  'responses' is the list
+            of responses, one for each posting, or None if an error occurred.
+            'rejected' is True if the server rejected the request itself
+            (with an HTTP 4xx status code), rather than failing to answer it.
+        """
+        response = self.sendRequest("posting/create", "POST",
+                                    postings=encodePostings(postings))
+        if response == None:
+            return (None, False) # Couldn't reach the server.
+
+        if response['status'] != 200:
+            return (None, 400 <= response['status'] < 500)
+
+        responses = json.loads(response['contents'])
+        if len(responses) != len(postings):
+            return (None, False) # Should never happen.
+
+        return (responses, False)
+
+
+    def _createBisecting(self, result, indices, retryPolicy, failures,
+                         maxFailedRequests):
+        """ Send the postings with the given indices, bisecting on failure.
+
+            The responses are recorded in the given CreateResult object.  If
+            the request fails, the postings are split in half and each half
+            sent in turn.  A single posting whose request fails is only
+            counted as poison if the server rejected it, or if it has already
+            failed on its own during an earlier attempt; otherwise the
+            failure may be due to an outage, so it is left retryable.
+
+            'failures' is a single-item list holding the number of requests
+            which have failed so far; once this reaches 'maxFailedRequests',
+            no more requests are sent.
+        """
+        if failures[0] >= maxFailedRequests:
+            for i in indices:
+                result._record(i, CreateResult.RETRYABLE, None)
+            return
+
+        responses,rejected = self._sendCreateRequest([result.postings[i]
+                                                      for i in indices])
+        if responses == None:
+            failures[0] = failures[0] + 1
+            if len(indices) == 1:
+                index     = indices[0]
+                numFailed = result._isolatedFailures[index] + 1
+                result._isolatedFailures[index] = numFailed
+                if rejected or numFailed > 1:
+                    result._record(index, CreateResult.POISON, None)
+                else:
+                    result._record(index, CreateResult.RETRYABLE, None)
+            else:
+                half = len(indices) / 2
+                self._createBisecting(result, indices[:half], retryPolicy,
+                                      failures, maxFailedRequests)
+                self._createBisecting(result, indices[half:], retryPolicy,
+                                      failures, maxFailedRequests)
+            return
+
+        for i,response in zip(indices, responses):
+            error = response.get("error")
+            if error == None:
+                result._record(i, CreateResult.SUCCESS, response)
+            elif error.get("code") in retryPolicy.retryStatuses:
+                result._record(i, CreateResult.RETRYABLE, response)
+            else:
+                result._record(i, CreateResult.PERMANENT, response)
+
+
+    def _journalBatches(self, postings, chunkSize, journal):
+        """ Split the given postings into batches recorded in a journal.
+
+            We yield a (batchId, numPostings, postingData) tuple for each
+            batch, where 'postingData' is the batch's postings encoded as a
+            JSON array.  The unacknowledged batches from an earlier run are
+            yielded first, followed by the postings which aren't already in
+            the journal.  Each new batch is logged before it is yielded.
+        """
+        numSkipped = journal.getNumPostings()
+
+        for batchId,pending in journal.getPending():
+            yield (batchId, len(pending), encodePostings(pending))
+
+        remaining = itertools.islice(postings, numSkipped, None)
+        for chunk in chunked(remaining, chunkSize):
+            postingData = encodePostings(chunk)
+            batchId     = journal.logBatch(postingData, len(chunk))
+            yield (batchId, len(chunk), postingData)
+
+
+    def _updateChunk(self, postings):
+        """ Send a single posting/update request.
+
+            We return True if and only if the request was successful.
+        """
+        updates = []
+        for posting in postings:
+            postingDict = self._postingToDict(posting)
+            if 'postKey' in postingDict:
+                postKey = postingDict['postKey']
+                del postingDict['postKey']
+                updates.append((postKey, postingDict))
+
+        data = json.dumps(updates)
+
+        results = self.sendJSONRequest("posting/update", "POST",
+                                       data=data)
+
+        if results == None:
+            return False # An error occurred.
+
+        return results['success']
+
+
+    def _deleteChunk(self, postKeys):
+        """ Send a single posting/delete request.
+
+            We return True if and only if the request was successful.
+        """
+        data = json.dumps(list(postKeys))
 
+        results = self.sendJSONRequest("posting/delete", "POST",
+                                       data=data)
+
+        if results == None:
+            return False # An error occurred.
+
+        return results['success']
+
+
+    def _sendStream(self, function, items, chunkSize, maxWorkers):
+        """ Apply 'function' to each chunk of items, yielding its result
+            once for each item in the chunk.
+
+            This implements updateStream() and deleteStream().
+        """
+        def sendChunk(chunk):
+            return (len(chunk), function(chunk))
+
+        for numItems,success in concurrentMap(sendChunk,
+                                              chunked(items, chunkSize),
+                                              maxWorkers):
+            for i in range(numItems):
+                yield success
+
+#############################################################################
+
+class CreateResult:
+    """ The outcome of a PostingAPIClient.createWithRetries() call.
+
+        A CreateResult object has the following public attributes:
+
+            postings
+
+                The list of Posting objects which were sent.
+
+            numAttempts
+
+                The number of attempts made to send the postings.
+
+        Each posting ends up with one of the following statuses:
+
+            SUCCESS
+
+                The posting was created.
+
+            PERMANENT
+
+                The server rejected the posting with an error which won't go
+                away if the posting is sent again.
+
+            RETRYABLE
+
+                The server rejected the posting with a temporary error, or the
+                posting couldn't be sent at all, on every attempt.
+
+            POISON
+
+                The posting was sent on its own and the whole request failed,
+                either because the server rejected it with an HTTP 4xx status
+                code or because it failed like this on more than one attempt.
+
+        The methods below return the indexes into the 'postings' list of the
+        postings with each status.
+    """
+    SUCCESS   = "success"
+    PERMANENT = "permanent"
+    RETRYABLE = "retryable"
+    POISON    = "poison"
+
+    def __init__(self, postings):
+        """ Standard initializer.
+        """
+        self.postings    = postings
+        self.numAttempts = 0
+
+        self._statuses         = [self.RETRYABLE] * len(postings)
+        self._responses        = [None] * len(postings)
+        self._isolatedFailures = [0] * len(postings)
+
+
+    def isComplete(self):
+        """ Return True if and only if every posting was created.
+        """
+        return len(self.getSuccesses()) == len(self.postings)
+
+
+    def getStatus(self, index):
+        """ Return the status of the posting with the given index.
+        """
+        return self._statuses[index]
+
+
+    def getPostKeys(self):
+        """ Return the posting key for each posting.
+
+            We return a list with one entry for each posting, which is the
+            posting's newly-allocated key, or None if it wasn't created.
+        """
+        postKeys = []
+        for response in self._responses:
+            if response != None and "postKey" in response:
+                postKeys.append(response['postKey'])
+            else:
+                postKeys.append(None)
+        return postKeys
+
+
+    def getSuccesses(self):
+        """ Return a list of (index, postKey) tuples for the created postings.
+
+            'postKey' is None if the server didn't return a key.
+        """
+        return [(i, self._responses[i].get("postKey"))
+                for i in self._getIndexes(self.SUCCESS)]
+
+
+    def getPermanentErrors(self):
+        """ Return a list of (index, error) tuples for rejected postings.
+
+            'error' is the dictionary with 'code' and 'message' entries which
+            was returned by the server.
+        """
+        return [(i, self._responses[i]['error'])
+                for i in self._getIndexes(self.PERMANENT)]
+
+
+    def getRetryableErrors(self):
+        """ Return a list of (index, error) tuples for temporary failures.
+
+            'error' is the dictionary returned by the server, or None if the
+            posting could not be sent.
+        """
+        results = []
+        for i in self._getIndexes(self.RETRYABLE):
+            if self._responses[i] != None:
+                results.append((i, self._responses[i].get("error")))
+            else:
+                results.append((i, None))
+        return results
+
+
+    def getPoisonPostings(self):
+        """ Return the indexes of the postings which fail a whole request.
+        """
+        return self._getIndexes(self.POISON)
+
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _record(self, index, status, response):
+        """ Record the outcome of sending a single posting.
+        """
+        self._statuses[index]  = status
+        self._responses[index] = response
+
+
+    def _getIndexes(self, status):
+        """ Return the indexes of the postings with the given status.
+        """
+        return [i for i in range(len(self._statuses))
+                if self._statuses[i] == status]
+
+
+    def _getUnfinished(self):
+        """ Return the indexes of the postings which should be sent again.
+        """
+        return [i for i in range(len(self._statuses))
+                if self._statuses[i] in [self.RETRYABLE, self.POISON]]
@@ -0,0 +1,230 @@
+""" threetaps.api.clients.queryFilter
+
+    This Python module implements the QueryFilter class, which matches
+    postings against a SearchQuery locally, without asking the 3taps server.
+
+    Like the encoders in threetaps.api.clients.encoders, each QueryFilter
+    generates and compiles a specialised Python function for its query, so
+    that the query's criteria are only examined once, rather than once for
+    every posting tested.
+"""
+from threetaps.api.clients.encoders import formatTimestamp
+
+import datetime
+
+#############################################################################
+
+class QueryFilter:
+    """ A SearchQuery compiled into a fast local filter.
+
+        The query's criteria are applied in the same way as the 3taps search
+        API applies them:
+
+            source, externalID
+
+                The posting's field must equal the given value.
+
+            category, location
+
+                The posting's field must equal one of the given values, which
+                are separated by "+OR+".
+
+            heading, body, text
+
+                The given string must occur in the posting's heading, body,
+                or either of these, respectively.  The match ignores case.
+
+            start, end
+
+                The posting's timestamp must be no earlier than 'start', and
+                no later than 'end'.  The posting's timestamp can either be a
+                datetime.datetime object or a string in the 3taps format.
+
+            annotations, trustedAnnotations
+
+                Each of the given key/value pairs must be present in the
+                posting's annotations or trusted annotations.
+
+        A posting which is missing a field being tested doesn't match.
+    """
+    def __init__(self, query):
+        """ Standard initializer.
+
+            'query' is the SearchQuery object to compile.
+        """
+        self._namespace  = {'_timestamp' : _timestampKey}
+        self._conditions = self._buildConditions(query)
+
+        self._matches       = self._compile(_rowSource, "matches")
+        self._filterColumns = self._compile(_columnSource, "filterColumns")
+
+
+    def matches(self, posting):
+        """ Return True if the given Posting object matches our query.
+        """
+        return self._matches(posting)
+
+
+    def filter(self, postings):
+        """ Return the Posting objects which match our query.
+
+            'postings' can be a list or any other iterable.  We return a list
+            of the matching postings, in the same order.
+        """
+        matches = self._matches
+        return [posting for posting in postings if matches(posting)]
+
+
+    def filterColumns(self, columns):
+        """ Return the indexes of the matching postings in a columnar batch.
+
+            'columns' is a dictionary mapping Posting field names to a list
+            of values, with one entry for each posting in the batch; all the
+            lists must be the same length.  Fields which are missing from
+            'columns' are treated as None for every posting.
+
+            We return a list of the indexes of the postings which match our
+            query, in ascending order.  Each criterion is applied to the
+            whole batch in turn, starting with the cheapest, so that later
+            criteria only examine the postings which are still candidates.
+        """
+        if len(columns) == 0:
+            return []
+        return self._filterColumns(columns, len(columns.values()[0]))
+
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _buildConditions(self, query):
+        """ Convert the given SearchQuery into a list of conditions.
+
+            Each condition is a (fields, expression) tuple, where 'fields' is
+            a list of the Posting fields the condition uses, and 'expression'
+            is a Python expression to test, with a "%(field)s" placeholder
+            for the value of each field.  The conditions are returned in the
+            order in which they should be tested, cheapest first.
+        """
+        conditions = []
+
+        for field in ["source", "externalID"]:
+            value = getattr(query, field)
+            if value != None:
+                name = self._addConstant(field, value)
+                conditions.append(([field], "%(" + field + ")s == " + name))
+
+        for field in ["category", "location"]:
+            value = getattr(query, field)
+            if value != None:
+                name = self._addConstant(field,
+                                         frozenset(value.split("+OR+")))
+                conditions.append(([field], "%(" + field + ")s in " + name))
+
+        if query.start != None:
+            name = self._addConstant("start", formatTimestamp(query.start))
+            conditions.append((["timestamp"],
+                               "_timestamp(%(timestamp)s) >= " + name))
+        if query.end != None:
+            name = self._addConstant("end", formatTimestamp(query.end))
+            conditions.append((["timestamp"],
+                               "%(timestamp)s is not None and " +
+                               "_timestamp(%(timestamp)s) <= " + name))
+
+        for field in ["annotations", "trustedAnnotations"]:
+            criteria = getattr(query, field)
+            if criteria:
+                tests = ["%(" + field + ")s is not None"]
+                for key,value in sorted(criteria.items()):
+                    tests.append("%(" + field + ")s.get(" +
+                                 self._addConstant("key", key) + ") == " +
+                                 self._addConstant("value", value))
+                conditions.append(([field], " and ".join(tests)))
+
+        for field in ["heading", "body"]:
+            value = getattr(query, field)
+            if value != None:
+                name = self._addConstant(field, value.lower())
+                conditions.append(([field],
+                                   "%(" + field + ")s is not None and " +
+                                   name + " in %(" + field + ")s.lower()"))
+
+        if query.text != None:
+            name = self._addConstant("text", query.text.lower())
+            conditions.append((["heading", "body"],
+                               "(%(heading)s is not None and " +
+                               name + " in %(heading)s.lower()) or " +
+                               "(%(body)s is not None and " +
+                               name + " in %(body)s.lower())"))
+
+        return conditions
+
+
+    def _addConstant(self, prefix, value):
+        """ Add a constant to the namespace of our generated functions.
+
+            We return the name of the constant.
+        """
+        name = "_%s%d" % (prefix, len(self._namespace))
+        self._namespace[name] = value
+        return name
+
+
+    def _compile(self, generator, name):
+        """ Generate and compile one of our functions.
+
+            'generator' is either _rowSource or _columnSource.
+        """
+        source = generator(self._conditions, name)
+        exec compile(source, "<QueryFilter.%s>" % name, "exec") \
+            in self._namespace
+        return self._namespace[name]
+
+#############################################################################
+
+def _rowSource(conditions, name):
+    """ Return the source code for a function testing a single posting.
+    """
+    lines = ["def %s(posting):" % name]
+    for fields,expression in conditions:
+        values = dict([(field, "posting." + field) for field in fields])
+        lines.append("    if not (%s):" % (expression % values))
+        lines.append("        return False")
+    lines.append("    return True")
+    return "\n".join(lines) + "\n"
+
+
+def _columnSource(conditions, name):
+    """ Return the source code for a function filtering a columnar batch.
+    """
+    lines = ["def %s(columns, numRows):" % name,
+             "    indexes = range(numRows)"]
+
+    fields = []
+    for conditionFields,expression in conditions:
+        for field in conditionFields:
+            if field not in fields:
+                fields.append(field)
+    for field in fields:
+        lines.append("    column_%s = columns.get(%r)" % (field, field))
+        lines.append("    if column_%s is None:" % field)
+        lines.append("        column_%s = [None] * numRows" % field)
+
+    for conditionFields,expression in conditions:
+        values = dict([(field, "column_%s[i]" % field)
+                       for field in conditionFields])
+        lines.append("    indexes = [i for i in indexes if %s]" %
+                     (expression % values))
+    lines.append("    return indexes")
+    return "\n".join(lines) + "\n"
+
+#############################################################################
+
+def _timestampKey(timestamp):
+    """ Return a posting's timestamp as a string which can be compared.
+
+        'timestamp' can be a datetime.datetime object, a string in the 3taps
+        format, or None.
+    """
+    if isinstance(timestamp, datetime.datetime):
+        return formatTimestamp(timestamp)
+    return timestamp
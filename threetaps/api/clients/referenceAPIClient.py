@@ -7,8 +7,6 @@ from threetaps.api.models import Category, Annotation, AnnotationOption
 from threetaps.api.models import Location
 from threetaps.api.models import Source
 
-import simplejson as json
-
 #############################################################################
 
 class ReferenceAPIClient(APIClient):
@@ -30,13 +28,11 @@ class ReferenceAPIClient(APIClient):
         else:
             request = "reference/category?annotations=false"
 
-        response = self.sendRequest(request)
+        results = self.sendJSONRequest(request)
 
-        if (response == None) or (response['status'] != 200):
+        if results == None:
             return None # An error occurred.
 
-        results = json.loads(response['contents'])
-
         categories = []
         for cat in results:
             category = self._parseCategory(cat)
@@ -60,12 +56,11 @@ class ReferenceAPIClient(APIClient):
         else:
             request = "reference/category/"+categoryCode+"?annotations=false"
 
-        response = self.sendRequest(request)
+        results = self.sendJSONRequest(request)
 
-        if (response == None) or (response['status'] != 200):
+        if results == None:
             return None # An error occurred.
 
-        results = json.loads(response['contents'])
         if len(results) != 1:
             return None # Should never happen.
 
@@ -79,13 +74,11 @@ class ReferenceAPIClient(APIClient):
             the master list of all known 3taps locations.  If the list of
             locations cannot be downloaded for some reason, we return None.
         """
-        response = self.sendRequest("reference/location")
+        results = self.sendJSONRequest("reference/location")
 
-        if (response == None) or (response['status'] != 200):
+        if results == None:
             return None # An error occurred.
 
-        results = json.loads(response['contents'])
-
         locations = []
         for loc in results:
             locations.append(self._parseLocation(loc))
@@ -100,13 +93,11 @@ class ReferenceAPIClient(APIClient):
             the master list of all known 3taps data sources.  If the list of
             sources cannot be downloaded for some reason, we return None.
         """
-        response = self.sendRequest("reference/source")
+        results = self.sendJSONRequest("reference/source")
 
-        if (response == None) or (response['status'] != 200):
+        if results == None:
             return None # An error occurred.
 
-        results = json.loads(response['contents'])
-
         sources = []
         for src in results:
             sources.append(self._parseSource(src))
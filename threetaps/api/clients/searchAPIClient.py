@@ -4,9 +4,7 @@
 """
 from threetaps.api.base   import APIClient
 from threetaps.api.models import Posting
-
-import urllib
-import simplejson as json
+from threetaps.api.clients.encoders import encodeQuery
 
 #############################################################################
 
@@ -97,14 +95,12 @@ class SearchAPIClient(APIClient):
         if page    != None: params['page']    = str(page)
         if retvals != None: params['retvals'] = ",".join(retvals)
 
-        response = self.sendRequest("search", **params)
+        results = self.sendJSONRequest("search", **params)
 
-        if (response == None) or (response['status'] != 200):
+        if results == None:
             return {'success' : False,
                     'error'   : "Unable to connect to 3taps Search API"}
 
-        results = json.loads(response['contents'])
-
         if not results['success']:
             return {'success' : False,
                     'error'   : results['error']}
@@ -148,13 +144,11 @@ class SearchAPIClient(APIClient):
         params = self._queryToParamsDict(query)
         params['fields'] = ",".join(fields)
 
-        response = self.sendRequest("search/range", **params)
+        results = self.sendJSONRequest("search/range", **params)
 
-        if (response == None) or (response['status'] != 200):
+        if results == None:
             return None
 
-        results = json.loads(response['contents'])
-
         ranges = {}
         for field in fields:
             minValue = None
@@ -203,12 +197,11 @@ class SearchAPIClient(APIClient):
         params = self._queryToParamsDict(query)
         params['dimension'] = dimension
 
-        response = self.sendRequest("search/summary", **params)
+        results = self.sendJSONRequest("search/summary", **params)
 
-        if (response == None) or (response['status'] != 200):
+        if results == None:
             return None
 
-        results = json.loads(response['contents'])
         return results
 
 
@@ -221,12 +214,11 @@ class SearchAPIClient(APIClient):
         """
         params = self._queryToParamsDict(query)
 
-        response = self.sendRequest("search/count", **params)
+        results = self.sendJSONRequest("search/count", **params)
 
-        if (response == None) or (response['status'] != 200):
+        if results == None:
             return None
 
-        results = json.loads(response['contents'])
         return results['count']
 
 
@@ -249,13 +241,12 @@ class SearchAPIClient(APIClient):
 
             Note that if an error occurs, we return None.
         """
-        response = self.sendRequest("search/bestMatch",
-                                    keywords=",".join(keywords))
+        results = self.sendJSONRequest("search/bestMatch",
+                                       keywords=",".join(keywords))
 
-        if (response == None) or (response['status'] != 200):
+        if results == None:
             return None
 
-        results = json.loads(response['contents'])
         return results
 
     # =====================
@@ -268,30 +259,7 @@ class SearchAPIClient(APIClient):
             We create a dictionary with key/value entries matching the contents
             of the given SearchQuery object.
         """
-        params = {}
-        if query.source != None:
-            params['source'] = query.source
-        if query.category != None:
-            params['category'] = query.category
-        if query.location != None:
-            params['location'] = query.location
-        if query.heading != None:
-            params['heading'] = urllib.quote_plus(query.heading)
-        if query.body != None:
-            params['body'] = urllib.quote_plus(query.body)
-        if query.text != None:
-            params['text'] = urllib.quote_plus(query.text)
-        if query.externalID != None:
-            params['externalID'] = query.externalID
-        if query.start != None:
-            params['start'] = query.start.strftime("%Y/%m/%d %H:%M:%S UTC")
-        if query.end != None:
-            params['end'] = query.end.strftime("%Y/%m/%d %H:%M:%S UTC")
-        if query.annotations != None:
-            params['annotations'] = json.dumps(query.annotations)
-        if query.trustedAnnotations != None:
-            params['trustedAnnotations'] = json.dumps(query.trustedAnnotations)
-        return params
+        return encodeQuery(query)
 
 #############################################################################
 
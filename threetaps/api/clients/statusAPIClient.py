@@ -3,6 +3,7 @@
     This Python module implements the 3taps Status API client object.
 """
 from threetaps.api.base import APIClient
+from threetaps.api.base.chunking import chunked, concurrentMap
 
 import datetime
 import simplejson as json
@@ -79,14 +80,12 @@ class StatusAPIClient(APIClient):
                 data['attributes'] = event['attributes']
             eventData.append(data)
 
-        response = self.sendRequest("status/update", "POST",
-                                    events=json.dumps(eventData))
+        results = self.sendJSONRequest("status/update", "POST",
+                                       events=json.dumps(eventData))
 
-        if (response == None) or (response['status'] != 200):
+        if results == None:
             return None # An error occurred.
 
-        results = json.loads(response['contents'])
-
         if results['code'] == 200: # HTTP "OK" status value.
             return {'success' : True}
         else:
@@ -150,41 +149,45 @@ class StatusAPIClient(APIClient):
             Note that if the 3taps server cannot be contacted for some reason,
             we return None.
         """
-        postingData = []
-        for posting in postings:
-            postingData.append({'externalID' : posting.externalID,
-                                'source'     : posting.source})
+        histories = self._getChunk(postings)
+        if histories == None:
+            return None # An error occurred.
 
-        response = self.sendRequest("status/get", "POST",
-                                    postings=json.dumps(postingData))
+        return [self._parseHistory(entry) for entry in histories]
 
-        if (response == None) or (response['status'] != 200):
-            return None # An error occurred.
 
-        results = json.loads(response['contents'])
+    def getMany(self, postings, chunkSize=1000, maxWorkers=4):
+        """ Return the status history for a large number of postings.
 
-        histories = []
-        for entry in results:
-            history = {}
-            history['exists']     = entry['exists']
-            history['externalID'] = entry['externalID']
-            history['source']     = entry['source']
-            history['history']    = {}
+            'postings' can be a list or any other iterable yielding Posting
+            objects, with the 'externalID' and 'source' fields filled in.
 
-            for status,statusUpdates in entry['history'].items():
-                history['history'][status] = []
-                for statusUpdate in statusUpdates:
-                    update = {}
-                    update['timestamp'] = \
-                        datetime.datetime.strptime(statusUpdate['timestamp'],
-                                                   "%Y/%m/%d %H:%M:%S %Z")
-                    update['errors']     = statusUpdate.get("errors",     [])
-                    update['attributes'] = statusUpdate.get("attributes", {})
-                    history['history'][status].append(update)
+            The postings are split into chunks of at most 'chunkSize'
+            postings, and up to 'maxWorkers' chunks are requested from the
+            server at once.  Postings are only read from 'postings' as they
+            are needed, so the memory used is limited by the chunk size
+            rather than by the total number of postings.
 
-            histories.append(history)
+            We return an iterator which yields the status history for each
+            posting in turn, in the same order as the 'postings'.  Each status
+            history is a dictionary in the format returned by get().  If a
+            chunk could not be retrieved, or the server didn't return one
+            history for each of its postings, None is yielded for each posting
+            in that chunk.
+        """
+        def getChunk(chunk):
+            return (len(chunk), self._getChunk(chunk))
 
-        return histories
+        for numPostings,histories in concurrentMap(getChunk,
+                                                   chunked(postings,
+                                                           chunkSize),
+                                                   maxWorkers):
+            if histories == None or len(histories) != numPostings:
+                for i in range(numPostings):
+                    yield None
+            else:
+                for entry in histories:
+                    yield self._parseHistory(entry)
 
 
     def system(self):
@@ -205,11 +208,53 @@ class StatusAPIClient(APIClient):
             Note that if the 3taps server cannot be contacted for some reason,
             we return None.
         """
-        response = self.sendRequest("status/system")
+        results = self.sendJSONRequest("status/system")
 
-        if (response == None) or (response['status'] != 200):
+        if results == None:
             return None # An error occurred.
 
-        results = json.loads(response['contents'])
         return results
 
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _getChunk(self, postings):
+        """ Ask the server for the status history of a list of postings.
+
+            We return the list of status histories, in the raw format returned
+            by the 3taps server, or None if an error occurred.
+        """
+        postingData = []
+        for posting in postings:
+            postingData.append({'externalID' : posting.externalID,
+                                'source'     : posting.source})
+
+        return self.sendJSONRequest("status/get", "POST",
+                                    postings=json.dumps(postingData))
+
+
+    def _parseHistory(self, entry):
+        """ Convert a raw status history into the format returned by get().
+
+            'entry' should be a single status history, as returned by the
+            3taps server after decoding the JSON-format data.
+        """
+        history = {}
+        history['exists']     = entry['exists']
+        history['externalID'] = entry['externalID']
+        history['source']     = entry['source']
+        history['history']    = {}
+
+        for status,statusUpdates in entry['history'].items():
+            history['history'][status] = []
+            for statusUpdate in statusUpdates:
+                update = {}
+                update['timestamp'] = \
+                    datetime.datetime.strptime(statusUpdate['timestamp'],
+                                               "%Y/%m/%d %H:%M:%S %Z")
+                update['errors']     = statusUpdate.get("errors",     [])
+                update['attributes'] = statusUpdate.get("attributes", {})
+                history['history'][status].append(update)
+
+        return history
@@ -0,0 +1,357 @@
+""" threetaps.api.clients.statusEmitter
+
+    This Python module implements the StatusEmitter class, which sends status
+    events to the 3taps Status API in the background.
+"""
+import datetime
+import Queue
+import threading
+import time
+import simplejson as json
+
+#############################################################################
+
+# The overflow policies supported by the StatusEmitter:
+
+OVERFLOW_BLOCK = "block" # Wait until there is room in the queue.
+OVERFLOW_DROP  = "drop"  # Discard the event.
+OVERFLOW_SPILL = "spill" # Append the event to the spill file.
+
+TIMESTAMP_FORMAT = "%Y/%m/%d %H:%M:%S UTC"
+
+#############################################################################
+
+class StatusEmitter:
+    """ Queue status events and send them to the Status API in batches.
+
+        Status events are added to a queue by calling emit(), which returns
+        immediately.  A background thread takes events off the queue and
+        combines them into batches, which are sent to the server using
+        StatusAPIClient.update().  A batch is sent as soon as it holds
+        'maxBatchSize' events, its events take up 'maxBatchBytes' bytes of
+        JSON-encoded data, or 'maxDelayMs' milliseconds have passed since the
+        first event in the batch was queued.
+
+        The queue holds at most 'maxQueueSize' events.  If the queue is full
+        when emit() is called, the 'overflow' policy decides what happens to
+        the new event:
+
+            "block"
+
+                Wait until there is room in the queue.  This applies
+                backpressure to the caller.
+
+            "drop"
+
+                Discard the event.
+
+            "spill"
+
+                Append the event to the file at 'spillPath'.  Batches which
+                couldn't be sent because the server couldn't be reached are
+                also added to the spill file.  Spilled events can be sent
+                again later by calling replaySpill().  Batches which the
+                server rejected are never spilled, as sending them again
+                would fail in the same way.
+
+        Events which don't have a 'timestamp' are given the current time when
+        they are emitted, so that the event isn't timestamped with the time
+        at which its batch happened to be sent.
+    """
+    def __init__(self, client, maxBatchSize=1000, maxBatchBytes=512*1024,
+                 maxDelayMs=1000, maxQueueSize=10000, overflow=OVERFLOW_BLOCK,
+                 spillPath=None):
+        """ Standard initializer.
+
+            'client' is the StatusAPIClient to send the events through.
+        """
+        if overflow not in [OVERFLOW_BLOCK, OVERFLOW_DROP, OVERFLOW_SPILL]:
+            raise RuntimeError("Illegal overflow policy: " + repr(overflow))
+        if overflow == OVERFLOW_SPILL and spillPath == None:
+            raise RuntimeError("The spill policy requires a spillPath")
+
+        self._client        = client
+        self._maxBatchSize  = maxBatchSize
+        self._maxBatchBytes = maxBatchBytes
+        self._maxDelay      = maxDelayMs / 1000.0
+        self._overflow      = overflow
+        self._spillPath     = spillPath
+        self._spillLock     = threading.Lock()
+        self._statsLock     = threading.Lock()
+        self._queue         = Queue.Queue(maxQueueSize)
+        self._closed        = False
+        self._closeLock     = threading.Lock() # Guards _closed and queuing.
+        self._stats         = {'emitted' : 0,
+                               'sent'    : 0,
+                               'failed'  : 0,
+                               'dropped' : 0,
+                               'spilled' : 0,
+                               'batches' : 0}
+
+        self._thread = threading.Thread(target=self._run,
+                                        name="StatusEmitter")
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+
+    def emit(self, event):
+        """ Queue a status event for sending to the server.
+
+            'event' should be a dictionary in the format accepted by
+            StatusAPIClient.update().
+
+            We return True if the event was queued (or spilled to disk), or
+            False if it was dropped because the queue was full.
+        """
+        if "timestamp" not in event:
+            event = dict(event)
+            event['timestamp'] = datetime.datetime.utcnow()
+
+        # The closed check and the put must happen together, so that no
+        # event can be queued after close() has queued the stop marker.
+
+        self._closeLock.acquire()
+        try:
+            if self._closed:
+                raise RuntimeError("StatusEmitter has been closed")
+
+            self._count("emitted")
+
+            if self._overflow == OVERFLOW_BLOCK:
+                self._queue.put(event)
+                return True
+
+            try:
+                self._queue.put_nowait(event)
+                return True
+            except Queue.Full:
+                pass
+        finally:
+            self._closeLock.release()
+
+        if self._overflow == OVERFLOW_SPILL:
+            self._spill([event])
+            return True
+        else:
+            self._count("dropped")
+            return False
+
+
+    def flush(self):
+        """ Wait until all the queued events have been processed.
+        """
+        self._queue.join()
+
+
+    def close(self):
+        """ Send any queued events, and then stop the background thread.
+        """
+        self._closeLock.acquire()
+        try:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        finally:
+            self._closeLock.release()
+        self._thread.join()
+
+
+    def replaySpill(self):
+        """ Queue any events in the spill file for sending again.
+
+            The spill file is emptied before the events are queued, so events
+            which still can't be sent will be spilled again.  We return the
+            number of events which were read from the spill file.
+        """
+        if self._spillPath == None:
+            return 0
+
+        self._spillLock.acquire()
+        try:
+            try:
+                f = open(self._spillPath, "r")
+            except IOError:
+                return 0 # Nothing has been spilled.
+            lines = f.readlines()
+            f.close()
+            open(self._spillPath, "w").close()
+        finally:
+            self._spillLock.release()
+
+        for line in lines:
+            event = json.loads(line)
+            event['timestamp'] = \
+                datetime.datetime.strptime(event['timestamp'],
+                                           TIMESTAMP_FORMAT)
+            self.emit(event)
+        return len(lines)
+
+
+    def getStats(self):
+        """ Return a dictionary with statistics about the events we've seen.
+
+            The returned dictionary will have the following entries:
+
+                'emitted'
+
+                    The number of events passed to emit().
+
+                'sent'
+
+                    The number of events successfully sent to the server.
+
+                'failed'
+
+                    The number of events which could not be sent to the
+                    server, and which were not spilled.  This includes the
+                    events in batches which the server rejected, and any
+                    malformed events.
+
+                'dropped'
+
+                    The number of events dropped because the queue was full.
+
+                'spilled'
+
+                    The number of events written to the spill file.
+
+                'batches'
+
+                    The number of update() calls made to the server.
+
+                'queued'
+
+                    The number of events currently in the queue.
+        """
+        self._statsLock.acquire()
+        try:
+            stats = dict(self._stats)
+        finally:
+            self._statsLock.release()
+        stats['queued'] = self._queue.qsize()
+        return stats
+
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _run(self):
+        """ Collect queued events into batches, and send each batch in turn.
+
+            This is run in our background thread.
+        """
+        finished = False
+        while not finished:
+            event = self._queue.get()
+            if event == None:
+                self._queue.task_done()
+                break
+
+            batchSize = self._sizeOf(event)
+            if batchSize == None:
+                self._discard(event)
+                continue
+
+            batch     = [event]
+            deadline  = time.time() + self._maxDelay
+            while len(batch) < self._maxBatchSize \
+                  and batchSize < self._maxBatchBytes:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    event = self._queue.get(True, remaining)
+                except Queue.Empty:
+                    break
+                if event == None:
+                    self._queue.task_done()
+                    finished = True
+                    break
+                size = self._sizeOf(event)
+                if size == None:
+                    self._discard(event)
+                    continue
+                batch.append(event)
+                batchSize = batchSize + size
+
+            try:
+                self._sendBatch(batch)
+            except Exception:
+                # Don't let a single bad batch stop the background thread.
+                self._count("failed", len(batch))
+            for event in batch:
+                self._queue.task_done()
+
+
+    def _sendBatch(self, batch):
+        """ Send a batch of status events to the server.
+
+            If the server couldn't be reached, the batch is spilled to disk
+            if we have a spill file.  Batches which the server rejects, or
+            which can't be encoded, are counted as failed.
+        """
+        try:
+            response = self._client.update(batch)
+        except Exception:
+            response = {'success' : False}
+
+        self._count("batches")
+        if response != None and response.get('success'):
+            self._count("sent", len(batch))
+        elif response == None and self._spillPath != None:
+            self._spill(batch)
+        else:
+            self._count("failed", len(batch))
+
+
+    def _spill(self, events):
+        """ Append the given events to our spill file.
+        """
+        lines = []
+        for event in events:
+            event = dict(event)
+            event['timestamp'] = event['timestamp'].strftime(TIMESTAMP_FORMAT)
+            lines.append(json.dumps(event) + "\n")
+
+        self._spillLock.acquire()
+        try:
+            f = open(self._spillPath, "a")
+            f.writelines(lines)
+            f.close()
+        finally:
+            self._spillLock.release()
+
+        self._count("spilled", len(events))
+
+
+    def _sizeOf(self, event):
+        """ Return the approximate size of the given event once encoded.
+
+            If the event is malformed, we return None.
+        """
+        try:
+            size = len(event['status']) + len(event['externalID']) \
+                 + len(event['source']) + 80
+            if "attributes" in event:
+                size = size + len(json.dumps(event['attributes']))
+        except Exception:
+            return None
+        return size
+
+
+    def _discard(self, event):
+        """ Discard a malformed event taken from our queue.
+        """
+        self._count("failed")
+        self._queue.task_done()
+
+
+    def _count(self, stat, amount=1):
+        """ Add the given amount to one of our statistics.
+        """
+        self._statsLock.acquire()
+        try:
+            self._stats[stat] = self._stats[stat] + amount
+        finally:
+            self._statsLock.release()
@@ -0,0 +1,218 @@
+""" threetaps.api.clients.systemStatusMonitor
+
+    This Python module implements the SystemStatusMonitor class, which keeps
+    track of the current status of the 3taps system in the background.
+"""
+from threetaps.api.base import constants
+from threetaps.api.clients.statusAPIClient import StatusAPIClient
+
+import logging
+import threading
+import time
+
+#############################################################################
+
+# The 3taps status code which indicates that the system is healthy:
+
+STATUS_OK = 200
+
+#############################################################################
+
+_sharedMonitors = {} # Maps (url, port) to SystemStatusMonitor object.
+_sharedLock     = threading.Lock()
+
+def getSharedMonitor(url=constants.DEFAULT_API_URL,
+                     port=constants.DEFAULT_API_PORT, interval=30):
+    """ Return the shared SystemStatusMonitor for the given 3taps server.
+
+        The first time this is called for a given URL and port, we create and
+        start a new SystemStatusMonitor which polls the server every
+        'interval' seconds.  Subsequent calls return the same monitor, so
+        that all the workers in a process share a single poller.
+    """
+    _sharedLock.acquire()
+    try:
+        key = (url, port)
+        if key not in _sharedMonitors:
+            monitor = SystemStatusMonitor(StatusAPIClient(url, port), interval)
+            monitor.start()
+            _sharedMonitors[key] = monitor
+        return _sharedMonitors[key]
+    finally:
+        _sharedLock.release()
+
+#############################################################################
+
+class SystemStatusMonitor:
+    """ Poll the 3taps system status in the background.
+
+        Once started, the monitor calls StatusAPIClient.system() every
+        'interval' seconds, and remembers the most recent result.  Callers can
+        then check the system status without contacting the server.
+
+        Callbacks can be registered using subscribe(); these are called
+        whenever the status code changes, including when the server becomes
+        unreachable or reachable again.
+    """
+    def __init__(self, client=None, interval=30):
+        """ Standard initializer.
+
+            'client' is the StatusAPIClient to use to poll the server.  If
+            this is not supplied, a StatusAPIClient using the default URL and
+            port will be created.
+        """
+        if client == None:
+            client = StatusAPIClient()
+
+        self._client      = client
+        self._interval    = interval
+        self._status      = None
+        self._lock        = threading.Lock()
+        self._changed     = threading.Condition(self._lock)
+        self._subscribers = []
+        self._stopEvent   = threading.Event()
+        self._thread      = None
+
+
+    def start(self):
+        """ Start polling the server in the background.
+
+            We poll the server once before returning, so that getStatus() has
+            a value to return straight away.
+        """
+        if self._thread != None:
+            return
+
+        self.refresh()
+        self._stopEvent.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name="SystemStatusMonitor")
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+
+    def stop(self):
+        """ Stop polling the server.
+        """
+        if self._thread != None:
+            self._stopEvent.set()
+            self._thread.join()
+            self._thread = None
+
+
+    def refresh(self):
+        """ Poll the server immediately, and return the new status.
+        """
+        try:
+            status = self._client.system()
+        except Exception,e:
+            logging.error("Unable to poll 3taps system status: " + repr(e))
+            status = None
+
+        self._lock.acquire()
+        try:
+            oldStatus    = self._status
+            self._status = status
+            subscribers  = list(self._subscribers)
+            self._changed.notifyAll()
+        finally:
+            self._lock.release()
+
+        if self._codeOf(oldStatus) != self._codeOf(status):
+            for callback in subscribers:
+                try:
+                    callback(oldStatus, status)
+                except Exception,e:
+                    logging.error("System status subscriber failed: " +
+                                  repr(e))
+        return status
+
+
+    def getStatus(self):
+        """ Return the most recently polled system status.
+
+            This will be a dictionary in the format returned by
+            StatusAPIClient.system(), or None if the server could not be
+            contacted.
+        """
+        return self._status
+
+
+    def isHealthy(self):
+        """ Return True if and only if the 3taps system is currently healthy.
+        """
+        return self._codeOf(self._status) == STATUS_OK
+
+
+    def waitUntilHealthy(self, timeout=None):
+        """ Wait until the 3taps system is healthy.
+
+            If 'timeout' is given, it is the maximum number of seconds to
+            wait.  We return True if and only if the system is healthy.
+        """
+        if timeout != None:
+            deadline = time.time() + timeout
+
+        self._lock.acquire()
+        try:
+            while not self.isHealthy():
+                if timeout == None:
+                    self._changed.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._changed.wait(remaining)
+            return self.isHealthy()
+        finally:
+            self._lock.release()
+
+
+    def subscribe(self, callback):
+        """ Register a callback to be called when the status code changes.
+
+            The callback will be called as callback(oldStatus, newStatus),
+            where each status is a dictionary in the format returned by
+            StatusAPIClient.system(), or None if the server could not be
+            contacted.  Note that the callback is called from the monitor's
+            background thread.
+        """
+        self._lock.acquire()
+        try:
+            self._subscribers.append(callback)
+        finally:
+            self._lock.release()
+
+
+    def unsubscribe(self, callback):
+        """ Remove a callback previously registered using subscribe().
+        """
+        self._lock.acquire()
+        try:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+        finally:
+            self._lock.release()
+
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _run(self):
+        """ Poll the server until we are stopped.
+
+            This is run in our background thread.
+        """
+        while True:
+            self._stopEvent.wait(self._interval)
+            if self._stopEvent.isSet():
+                break
+            self.refresh()
+
+
+    def _codeOf(self, status):
+        """ Return the status code from the given status, or None.
+        """
+        if status == None:
+            return None
+        return status.get("code")
@@ -0,0 +1,13 @@
+""" __init__.py
+
+    threetaps.api.testing package initialization file.
+
+    Note that we load the fake server and cassette classes into the
+    threetaps.api.testing namespace, to make them easier to access.
+"""
+from threetaps.api.testing.cassette import RecordingTransport
+from threetaps.api.testing.cassette import ReplayTransport
+from threetaps.api.testing.cassette import volatileValue
+from threetaps.api.testing.fakeServer import FakeServer
+from threetaps.api.testing.fakeServer import FakeTransport
+from threetaps.api.testing.fakeServer import FakeHTTPServer
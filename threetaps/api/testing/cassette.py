@@ -0,0 +1,311 @@
+""" threetaps.api.testing.cassette
+
+    This Python module implements transports which record the HTTP requests
+    made by the API clients to a "cassette" file, and replay them later
+    without contacting the 3taps server.
+
+    A cassette file holds one JSON-format line for each recorded exchange.
+    If the file name ends in ".gz", the file is gzip-compressed.  Each line
+    is a dictionary with the following entries:
+
+        'method'
+
+            The HTTP method used, either "GET" or "POST".
+
+        'url'
+
+            The URL requested, relative to the server, including any query
+            parameters; for example, "/search/count?source=CRAIG".
+
+        'body'
+
+            The body of a POST request, or None.
+
+        'status', 'contentType' and 'contents'
+
+            The response returned by the server.
+
+        'latency'
+
+            The number of seconds taken by the request.
+
+        'offset'
+
+            The number of seconds between the start of the recording and the
+            start of this request.
+
+    A cassette can also hold the values which change from one test run to
+    the next, such as the current time, so that a replayed test makes the
+    same requests as the recorded one; see volatileValue().  Each of these
+    is recorded as a line with the following entries:
+
+        'value'
+
+            The name of the value.
+
+        'data'
+
+            The value itself, which must be encodable as JSON.
+"""
+from threetaps.api.base.transport import Transport, getDefaultTransport
+
+import gzip
+import threading
+import time
+import urlparse
+import simplejson as json
+
+#############################################################################
+
+class RecordingTransport(Transport):
+    """ A Transport which records each exchange to a cassette file.
+
+        Requests are passed on to another Transport, and the responses are
+        written to the cassette before being returned.  Requests which fail
+        with an IOError are not recorded.  A RecordingTransport can be used
+        from several threads at once.
+    """
+    def __init__(self, path, transport=None):
+        """ Standard initializer.
+
+            'path' is the cassette file to write to; any existing file is
+            replaced.  'transport' is the Transport to send the requests
+            through; if this is None, the process-wide default transport is
+            used.
+        """
+        if transport == None:
+            transport = getDefaultTransport()
+
+        self._transport = transport
+        self._file      = _openCassette(path, "w")
+        self._lock      = threading.Lock()
+        self._startTime = time.time()
+
+
+    def send(self, request):
+        """ Send the given Request object, and record the response.
+        """
+        startTime = time.time()
+        response  = self._transport.send(request)
+        latency   = time.time() - startTime
+
+        line = json.dumps({'method'      : request.method,
+                           'url'         : _relativeURL(request.url),
+                           'body'        : request.body,
+                           'status'      : response['status'],
+                           'contentType' : response['content-type'],
+                           'contents'    : response['contents'],
+                           'latency'     : round(latency, 6),
+                           'offset'      : round(startTime - self._startTime,
+                                                 6)},
+                          separators=(",", ":"))
+
+        self._write(line)
+        return response
+
+
+    def recordValue(self, name, value):
+        """ Record a value which the replayed test should use.
+
+            Refer to volatileValue() for details.
+        """
+        self._write(json.dumps({'value' : name, 'data' : value},
+                               separators=(",", ":")))
+
+
+    def close(self):
+        """ Finish writing the cassette file.
+        """
+        self._lock.acquire()
+        try:
+            if self._file != None:
+                self._file.close()
+                self._file = None
+        finally:
+            self._lock.release()
+
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _write(self, line):
+        """ Append a line to the cassette file.
+        """
+        self._lock.acquire()
+        try:
+            if self._file != None:
+                self._file.write(line + "\n")
+        finally:
+            self._lock.release()
+
+#############################################################################
+
+class ReplayTransport(Transport):
+    """ A Transport which replays the exchanges recorded in a cassette file.
+
+        Each request is matched against the recorded requests with the same
+        method, relative URL and body.  If the same request was recorded
+        several times, the recorded responses are returned in order, starting
+        again from the first once they have all been used.  If there is no
+        matching request in the cassette, we raise an IOError, just as if the
+        server could not be contacted.
+
+        Each response is delayed by its recorded latency multiplied by
+        'latencyScale'.  Use a 'latencyScale' of 1.0 to reproduce the original
+        timings, or 0.0 to replay the responses as quickly as possible.
+
+        If 'preserveOffsets' is True, the recorded pattern of traffic is
+        reproduced as well: no response is returned until its recorded
+        offset plus its latency, multiplied by 'latencyScale', has elapsed
+        since the first request was replayed.  A request made later than it
+        was recorded is only delayed by its own latency.
+    """
+    def __init__(self, path, latencyScale=1.0, preserveOffsets=False):
+        """ Standard initializer.
+
+            'path' is the cassette file to replay.
+        """
+        self._latencyScale    = latencyScale
+        self._preserveOffsets = preserveOffsets
+        self._startTime       = None # Time of the first replayed request.
+        self._lock            = threading.Lock()
+        self._exchanges       = {} # Maps request key to list of exchanges.
+        self._positions       = {} # Maps request key to index of next
+                                   # exchange.
+        self._values          = {} # Maps value name to list of values.
+        self._numReplayed     = 0
+
+        for exchange in readCassette(path):
+            if 'value' in exchange:
+                self._values.setdefault(exchange['value'], []) \
+                            .append(exchange['data'])
+                continue
+            key = (exchange['method'], exchange['url'], exchange['body'])
+            self._exchanges.setdefault(key, []).append(exchange)
+
+
+    def send(self, request):
+        """ Return the recorded response for the given Request object.
+        """
+        key = (request.method, _relativeURL(request.url), request.body)
+
+        self._lock.acquire()
+        try:
+            if self._startTime == None:
+                self._startTime = time.time()
+            exchanges = self._exchanges.get(key)
+            if exchanges == None:
+                raise IOError("No recorded response for %s %s" %
+                              (request.method, key[1]))
+            position = self._positions.get(key, 0)
+            self._positions[key] = (position + 1) % len(exchanges)
+            self._numReplayed = self._numReplayed + 1
+        finally:
+            self._lock.release()
+
+        exchange = exchanges[position]
+        delay    = exchange['latency'] * self._latencyScale
+        if self._preserveOffsets:
+            finishTime = self._startTime + self._latencyScale * \
+                         (exchange['offset'] + exchange['latency'])
+            delay = max(delay, finishTime - time.time())
+        if delay > 0:
+            time.sleep(delay)
+        request.timings['firstByte'] = delay
+
+        contents = exchange['contents']
+        if isinstance(contents, unicode):
+            contents = contents.encode("utf-8")
+
+        return {'status'       : exchange['status'],
+                'contents'     : contents,
+                'content-type' : exchange['contentType']}
+
+
+    def getNumReplayed(self):
+        """ Return the number of responses we have replayed.
+        """
+        return self._numReplayed
+
+
+    def getValue(self, name, default=None):
+        """ Return the next recorded value with the given name.
+
+            If the same name was recorded several times, the values are
+            returned in order, starting again from the first once they have
+            all been used.  If no value was recorded with this name, we
+            return 'default'.
+        """
+        self._lock.acquire()
+        try:
+            values = self._values.get(name)
+            if values == None:
+                return default
+            key = ("value", name)
+            position = self._positions.get(key, 0)
+            self._positions[key] = (position + 1) % len(values)
+            return values[position]
+        finally:
+            self._lock.release()
+
+#############################################################################
+
+def volatileValue(name, function):
+    """ Return a value which changes from one test run to the next.
+
+        Tests which send values such as the current time to the server can
+        never match a recorded request when they are replayed.  Instead, a
+        test should call this function, where 'function' is a function
+        returning a new value, and 'name' identifies the value.
+
+        If the process-wide default transport is a ReplayTransport, we return
+        the value recorded under this name, so that the test sends the same
+        requests as it did when it was recorded.  Otherwise, we call
+        'function' and return its result, recording it if the default
+        transport is a RecordingTransport.
+    """
+    transport = getDefaultTransport()
+    if isinstance(transport, ReplayTransport):
+        value = transport.getValue(name)
+        if value != None:
+            return value
+
+    value = function()
+    if isinstance(transport, RecordingTransport):
+        transport.recordValue(name, value)
+    return value
+
+
+def readCassette(path):
+    """ Return an iterator over the records in a cassette file.
+
+        Each exchange or value is returned as a dictionary, as described in
+        the documentation for this module.  The records are returned in the
+        order they were recorded, so the 'offset' values can be used to
+        reproduce the original pattern of requests.
+    """
+    f = _openCassette(path, "r")
+    try:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+    finally:
+        f.close()
+
+#############################################################################
+
+def _openCassette(path, mode):
+    """ Open the given cassette file, decompressing it if necessary.
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "b")
+    return open(path, mode + "b")
+
+
+def _relativeURL(url):
+    """ Return the given URL without its scheme, host and port.
+    """
+    parts = urlparse.urlsplit(url)
+    if parts.query:
+        return parts.path + "?" + parts.query
+    return parts.path
@@ -0,0 +1,555 @@
+""" threetaps.api.testing.fakeServer
+
+    This Python module implements a fake 3taps server, which can be used to
+    test and benchmark the API clients without contacting the real 3taps
+    system.
+
+    The FakeServer class implements the 3taps API endpoints on top of a set of
+    synthetic postings held in memory.  It can be used in-process, by giving
+    the API clients a FakeTransport, or over HTTP on localhost by running a
+    FakeHTTPServer.
+"""
+from threetaps.api.base.transport import Transport, compress
+from threetaps.api.testing import syntheticData
+
+import BaseHTTPServer
+import cgi
+import datetime
+import random
+import SocketServer
+import threading
+import time
+import urllib
+import urlparse
+import zlib
+import simplejson as json
+
+#############################################################################
+
+DEFAULT_RETVALS = ["category", "location", "heading", "externalURL",
+                   "timestamp"]
+
+#############################################################################
+
+class FakeServer:
+    """ An in-memory implementation of the 3taps APIs.
+
+        The server starts out with 'numPostings' synthetic postings.  Postings
+        created, updated and deleted through the Posting API, and status
+        events sent to the Status API, are stored in memory.
+
+        The following parameters control the simulated server latency:
+
+            'latencyMs'
+
+                The base latency added to every request, in milliseconds.
+
+            'jitterMs'
+
+                A random amount of up to this many milliseconds is added to
+                the base latency of each request.
+
+            'stragglerRate' and 'stragglerMs'
+
+                The given fraction of requests are delayed by an additional
+                'stragglerMs' milliseconds.
+
+            'errorRate'
+
+                The given fraction of requests fail with an HTTP 500 error.
+
+        A FakeServer can safely handle requests from several threads at once.
+    """
+    def __init__(self, numPostings=1000, seed=0, latencyMs=0, jitterMs=0,
+                 stragglerRate=0.0, stragglerMs=0, errorRate=0.0):
+        """ Standard initializer.
+        """
+        self.latencyMs     = latencyMs
+        self.jitterMs      = jitterMs
+        self.stragglerRate = stragglerRate
+        self.stragglerMs   = stragglerMs
+        self.errorRate     = errorRate
+
+        self._rng         = random.Random(seed)
+        self._lock        = threading.Lock()
+        self._postings    = {} # Maps postKey to posting dictionary.
+        self._statuses    = {} # Maps (source, externalID) to history.
+        self._nextPostKey = numPostings
+        self._numRequests = 0
+
+        for posting in syntheticData.makePostingDicts(numPostings, seed):
+            self._postings[posting['postKey']] = posting
+
+        self._handlers = {
+            'search'             : self._search,
+            'search/count'       : self._searchCount,
+            'search/range'       : self._searchRange,
+            'search/summary'     : self._searchSummary,
+            'search/bestMatch'   : self._searchBestMatch,
+            'posting/get'        : self._postingGet,
+            'posting/create'     : self._postingCreate,
+            'posting/update'     : self._postingUpdate,
+            'posting/delete'     : self._postingDelete,
+            'reference/category' : self._referenceCategory,
+            'reference/location' : self._referenceLocation,
+            'reference/source'   : self._referenceSource,
+            'status/update'      : self._statusUpdate,
+            'status/get'         : self._statusGet,
+            'status/system'      : self._statusSystem,
+            'geocoder/geocode'   : self._geocode,
+        }
+
+
+    def handle(self, method, path, params):
+        """ Handle a single request to the fake server.
+
+            'method' is the HTTP method ("GET" or "POST"), 'path' is the URL
+            path (for example, "/search/count"), and 'params' is a dictionary
+            mapping the request's query or form parameters to their values.
+
+            We return a (status, contentType, contents) tuple.
+        """
+        self._lock.acquire()
+        try:
+            self._numRequests = self._numRequests + 1
+            delay = self.latencyMs + self._rng.uniform(0, self.jitterMs)
+            if self._rng.random() < self.stragglerRate:
+                delay = delay + self.stragglerMs
+            failed = self._rng.random() < self.errorRate
+        finally:
+            self._lock.release()
+
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+        if failed:
+            return (500, "text/plain", "Internal Server Error")
+
+        parts    = path.strip("/").split("/")
+        endpoint = "/".join(parts[:2])
+        args     = parts[2:]
+
+        handler = self._handlers.get(endpoint)
+        if handler == None:
+            return (404, "text/plain", "Not Found")
+
+        self._lock.acquire()
+        try:
+            results = handler(args, params)
+        finally:
+            self._lock.release()
+
+        return (200, "application/json", json.dumps(results))
+
+
+    def getNumRequests(self):
+        """ Return the number of requests we have handled.
+        """
+        return self._numRequests
+
+    # =======================
+    # == ENDPOINT HANDLERS ==
+    # =======================
+
+    def _search(self, args, params):
+        """ Handle the "search" endpoint.
+        """
+        startTime = time.time()
+        matches   = self._findPostings(params)
+        total     = len(matches)
+
+        rpp  = int(params.get("rpp", 10))
+        page = int(params.get("page", 0))
+        if rpp != -1:
+            matches = matches[page * rpp : (page + 1) * rpp]
+
+        if "retvals" in params:
+            retvals = params['retvals'].split(",")
+        else:
+            retvals = DEFAULT_RETVALS
+
+        results = []
+        for posting in matches:
+            result = {}
+            for field in retvals:
+                if field in posting:
+                    result[field] = posting[field]
+            results.append(result)
+
+        return {'success'    : True,
+                'numResults' : total,
+                'execTimeMs' : int((time.time() - startTime) * 1000),
+                'results'    : results}
+
+
+    def _searchCount(self, args, params):
+        """ Handle the "search/count" endpoint.
+        """
+        return {'count' : len(self._findPostings(params))}
+
+
+    def _searchRange(self, args, params):
+        """ Handle the "search/range" endpoint.
+        """
+        matches = self._findPostings(params)
+        results = {}
+        for field in params['fields'].split(","):
+            values = [posting[field] for posting in matches
+                      if posting.get(field) != None]
+            if len(values) > 0:
+                results[field] = {'min' : min(values), 'max' : max(values)}
+        return results
+
+
+    def _searchSummary(self, args, params):
+        """ Handle the "search/summary" endpoint.
+        """
+        startTime = time.time()
+        totals    = {}
+        for posting in self._findPostings(params):
+            value = posting.get(params['dimension'])
+            totals[value] = totals.get(value, 0) + 1
+        return {'totals'     : totals,
+                'execTimeMs' : int((time.time() - startTime) * 1000)}
+
+
+    def _searchBestMatch(self, args, params):
+        """ Handle the "search/bestMatch" endpoint.
+        """
+        keywords = params['keywords'].lower().split(",")
+        counts   = {}
+        for posting in self._postings.values():
+            heading = posting.get("heading", "").lower()
+            for keyword in keywords:
+                if keyword in heading:
+                    category = posting.get("category")
+                    counts[category] = counts.get(category, 0) + 1
+                    break
+
+        best = None
+        for category,count in counts.items():
+            if best == None or count > counts[best]:
+                best = category
+        return {'category'   : best,
+                'numResults' : counts.get(best, 0)}
+
+
+    def _postingGet(self, args, params):
+        """ Handle the "posting/get" endpoint.
+        """
+        posting = self._postings.get(args[0])
+        if posting == None:
+            return {'code' : 404, 'message' : "Posting not found"}
+        return posting
+
+
+    def _postingCreate(self, args, params):
+        """ Handle the "posting/create" endpoint.
+        """
+        results = []
+        for posting in json.loads(params['postings']):
+            if "source" not in posting:
+                results.append({'error' : {'code'    : 400,
+                                           'message' : "Missing source"}})
+                continue
+            postKey = "P%07d" % self._nextPostKey
+            self._nextPostKey = self._nextPostKey + 1
+            posting['postKey'] = postKey
+            self._postings[postKey] = posting
+            results.append({'postKey' : postKey})
+        return results
+
+
+    def _postingUpdate(self, args, params):
+        """ Handle the "posting/update" endpoint.
+        """
+        success = True
+        for postKey,changes in json.loads(params['data']):
+            if postKey in self._postings:
+                self._postings[postKey].update(changes)
+            else:
+                success = False
+        return {'success' : success}
+
+
+    def _postingDelete(self, args, params):
+        """ Handle the "posting/delete" endpoint.
+        """
+        success = True
+        for postKey in json.loads(params['data']):
+            if postKey in self._postings:
+                del self._postings[postKey]
+            else:
+                success = False
+        return {'success' : success}
+
+
+    def _referenceCategory(self, args, params):
+        """ Handle the "reference/category" endpoint.
+        """
+        categories = syntheticData.makeCategoryDicts()
+        if params.get("annotations") == "false":
+            for category in categories:
+                del category['annotations']
+        if len(args) > 0:
+            categories = [category for category in categories
+                          if category['code'] == args[0]]
+        return categories
+
+
+    def _referenceLocation(self, args, params):
+        """ Handle the "reference/location" endpoint.
+        """
+        return syntheticData.makeLocationDicts()
+
+
+    def _referenceSource(self, args, params):
+        """ Handle the "reference/source" endpoint.
+        """
+        return syntheticData.makeSourceDicts()
+
+
+    def _statusUpdate(self, args, params):
+        """ Handle the "status/update" endpoint.
+        """
+        now = datetime.datetime.utcnow()
+        for event in json.loads(params['events']):
+            key = (event['source'], event['externalID'])
+            update = {'timestamp' : event.get("timestamp",
+                            now.strftime(syntheticData.TIMESTAMP_FORMAT))}
+            if "attributes" in event:
+                update['attributes'] = event['attributes']
+            history = self._statuses.setdefault(key, {})
+            history.setdefault(event['status'], []).append(update)
+        return {'code' : 200, 'message' : "OK"}
+
+
+    def _statusGet(self, args, params):
+        """ Handle the "status/get" endpoint.
+        """
+        results = []
+        for posting in json.loads(params['postings']):
+            key = (posting['source'], posting['externalID'])
+            results.append({'exists'     : key in self._statuses,
+                            'externalID' : posting['externalID'],
+                            'source'     : posting['source'],
+                            'history'    : self._statuses.get(key, {})})
+        return results
+
+
+    def _statusSystem(self, args, params):
+        """ Handle the "status/system" endpoint.
+        """
+        return {'code' : 200, 'message' : "OK"}
+
+
+    def _geocode(self, args, params):
+        """ Handle the "geocoder/geocode" endpoint.
+
+            Postings with a latitude and longitude are matched to the nearest
+            location.  Otherwise, we look for a location whose city or country
+            name appears in the posting's text fields.
+        """
+        results = []
+        for posting in json.loads(params['data']):
+            location = None
+            if "latitude" in posting and "longitude" in posting:
+                location = min(syntheticData.LOCATIONS, key=lambda loc:
+                                (loc[5] - posting['latitude']) ** 2 +
+                                (loc[6] - posting['longitude']) ** 2)
+            else:
+                text = " ".join([posting.get(field, "") for field in
+                                 ["text", "street", "locality", "city",
+                                  "state", "postal", "country"]]).lower()
+                for loc in syntheticData.LOCATIONS:
+                    if loc[1].lower() in text or loc[4].lower() in text:
+                        location = loc
+                        break
+
+            if location == None:
+                results.append([None, None, None])
+            else:
+                results.append([location[0], location[5], location[6]])
+        return results
+
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _findPostings(self, params):
+        """ Return the postings which match the given search parameters.
+
+            The matching postings are returned newest first.
+        """
+        criteria = []
+        for field in ["source", "externalID"]:
+            if field in params:
+                criteria.append((field, [params[field]]))
+        for field in ["category", "location"]:
+            if field in params:
+                criteria.append((field, params[field].split("+OR+")))
+
+        keywords = []
+        for field in ["heading", "body", "text"]:
+            if field in params:
+                keywords.append((field, urllib.unquote_plus(params[field])))
+
+        matches = []
+        for posting in self._postings.values():
+            if not self._matches(posting, criteria, keywords):
+                continue
+            matches.append(posting)
+
+        matches.sort(key=lambda posting: posting.get("timestamp"),
+                     reverse=True)
+        return matches
+
+
+    def _matches(self, posting, criteria, keywords):
+        """ Return True if the given posting matches the search criteria.
+        """
+        for field,values in criteria:
+            if posting.get(field) not in values:
+                return False
+        for field,keyword in keywords:
+            if field == "text":
+                text = posting.get("heading", "") + " " \
+                     + posting.get("body", "")
+            else:
+                text = posting.get(field, "")
+            if keyword.lower() not in text.lower():
+                return False
+        return True
+
+#############################################################################
+
+def _parseParams(query):
+    """ Convert a URL-encoded query string into a parameter dictionary.
+    """
+    params = {}
+    for key,values in cgi.parse_qs(query, keep_blank_values=True).items():
+        params[key] = values[0]
+    return params
+
+#############################################################################
+
+class FakeTransport(Transport):
+    """ A Transport which sends requests directly to a FakeServer.
+
+        Requests are handled in-process, without any network traffic.
+    """
+    def __init__(self, server):
+        """ Standard initializer.
+
+            'server' is the FakeServer object to send requests to.
+        """
+        self._server = server
+
+
+    def send(self, request):
+        """ Send the given Request object to our FakeServer.
+        """
+        url    = urlparse.urlparse(request.url)
+        params = _parseParams(url.query)
+        if request.body != None:
+            params.update(_parseParams(request.body))
+
+        status,contentType,contents = self._server.handle(request.method,
+                                                          url.path, params)
+        return {'status'       : status,
+                'contents'     : contents,
+                'content-type' : contentType}
+
+#############################################################################
+
+class FakeHTTPServer:
+    """ Run a FakeServer as an HTTP server on localhost.
+
+        The HTTP server runs in a background thread, handling each request in
+        a thread of its own.  If 'port' is zero, a free port is chosen
+        automatically; the 'url' and 'port' attributes can be passed to an
+        APIClient to make it use the fake server.
+
+        Like a typical web server, responses are gzip-compressed if the
+        client accepts it, and gzip-compressed request bodies are accepted.
+    """
+    def __init__(self, server, port=0):
+        """ Standard initializer.
+
+            'server' is the FakeServer object to send requests to.
+        """
+        self._server     = server
+        self._httpServer = _ThreadingHTTPServer(("127.0.0.1", port),
+                                                _RequestHandler)
+        self._httpServer.fakeServer = server
+        self._thread     = None
+
+        self.url  = "http://127.0.0.1"
+        self.port = self._httpServer.server_address[1]
+
+
+    def start(self):
+        """ Start handling HTTP requests in the background.
+        """
+        self._thread = threading.Thread(target=self._httpServer.serve_forever,
+                                        name="FakeHTTPServer")
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+
+    def stop(self):
+        """ Stop handling HTTP requests.
+        """
+        if self._thread != None:
+            self._httpServer.shutdown()
+            self._httpServer.server_close()
+            self._thread.join()
+            self._thread = None
+
+#############################################################################
+
+class _ThreadingHTTPServer(SocketServer.ThreadingMixIn,
+                           BaseHTTPServer.HTTPServer):
+    """ An HTTP server which handles each request in a separate thread.
+    """
+    daemon_threads      = True
+    allow_reuse_address = True
+
+#############################################################################
+
+class _RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """ Pass incoming HTTP requests on to the FakeServer.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        self._respond("GET", url.path, _parseParams(url.query))
+
+
+    def do_POST(self):
+        url    = urlparse.urlparse(self.path)
+        length = int(self.headers.getheader("Content-Length", 0))
+        body   = self.rfile.read(length)
+        if self.headers.getheader("Content-Encoding", "") == "gzip":
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+        params = _parseParams(url.query)
+        params.update(_parseParams(body))
+        self._respond("POST", url.path, params)
+
+
+    def log_message(self, format, *args):
+        pass # Don't log each request to stderr.
+
+
+    def _respond(self, method, path, params):
+        status,contentType,contents = \
+                self.server.fakeServer.handle(method, path, params)
+        self.send_response(status)
+        self.send_header("Content-Type", contentType)
+        if "gzip" in self.headers.getheader("Accept-Encoding", ""):
+            contents = compress(contents)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(contents)))
+        self.end_headers()
+        self.wfile.write(contents)
@@ -0,0 +1,226 @@
+""" threetaps.api.testing.syntheticData
+
+    This Python module generates synthetic 3taps data, for use by the fake
+    3taps server and by the benchmarks.
+
+    All the functions in this module take a 'seed' value, so that the same
+    data can be generated again for repeatable tests.
+"""
+from threetaps.api.models import Posting
+
+import datetime
+import random
+
+#############################################################################
+
+# The reference data used by the synthetic postings.  Each location is a
+# (code, city, stateCode, stateName, country, latitude, longitude) tuple.
+
+LOCATIONS = [
+    ("SFO", "San Francisco", "CA", "California",    "United States",
+     37.77493, -122.41942),
+    ("LAX", "Los Angeles",   "CA", "California",    "United States",
+     34.05223, -118.24368),
+    ("NYC", "New York",      "NY", "New York",      "United States",
+     40.71427, -74.00597),
+    ("BOS", "Boston",        "MA", "Massachusetts", "United States",
+     42.35843, -71.05977),
+    ("CHI", "Chicago",       "IL", "Illinois",      "United States",
+     41.85003, -87.65005),
+    ("SEA", "Seattle",       "WA", "Washington",    "United States",
+     47.60621, -122.33207),
+    ("LON", "London",        None, None,            "United Kingdom",
+     51.50853, -0.12574),
+    ("HKG", "Hong Kong",     None, None,            "Hong Kong",
+     22.28552, 114.15769),
+]
+
+# Each category is a (group, code, name) tuple.
+
+CATEGORIES = [
+    ("SSSS", "SAPP", "Apparel"),
+    ("SSSS", "SELE", "Electronics"),
+    ("SSSS", "SFUR", "Furniture"),
+    ("VVVV", "VAUT", "Autos"),
+    ("VVVV", "VMOT", "Motorcycles"),
+    ("RRRR", "RHFR", "Housing For Rent"),
+    ("RRRR", "RHFS", "Housing For Sale"),
+    ("JJJJ", "JENG", "Engineering Jobs"),
+]
+
+# Each source is a (code, name) tuple.
+
+SOURCES = [
+    ("CRAIG", "Craigslist"),
+    ("EBAYC", "eBay Classifieds"),
+    ("AUTOD", "Autotrader"),
+    ("INDEE", "Indeed"),
+]
+
+WORDS = ["vintage", "bike", "apartment", "sofa", "laptop", "camera", "car",
+         "engineer", "cheap", "new", "used", "large", "small", "red", "blue",
+         "excellent", "condition", "must", "sell", "today", "downtown",
+         "studio", "bedroom", "parking", "garden", "warranty", "leather"]
+
+TIMESTAMP_FORMAT = "%Y/%m/%d %H:%M:%S UTC"
+
+#############################################################################
+
+def makePostingDicts(count, seed=0, startTime=None):
+    """ Return a list of synthetic postings, as dictionaries.
+
+        The dictionaries are in the format returned by the 3taps server, with
+        timestamps as strings.  The postings are timestamped one minute apart,
+        starting at 'startTime'.
+    """
+    if startTime == None:
+        startTime = datetime.datetime(2011, 1, 1)
+
+    rng      = random.Random(seed)
+    postings = []
+    for i in range(count):
+        location  = rng.choice(LOCATIONS)
+        category  = rng.choice(CATEGORIES)
+        source    = rng.choice(SOURCES)
+        timestamp = startTime + datetime.timedelta(minutes=i)
+
+        posting = {}
+        posting['postKey']     = "P%07d" % i
+        posting['location']    = location[0]
+        posting['category']    = category[1]
+        posting['source']      = source[0]
+        posting['heading']     = _makeText(rng, 4, 8)
+        posting['body']        = _makeText(rng, 20, 80)
+        posting['latitude']    = location[5] + rng.uniform(-0.1, 0.1)
+        posting['longitude']   = location[6] + rng.uniform(-0.1, 0.1)
+        posting['language']    = "EN"
+        posting['price']       = round(rng.uniform(1, 5000), 2)
+        posting['currency']    = "USD"
+        posting['images']      = ["http://images.example.com/%d/%d.jpg"
+                                  % (i, n) for n in range(rng.randint(0, 3))]
+        posting['externalID']  = str(1000000 + i)
+        posting['externalURL'] = "http://example.com/posting/%d" % i
+        posting['accountName'] = "user%d" % rng.randint(1, 500)
+        posting['accountID']   = posting['accountName']
+        posting['timestamp']   = timestamp.strftime(TIMESTAMP_FORMAT)
+        posting['annotations'] = {'color' : rng.choice(["red", "blue"]),
+                                  'size'  : rng.choice(["S", "M", "L"])}
+        posting['trustedAnnotations'] = {}
+        posting['clickCount']  = rng.randint(0, 100)
+        postings.append(posting)
+    return postings
+
+
+def makePostings(count, seed=0, startTime=None):
+    """ Return a list of synthetic Posting objects.
+
+        Unlike makePostingDicts(), the Posting objects have their timestamps
+        as datetime.datetime objects, and don't have a post key, so they are
+        suitable for passing to PostingAPIClient.createMany().
+    """
+    postings = []
+    for postingDict in makePostingDicts(count, seed, startTime):
+        del postingDict['postKey']
+        postingDict['timestamp'] = \
+            datetime.datetime.strptime(postingDict['timestamp'],
+                                       TIMESTAMP_FORMAT)
+        postings.append(Posting(**postingDict))
+    return postings
+
+
+def makeGeocodeRequests(count, seed=0, duplicateRate=0.5):
+    """ Return a list of synthetic geocoding requests, as dictionaries.
+
+        Each dictionary has the keyword arguments for a GeocodeRequest.  Up
+        to 'duplicateRate' of the requests will repeat an earlier request,
+        with different case and spacing.
+    """
+    rng      = random.Random(seed)
+    requests = []
+    for i in range(count):
+        if len(requests) > 0 and rng.random() < duplicateRate:
+            request = dict(rng.choice(requests))
+            for key,value in request.items():
+                request[key] = "  " + value.upper() + " "
+        else:
+            location = rng.choice(LOCATIONS)
+            request  = {'city'    : location[1],
+                        'country' : location[4],
+                        'street'  : "%d %s St" % (rng.randint(1, 9999),
+                                                  rng.choice(WORDS).title())}
+        requests.append(request)
+    return requests
+
+
+def makeStatusEvents(count, seed=0):
+    """ Return a list of synthetic status events.
+
+        The events are dictionaries in the format accepted by
+        StatusAPIClient.update().
+    """
+    rng    = random.Random(seed)
+    events = []
+    for i in range(count):
+        events.append({'status'     : rng.choice(["found", "got",
+                                                  "processed", "sent"]),
+                       'externalID' : str(1000000 + i / 4),
+                       'source'     : rng.choice(SOURCES)[0],
+                       'timestamp'  : datetime.datetime(2011, 1, 1) +
+                                      datetime.timedelta(seconds=i),
+                       'attributes' : {'worker' : rng.randint(1, 8)}})
+    return events
+
+
+def makeCategoryDicts():
+    """ Return the synthetic categories, in the format returned by the server.
+    """
+    categories = []
+    for group,code,name in CATEGORIES:
+        categories.append({'group'       : group,
+                           'code'        : code,
+                           'category'    : name,
+                           'annotations' : [
+                               {'name'    : "condition",
+                                'type'    : "select",
+                                'options' : [{'value' : "new"},
+                                             {'value' : "used"}]}]})
+    return categories
+
+
+def makeLocationDicts():
+    """ Return the synthetic locations, in the format returned by the server.
+    """
+    locations = []
+    for rank,location in enumerate(LOCATIONS):
+        code,city,stateCode,stateName,country,latitude,longitude = location
+        locations.append({'code'        : code,
+                          'countryRank' : 1,
+                          'country'     : country,
+                          'cityRank'    : rank + 1,
+                          'city'        : city,
+                          'stateCode'   : stateCode,
+                          'stateName'   : stateName,
+                          'hidden'      : False,
+                          'latitude'    : latitude,
+                          'longitude'   : longitude})
+    return locations
+
+
+def makeSourceDicts():
+    """ Return the synthetic sources, in the format returned by the server.
+    """
+    sources = []
+    for code,name in SOURCES:
+        sources.append({'code'        : code,
+                        'name'        : name,
+                        'logo_url'    : "http://example.com/%s.png" % code,
+                        'logo_sm_url' : "http://example.com/%s-sm.png" % code})
+    return sources
+
+#############################################################################
+
+def _makeText(rng, minWords, maxWords):
+    """ Return a random string of between 'minWords' and 'maxWords' words.
+    """
+    numWords = rng.randint(minWords, maxWords)
+    return " ".join([rng.choice(WORDS) for i in range(numWords)])
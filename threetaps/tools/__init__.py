@@ -0,0 +1,13 @@
+""" __init__.py
+
+    threetaps.tools package initialization file.
+
+    This package contains tools which are built on top of the API clients,
+    such as the bulk posting importer.  Note that we load the PostingImporter,
+    IngestJournal, DedupIndex and SearchMirror classes into the
+    threetaps.tools namespace, to make them easier to access.
+"""
+from threetaps.tools.dedupIndex import DedupIndex
+from threetaps.tools.ingestJournal import IngestJournal
+from threetaps.tools.postingImporter import PostingImporter
+from threetaps.tools.searchMirror import SearchMirror
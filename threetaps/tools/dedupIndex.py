@@ -0,0 +1,480 @@
+""" threetaps.tools.dedupIndex
+
+    This Python module implements the DedupIndex class, a persistent index of
+    the postings which have already been created in the 3taps system.
+
+    When a source is re-scraped, most of the postings found will already
+    exist in 3taps under the same source and external ID, and most of those
+    won't have changed.  The DedupIndex remembers the posting key and a hash
+    of the contents of every posting it has created, so that unchanged
+    postings can be dropped before they are even encoded, and changed ones
+    sent as updates rather than creating duplicates:
+
+        index = DedupIndex("craig.index")
+        for action,postKey in index.createOrUpdate(api, postings):
+            ...
+        index.close()
+
+    The index is stored in an SQLite database, with an in-memory Bloom filter
+    in front of it.  Since most lookups during a large scrape are either for
+    postings the index has never seen (which the Bloom filter answers without
+    touching the database) or for postings it has, the database is only
+    queried when there is a good chance of finding something.
+"""
+from threetaps.api.base.chunking import chunked, concurrentMap
+from threetaps.api.clients.encoders import encodePosting
+
+import copy
+import hashlib
+import math
+import os
+import sqlite3
+import struct
+import threading
+import simplejson as json
+
+#############################################################################
+
+# The actions taken for each posting passed to DedupIndex.createOrUpdate():
+
+NEW       = "new"       # The posting was created.
+CHANGED   = "changed"   # The existing posting was updated.
+UNCHANGED = "unchanged" # The posting already exists, and was not sent.
+
+# The Posting fields which are left out of the content hash by default.
+
+DEFAULT_IGNORED_FIELDS = ["postKey", "clickCount"]
+
+# The JSON encoder used to build the text which is hashed.  The keys are
+# sorted, so that equal postings always produce the same text.
+
+_hashEncoder = json.JSONEncoder(sort_keys=True, separators=(",", ":"))
+
+#############################################################################
+
+class BloomFilter:
+    """ A Bloom filter of strings.
+
+        A Bloom filter is a compact set which can say for certain that a
+        string is not in the set, but can only say that a string is probably
+        in the set.  The filter is sized to hold 'capacity' strings with the
+        given false positive rate; adding more strings than this increases
+        the false positive rate.
+    """
+    def __init__(self, capacity, falsePositiveRate=0.01):
+        """ Standard initializer.
+        """
+        capacity = max(1, capacity)
+        numBits  = int(math.ceil(-capacity * math.log(falsePositiveRate)
+                                 / (math.log(2) ** 2)))
+
+        self._numBits   = max(8, numBits)
+        self._numHashes = max(1, int(round(self._numBits * math.log(2)
+                                           / capacity)))
+        self._bits      = bytearray((self._numBits + 7) / 8)
+        self._count     = 0
+
+
+    def add(self, key):
+        """ Add the given string to the filter.
+        """
+        bits = self._bits
+        for position in self._positions(key):
+            bits[position >> 3] |= 1 << (position & 7)
+        self._count = self._count + 1
+
+
+    def mightContain(self, key):
+        """ Return True if the given string might be in the filter.
+
+            If we return False, the string is definitely not in the filter.
+        """
+        bits = self._bits
+        for position in self._positions(key):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+    def getCount(self):
+        """ Return the number of strings added to the filter.
+        """
+        return self._count
+
+
+    def save(self, path):
+        """ Save the filter to the given file.
+        """
+        f = open(path, "wb")
+        try:
+            f.write(json.dumps({'numBits'   : self._numBits,
+                                'numHashes' : self._numHashes,
+                                'count'     : self._count}) + "\n")
+            f.write(self._bits)
+        finally:
+            f.close()
+
+
+    def load(path):
+        """ Load and return a filter saved by save().
+        """
+        f = open(path, "rb")
+        try:
+            header = json.loads(f.readline())
+            bits   = bytearray(f.read())
+        finally:
+            f.close()
+
+        if len(bits) != (header['numBits'] + 7) / 8:
+            raise IOError("Truncated Bloom filter file: " + path)
+
+        bloom = BloomFilter(1)
+        bloom._numBits   = header['numBits']
+        bloom._numHashes = header['numHashes']
+        bloom._count     = header['count']
+        bloom._bits      = bits
+        return bloom
+
+    load = staticmethod(load)
+
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _positions(self, key):
+        """ Return the bit positions for the given string.
+
+            We use the "double hashing" technique, deriving all the hash
+            functions from the two halves of a single MD5 digest.
+        """
+        h1,h2 = struct.unpack("<QQ", hashlib.md5(key).digest())
+        numBits = self._numBits
+        return [(h1 + i * h2) % numBits for i in xrange(self._numHashes)]
+
+#############################################################################
+
+class DedupIndex:
+    """ A persistent index of postings, keyed by source and external ID.
+
+        The index is stored in an SQLite database at 'path', which is created
+        if it doesn't already exist.  The Bloom filter is saved alongside it,
+        in a file with ".bloom" added to the path, and is rebuilt from the
+        database if that file is missing or out of date.  'expectedItems' and
+        'falsePositiveRate' are used to size a new Bloom filter.
+
+        Postings are identified by their 'source' and 'externalID' fields;
+        postings without both of these are never treated as duplicates.  A
+        posting's content hash covers all its fields except those listed in
+        'ignoredFields'.
+    """
+    def __init__(self, path, expectedItems=1000000, falsePositiveRate=0.01,
+                 ignoredFields=None):
+        """ Standard initializer.
+        """
+        if ignoredFields == None:
+            ignoredFields = DEFAULT_IGNORED_FIELDS
+
+        self._path              = path
+        self._bloomPath         = path + ".bloom"
+        self._expectedItems     = expectedItems
+        self._falsePositiveRate = falsePositiveRate
+        self._ignoredFields     = ignoredFields
+        self._lock              = threading.Lock()
+        self._stats             = {'new'            : 0,
+                                   'changed'        : 0,
+                                   'unchanged'      : 0,
+                                   'failed'         : 0,
+                                   'lookups'        : 0,
+                                   'falsePositives' : 0}
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS postings (" +
+                         "source TEXT NOT NULL, " +
+                         "externalID TEXT NOT NULL, " +
+                         "postKey TEXT NOT NULL, " +
+                         "hash BLOB NOT NULL, " +
+                         "PRIMARY KEY (source, externalID))")
+        self._db.commit()
+
+        self._bloom = self._loadBloomFilter()
+
+
+    def contentHash(self, posting):
+        """ Return the content hash for the given Posting object.
+        """
+        postingDict = encodePosting(posting)
+        for field in self._ignoredFields:
+            postingDict.pop(field, None)
+        return hashlib.sha1(_hashEncoder.encode(postingDict)).digest()
+
+
+    def lookup(self, source, externalID):
+        """ Return the (postKey, hash) recorded for the given posting.
+
+            If the posting isn't in the index, we return None.
+        """
+        key = _makeKey(source, externalID)
+
+        self._lock.acquire()
+        try:
+            if not self._bloom.mightContain(key):
+                return None
+            self._stats['lookups'] = self._stats['lookups'] + 1
+            row = self._db.execute("SELECT postKey, hash FROM postings " +
+                                   "WHERE source=? AND externalID=?",
+                                   (source, externalID)).fetchone()
+            if row == None:
+                self._stats['falsePositives'] = \
+                        self._stats['falsePositives'] + 1
+                return None
+            return (row[0], str(row[1]))
+        finally:
+            self._lock.release()
+
+
+    def record(self, source, externalID, postKey, contentHash):
+        """ Record the posting key and content hash of a posting.
+
+            The change is not saved to disk until commit() or close() is
+            called.
+        """
+        self._lock.acquire()
+        try:
+            cursor = self._db.execute("UPDATE postings SET postKey=?, " +
+                                      "hash=? WHERE source=? AND " +
+                                      "externalID=?",
+                                      (postKey, sqlite3.Binary(contentHash),
+                                       source, externalID))
+            if cursor.rowcount == 0:
+                self._db.execute("INSERT INTO postings VALUES (?, ?, ?, ?)",
+                                 (source, externalID, postKey,
+                                  sqlite3.Binary(contentHash)))
+                self._bloom.add(_makeKey(source, externalID))
+        finally:
+            self._lock.release()
+
+
+    def classify(self, posting):
+        """ Decide what should be done with the given Posting object.
+
+            We return an (action, postKey, contentHash) tuple, where 'action'
+            is NEW, CHANGED or UNCHANGED, and 'postKey' is the posting key of
+            the existing posting, or None if the posting is new.  The content
+            hash is None if the posting has no source or external ID.
+        """
+        if posting.source == None or posting.externalID == None:
+            return (NEW, None, None)
+
+        contentHash = self.contentHash(posting)
+
+        existing = self.lookup(posting.source, posting.externalID)
+        if existing == None:
+            return (NEW, None, contentHash)
+        elif existing[1] == contentHash:
+            return (UNCHANGED, existing[0], contentHash)
+        else:
+            return (CHANGED, existing[0], contentHash)
+
+
+    def createOrUpdate(self, client, postings, chunkSize=1000, maxWorkers=1):
+        """ Send the given postings to the 3taps system, skipping duplicates.
+
+            'client' is the PostingAPIClient to use, and 'postings' can be a
+            list or any other iterable yielding Posting objects.  The
+            postings are read in chunks of 'chunkSize', and each chunk is
+            split into new postings, which are sent in a single createMany()
+            request, and changed postings, which have their 'postKey' set and
+            are sent in a single updateMany() request.  Unchanged postings
+            are not sent at all.  Up to 'maxWorkers' chunks are sent at once;
+            note that if the same posting appears in two chunks being sent at
+            the same time, it may be created twice.
+
+            We return an iterator which yields an (action, postKey) tuple for
+            each posting in turn, where 'action' is NEW, CHANGED or UNCHANGED.
+            'postKey' is the posting's key, or None if the posting could not
+            be created or updated.  The index is updated, and committed to
+            disk, as each chunk is completed.
+        """
+        def sendChunk(chunk):
+            return self._sendChunk(client, chunk)
+
+        for results in concurrentMap(sendChunk,
+                                     self._classifyChunks(postings,
+                                                          chunkSize),
+                                     maxWorkers):
+            for result in results:
+                yield result
+
+
+    def commit(self):
+        """ Save any changes to the index.
+        """
+        self._lock.acquire()
+        try:
+            self._db.commit()
+        finally:
+            self._lock.release()
+
+
+    def close(self):
+        """ Save any changes to the index, and close it.
+        """
+        self._lock.acquire()
+        try:
+            self._db.commit()
+            self._db.close()
+            self._bloom.save(self._bloomPath)
+        finally:
+            self._lock.release()
+
+
+    def getStats(self):
+        """ Return a dictionary of statistics about the index.
+
+            The returned dictionary will have the following entries:
+
+                'new', 'changed', 'unchanged'
+
+                    The number of postings passed to createOrUpdate() which
+                    were created, updated or skipped.
+
+                'failed'
+
+                    The number of postings which could not be created or
+                    updated.
+
+                'lookups'
+
+                    The number of times the database was queried, because the
+                    Bloom filter could not rule out a posting.
+
+                'falsePositives'
+
+                    The number of those queries which didn't find anything.
+        """
+        self._lock.acquire()
+        try:
+            return dict(self._stats)
+        finally:
+            self._lock.release()
+
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _loadBloomFilter(self):
+        """ Load our Bloom filter, or rebuild it from the database.
+        """
+        count = self._db.execute("SELECT COUNT(*) FROM postings").fetchone()[0]
+
+        if os.path.exists(self._bloomPath):
+            try:
+                bloom = BloomFilter.load(self._bloomPath)
+                if bloom.getCount() == count:
+                    return bloom
+            except (IOError, ValueError):
+                pass
+
+        bloom = BloomFilter(max(count, self._expectedItems),
+                            self._falsePositiveRate)
+        for source,externalID in self._db.execute("SELECT source, " +
+                                                  "externalID FROM postings"):
+            bloom.add(_makeKey(source, externalID))
+        return bloom
+
+
+    def _classifyChunks(self, postings, chunkSize):
+        """ Classify the given postings, a chunk at a time.
+
+            We yield a list of [posting, action, postKey, contentHash,
+            duplicateOf] entries for each chunk.  If the same posting appears
+            more than once in a chunk, only the last copy is sent; the earlier
+            copies are treated as unchanged, and 'duplicateOf' is set to the
+            index of the last copy.
+        """
+        for chunk in chunked(postings, chunkSize):
+            classified = []
+            lastCopy   = {} # Maps (source, externalID) to index in chunk.
+            for posting in chunk:
+                action,postKey,contentHash = self.classify(posting)
+                if contentHash != None:
+                    key = (posting.source, posting.externalID)
+                    if key in lastCopy:
+                        earlier = classified[lastCopy[key]]
+                        earlier[1] = UNCHANGED
+                        earlier[4] = len(classified)
+                    lastCopy[key] = len(classified)
+                classified.append([posting, action, postKey, contentHash,
+                                   None])
+            yield classified
+
+
+    def _sendChunk(self, client, classified):
+        """ Send a single classified chunk to the server.
+
+            We return the list of (action, postKey) results for the chunk.
+        """
+        new     = [i for i in range(len(classified))
+                   if classified[i][1] == NEW]
+        changed = [i for i in range(len(classified))
+                   if classified[i][1] == CHANGED]
+        postKeys = [entry[2] for entry in classified]
+
+        if len(new) > 0:
+            responses = client.createMany([classified[i][0] for i in new])
+            if responses == None:
+                responses = []
+            for j in range(len(new)):
+                # A short response leaves the remaining postings failed.
+                if j < len(responses) and "postKey" in responses[j]:
+                    postKeys[new[j]] = responses[j]['postKey']
+                else:
+                    postKeys[new[j]] = None
+
+        if len(changed) > 0:
+            updates = []
+            for i in changed:
+                # Don't change the caller's Posting object.
+                posting = copy.copy(classified[i][0])
+                posting.postKey = classified[i][2]
+                updates.append(posting)
+            if not client.updateMany(updates):
+                for i in changed:
+                    postKeys[i] = None
+
+        self._lock.acquire()
+        try:
+            for i in range(len(classified)):
+                action = classified[i][1]
+                if postKeys[i] == None and action != UNCHANGED:
+                    self._stats['failed'] = self._stats['failed'] + 1
+                else:
+                    self._stats[action] = self._stats[action] + 1
+        finally:
+            self._lock.release()
+
+        for i in range(len(classified)):
+            if classified[i][4] != None:
+                postKeys[i] = postKeys[classified[i][4]]
+
+        for i in new + changed:
+            posting = classified[i][0]
+            if postKeys[i] != None and classified[i][3] != None:
+                self.record(posting.source, posting.externalID, postKeys[i],
+                            classified[i][3])
+        self.commit()
+
+        return [(classified[i][1], postKeys[i])
+                for i in range(len(classified))]
+
+#############################################################################
+
+def _makeKey(source, externalID):
+    """ Return the Bloom filter key for the given source and external ID.
+    """
+    parts = []
+    for part in [source, externalID]:
+        if isinstance(part, unicode):
+            part = part.encode("utf-8")
+        parts.append(str(part))
+    return "\0".join(parts)
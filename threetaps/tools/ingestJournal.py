@@ -0,0 +1,329 @@
+""" threetaps.tools.ingestJournal
+
+    This Python module implements the IngestJournal class, a write-ahead
+    journal which makes a long series of posting/create requests resumable.
+
+    Each batch of postings is recorded in the journal before it is sent to
+    the 3taps server, and the server's responses are recorded once they
+    arrive.  If the process dies partway through, the journal tells us which
+    batches were acknowledged by the server, so that a restarted writer can
+    resend only the unacknowledged batches and carry on from where it
+    stopped, rather than resubmitting (and duplicating) everything.  To use a
+    journal, pass it to PostingAPIClient.createStream():
+
+        journal = IngestJournal("postings.journal")
+        for response in api.createStream(postings, journal=journal):
+            ...
+        journal.close()
+"""
+import os
+import re
+import threading
+import simplejson as json
+
+#############################################################################
+
+# The journal file consists of one JSON object per line.  A batch record
+# looks like this:
+#
+#     {"batch":3,"first":3000,"count":1000,"postings":[...]}
+#
+# where 'first' is the index of the batch's first posting in the stream of
+# postings being created.  Once the server responds, an acknowledgement
+# record is written:
+#
+#     {"ack":3,"results":[...]}
+#
+# The record headers are always written in this order, so that the journal
+# can be scanned without decoding the postings themselves.
+
+_BATCH_PATTERN = re.compile(r'^\{"batch":(\d+),"first":(\d+),"count":(\d+),')
+_ACK_PATTERN   = re.compile(r'^\{"ack":(\d+),')
+
+#############################################################################
+
+class IngestJournal:
+    """ An append-only journal of posting/create batches.
+
+        The journal is stored in the file at 'path', which is created if it
+        doesn't already exist.  If it does exist, the records written by an
+        earlier run are read back in.  A partially-written record at the end
+        of the file, left by a crash, is discarded.  Corrupt records anywhere
+        else in the file are skipped, so that the valid records after them
+        are kept.
+
+        Every record is handed to the operating system as soon as it is
+        written, so nothing is lost if the process itself dies.  To survive a
+        power failure or operating system crash as well, the journal file is
+        also flushed to disk (using fsync) after every 'syncEvery' records.
+        The default of one gives the full write-ahead guarantee, but costs a
+        disk flush for every batch and every acknowledgement.  Larger values
+        batch the flushes together, at the risk of losing up to 'syncEvery'
+        records (and so resending those batches) after a system crash.  If
+        'syncEvery' is zero, the journal is only flushed to disk when it is
+        closed.
+    """
+    def __init__(self, path, syncEvery=1):
+        """ Standard initializer.
+        """
+        self._path         = path
+        self._syncEvery    = syncEvery
+        self._lock         = threading.Lock()
+        self._nextBatchId  = 0
+        self._numPostings  = 0  # Number of postings recorded in batches.
+        self._numAcked     = 0  # Number of batches acknowledged.
+        self._numUnsynced  = 0  # Number of records written since last sync.
+        self._numSyncs     = 0
+        self._numBytes     = 0  # Number of bytes written by this run.
+        self._numCorrupt   = 0  # Number of corrupt records skipped.
+        self._pending      = {} # Maps batch ID to the file offset of an
+                                # unacknowledged batch from an earlier run.
+
+        self._recover()
+        self._file = open(path, "ab")
+
+    # ======================
+    # == RESUMING A WRITE ==
+    # ======================
+
+    def getNumPostings(self):
+        """ Return the number of postings recorded in the journal.
+
+            This is the number of postings at the start of the stream which
+            have already been handled, either by being acknowledged by the
+            server, or by being recorded in a batch which getPending() will
+            return.
+        """
+        return self._numPostings
+
+
+    def getPending(self):
+        """ Return the batches from an earlier run which weren't acknowledged.
+
+            We return a list of (batchId, postings) tuples, in the order in
+            which the batches were written, where 'postings' is a list of
+            postings, each encoded as a dictionary.  These batches should be
+            resent, and their responses passed to logResults().
+        """
+        self._lock.acquire()
+        try:
+            offsets = sorted([(offset, batchId) for batchId,offset
+                              in self._pending.items()])
+        finally:
+            self._lock.release()
+
+        batches = []
+        f = open(self._path, "rb")
+        try:
+            for offset,batchId in offsets:
+                f.seek(offset)
+                record = json.loads(f.readline())
+                batches.append((batchId, record['postings']))
+        finally:
+            f.close()
+        return batches
+
+    # =====================
+    # == WRITING RECORDS ==
+    # =====================
+
+    def logBatch(self, postingData, numPostings):
+        """ Record a batch of postings which is about to be sent.
+
+            'postingData' is the batch's list of postings, already encoded as
+            a JSON array, and 'numPostings' is the number of postings in it.
+            We return the ID allocated to the batch, which should be passed
+            to logResults() once the server has responded.
+
+            Batches must be logged in the same order as their postings appear
+            in the stream being created.
+        """
+        self._lock.acquire()
+        try:
+            batchId = self._nextBatchId
+            self._nextBatchId = self._nextBatchId + 1
+            self._write('{"batch":%d,"first":%d,"count":%d,"postings":%s}\n'
+                        % (batchId, self._numPostings, numPostings,
+                           postingData))
+            self._numPostings = self._numPostings + numPostings
+            return batchId
+        finally:
+            self._lock.release()
+
+
+    def logResults(self, batchId, results):
+        """ Record the server's responses to a batch of postings.
+
+            'results' is the list of responses returned by the posting/create
+            endpoint, which includes the allocated posting keys, and the
+            details of any postings which were rejected.  Once this has been
+            recorded, the batch will not be resent.
+        """
+        self._lock.acquire()
+        try:
+            self._write('{"ack":%d,"results":%s}\n' %
+                        (batchId, json.dumps(results, separators=(",", ":"))))
+            self._numAcked = self._numAcked + 1
+            if batchId in self._pending:
+                del self._pending[batchId]
+        finally:
+            self._lock.release()
+
+
+    def sync(self):
+        """ Flush any unsynced records to disk.
+        """
+        self._lock.acquire()
+        try:
+            self._sync()
+        finally:
+            self._lock.release()
+
+
+    def close(self):
+        """ Flush the journal to disk, and close it.
+        """
+        self._lock.acquire()
+        try:
+            self._sync()
+            self._file.close()
+        finally:
+            self._lock.release()
+
+
+    def getStats(self):
+        """ Return a dictionary of statistics about the journal.
+
+            The returned dictionary will have the following entries:
+
+                'batches'
+
+                    The total number of batches recorded, including those
+                    from earlier runs.
+
+                'acknowledged'
+
+                    The number of batches acknowledged during this run.
+
+                'pending'
+
+                    The number of batches from earlier runs which are still
+                    waiting to be acknowledged.
+
+                'syncs'
+
+                    The number of times the journal has been flushed to disk.
+
+                'bytes'
+
+                    The number of bytes written to the journal by this run.
+
+                'corrupt'
+
+                    The number of corrupt records which were skipped when the
+                    journal was read back in.
+        """
+        self._lock.acquire()
+        try:
+            return {'batches'      : self._nextBatchId,
+                    'acknowledged' : self._numAcked,
+                    'pending'      : len(self._pending),
+                    'syncs'        : self._numSyncs,
+                    'bytes'        : self._numBytes,
+                    'corrupt'      : self._numCorrupt}
+        finally:
+            self._lock.release()
+
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _recover(self):
+        """ Read back the records written to our journal by an earlier run.
+
+            If the journal ends with an incomplete or corrupt record, it is
+            truncated to remove it.  Corrupt records followed by valid ones
+            are skipped, and counted in our statistics.  Batch records are
+            decoded in full, so that a batch whose postings are corrupt is
+            skipped here rather than making getPending() fail.
+        """
+        if not os.path.exists(self._path):
+            return
+
+        f = open(self._path, "r+b")
+        try:
+            offset     = 0 # Offset of the current record.
+            validEnd   = 0 # End of the last valid record.
+            numSkipped = 0 # Corrupt records since the last valid record.
+            for line in f:
+                if not line.endswith("\n"):
+                    break # Partially-written record; always the last one.
+
+                valid = False
+                match = _BATCH_PATTERN.match(line)
+                if match != None:
+                    if _isValidJSON(line):
+                        valid   = True
+                        batchId = int(match.group(1))
+                        self._pending[batchId] = offset
+                        self._nextBatchId = max(self._nextBatchId,
+                                                batchId + 1)
+                        self._numPostings = max(self._numPostings,
+                                                int(match.group(2)) +
+                                                int(match.group(3)))
+                else:
+                    match = _ACK_PATTERN.match(line)
+                    if match != None:
+                        valid   = True
+                        batchId = int(match.group(1))
+                        if batchId in self._pending:
+                            del self._pending[batchId]
+
+                offset = offset + len(line)
+                if not valid:
+                    numSkipped = numSkipped + 1 # Corrupt record.
+                else:
+                    self._numCorrupt = self._numCorrupt + numSkipped
+                    numSkipped       = 0
+                    validEnd         = offset
+
+            f.seek(0, 2)
+            if f.tell() > validEnd:
+                f.truncate(validEnd)
+        finally:
+            f.close()
+
+
+    def _write(self, record):
+        """ Append a record to the journal, flushing it to disk if necessary.
+
+            Note that the caller must hold our lock.
+        """
+        self._file.write(record)
+        self._file.flush()
+        self._numBytes    = self._numBytes + len(record)
+        self._numUnsynced = self._numUnsynced + 1
+        if self._syncEvery > 0 and self._numUnsynced >= self._syncEvery:
+            self._sync()
+
+
+    def _sync(self):
+        """ Flush any unsynced records to disk.
+
+            Note that the caller must hold our lock.
+        """
+        if self._numUnsynced > 0:
+            os.fsync(self._file.fileno())
+            self._numUnsynced = 0
+            self._numSyncs    = self._numSyncs + 1
+
+#############################################################################
+
+def _isValidJSON(line):
+    """ Return True if the given journal record can be decoded.
+    """
+    try:
+        json.loads(line)
+    except ValueError:
+        return False
+    return True
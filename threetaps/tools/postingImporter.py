@@ -0,0 +1,468 @@
+""" threetaps.tools.postingImporter
+
+    This Python module implements the PostingImporter class, which reads
+    postings from large JSONL or CSV files and creates them in the 3taps
+    system.
+
+    The input file is memory-mapped and split into blocks of whole lines,
+    which are parsed into postings by a pool of worker processes.  The parsed
+    postings are then sent to the server in chunks using
+    PostingAPIClient.createStream().  Rows which can't be parsed, or which
+    the server rejects, are written to a reject file.
+"""
+from threetaps.api.clients.encoders import POSTING_FIELDS
+from threetaps.api.models import Posting
+
+import collections
+import csv
+import datetime
+import mmap
+import multiprocessing
+import os
+import time
+import simplejson as json
+
+#############################################################################
+
+FORMAT_JSONL = "jsonl" # One JSON object per line.
+FORMAT_CSV   = "csv"   # Comma-separated values, with a header row.
+
+# The names of the Posting fields which can be imported.
+
+FIELD_NAMES = [name for name,kind in POSTING_FIELDS]
+
+# The timestamp formats we accept, in addition to a number of seconds since
+# the Unix epoch.
+
+TIMESTAMP_FORMATS = ["%Y/%m/%d %H:%M:%S UTC",
+                     "%Y-%m-%dT%H:%M:%SZ",
+                     "%Y-%m-%dT%H:%M:%S",
+                     "%Y-%m-%d %H:%M:%S"]
+
+#############################################################################
+
+class PostingImporter:
+    """ Import postings from a JSONL or CSV file into the 3taps system.
+
+        Each row of the input file is converted into a Posting object.  By
+        default, each column (or JSON key) is copied to the Posting field of
+        the same name, and unknown columns are ignored; 'columnMap' can be a
+        dictionary mapping input column names to Posting field names, to
+        import files which use different names.  Values are converted as
+        follows:
+
+            latitude, longitude, price
+
+                Converted to floating-point numbers.
+
+            clickCount
+
+                Converted to an integer.
+
+            timestamp, expiration
+
+                Parsed in any of the TIMESTAMP_FORMATS, or as a number of
+                seconds since the Unix epoch.  All times are taken to be UTC.
+
+            annotations, trustedAnnotations
+
+                A JSON object, or (in a JSONL file) a nested object.
+
+            images
+
+                A JSON array, a nested array, or a list of URLs separated by
+                "|" characters.
+
+        Empty values are treated as missing.  Note that CSV rows must not
+        contain line breaks inside quoted values.
+
+        The rows are parsed by 'numProcesses' worker processes, each handling
+        a block of about 'blockSize' bytes at a time; if 'numProcesses' is
+        zero, the rows are parsed in this process.  The postings are sent to
+        the server in chunks of 'chunkSize', with up to 'maxWorkers' chunks
+        being sent at once.
+    """
+    def __init__(self, client, chunkSize=1000, maxWorkers=4,
+                 numProcesses=None, blockSize=4*1024*1024, columnMap=None):
+        """ Standard initializer.
+
+            'client' is the PostingAPIClient to create the postings with.  If
+            'numProcesses' is None, one worker process is used for each CPU.
+        """
+        if numProcesses == None:
+            numProcesses = multiprocessing.cpu_count()
+        if columnMap == None:
+            columnMap = {}
+
+        for field in columnMap.values():
+            if field not in FIELD_NAMES:
+                raise RuntimeError("Unknown posting field: " + repr(field))
+
+        self._client       = client
+        self._chunkSize    = chunkSize
+        self._maxWorkers   = maxWorkers
+        self._numProcesses = numProcesses
+        self._blockSize    = blockSize
+        self._columnMap    = columnMap
+
+
+    def importFile(self, path, format=None, rejectPath=None, progress=None,
+                   progressInterval=10, journal=None):
+        """ Import the postings in the given file.
+
+            'format' is either FORMAT_JSONL or FORMAT_CSV; if it is None, the
+            format is chosen based on the file's extension.
+
+            If 'rejectPath' is given, each row which could not be imported is
+            written to that file as a JSON object with the following entries:
+
+                'line'
+
+                    The line number of the row in the input file, starting at
+                    one.
+
+                'row'
+
+                    The text of the row, without the trailing line break.
+
+                'error'
+
+                    A string describing why the row was rejected.
+
+            Rows which could not be parsed are written as soon as they are
+            read, so the reject file is not necessarily in line order.
+
+            If 'journal' is given, it should be an IngestJournal object,
+            which is passed to PostingAPIClient.createStream() so that an
+            interrupted import can be resumed by importing the same file with
+            the same journal.  When resuming, the rows already imported are
+            skipped, and new rejects are appended to the reject file.
+            Resent postings from unacknowledged batches are rejected with a
+            'line' of None, and 'row' holding the posting in JSON format.
+
+            If 'progress' is given, it is called with a statistics dictionary
+            (as described below) every 'progressInterval' seconds while the
+            import is running.
+
+            Upon completion, we return a dictionary with the following
+            entries:
+
+                'rows'
+
+                    The number of rows read from the input file, not
+                    including any skipped rows.
+
+                'created'
+
+                    The number of postings created.
+
+                'rejected'
+
+                    The number of rows which could not be imported.
+
+                'skipped'
+
+                    The number of rows skipped because they were imported by
+                    an earlier run, according to the journal.
+
+                'elapsed'
+
+                    The number of seconds taken by the import.
+
+                'rowsPerSec'
+
+                    The number of rows imported per second.
+        """
+        if format == None:
+            format = guessFormat(path)
+        if format not in [FORMAT_JSONL, FORMAT_CSV]:
+            raise RuntimeError("Unknown file format: " + repr(format))
+
+        # Parsed rows which are waiting for a response from the server, as
+        # (lineNo, row) tuples in the same order as the postings sent.
+
+        pending = collections.deque()
+
+        if journal != None:
+            numSkipped = journal.getNumPostings()
+            for batchId,postings in journal.getPending():
+                for posting in postings:
+                    pending.append((None, json.dumps(posting)))
+        else:
+            numSkipped = 0
+
+        if rejectPath != None:
+            if numSkipped > 0:
+                rejectFile = open(rejectPath, "a")
+            else:
+                rejectFile = open(rejectPath, "w")
+        else:
+            rejectFile = None
+
+        stats = {'rows'       : 0,
+                 'created'    : 0,
+                 'rejected'   : 0,
+                 'skipped'    : 0,
+                 'elapsed'    : 0,
+                 'rowsPerSec' : 0}
+        startTime    = time.time()
+        lastProgress = startTime
+
+        def reject(lineNo, row, error):
+            stats['rejected'] = stats['rejected'] + 1
+            if rejectFile != None:
+                rejectFile.write(json.dumps({'line'  : lineNo,
+                                             'row'   : row,
+                                             'error' : error}) + "\n")
+
+        def generatePostings():
+            numPostings = 0
+            for lineNo,row,fields,error in self._parseFile(path, format):
+                if numPostings < numSkipped:
+                    # This row was handled by an earlier run.  The posting is
+                    # still yielded, as createStream() does the skipping.
+                    stats['skipped'] = stats['skipped'] + 1
+                    if error == None:
+                        numPostings = numPostings + 1
+                        yield Posting(**fields)
+                    continue
+
+                stats['rows'] = stats['rows'] + 1
+                if error != None:
+                    reject(lineNo, row, error)
+                else:
+                    numPostings = numPostings + 1
+                    pending.append((lineNo, row))
+                    yield Posting(**fields)
+
+        try:
+            for response in self._client.createStream(generatePostings(),
+                                                      self._chunkSize,
+                                                      self._maxWorkers,
+                                                      journal):
+                lineNo,row = pending.popleft()
+                if response == None:
+                    reject(lineNo, row, "Unable to contact the server")
+                elif "error" in response:
+                    reject(lineNo, row, response['error'].get("message",
+                                                              "Unknown error"))
+                else:
+                    stats['created'] = stats['created'] + 1
+
+                if progress != None \
+                        and time.time() - lastProgress >= progressInterval:
+                    lastProgress = time.time()
+                    progress(_updateRates(stats, startTime))
+        finally:
+            if rejectFile != None:
+                rejectFile.close()
+
+        return _updateRates(stats, startTime)
+
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _parseFile(self, path, format):
+        """ Parse the rows in the given file.
+
+            We return an iterator which yields a (lineNo, row, fields, error)
+            tuple for each row in the file, in order.  'fields' is a
+            dictionary of Posting fields, or None if the row could not be
+            parsed, in which case 'error' is a string describing the problem.
+        """
+        f = open(path, "rb")
+        try:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            f.close()
+
+        try:
+            start  = 0
+            lineNo = 1
+            header = None
+            if format == FORMAT_CSV:
+                start  = _nextLine(data, 0)
+                header = csv.reader([data[:start]]).next()
+                lineNo = 2
+            blocks = _splitBlocks(data, start, self._blockSize)
+        finally:
+            data.close()
+
+        tasks = [(path, format, blockStart, blockEnd, header, self._columnMap)
+                 for blockStart,blockEnd in blocks]
+
+        if self._numProcesses == 0:
+            results = (_parseBlock(task) for task in tasks)
+            pool    = None
+        else:
+            pool    = multiprocessing.Pool(self._numProcesses)
+            results = _boundedMap(pool, _parseBlock, tasks,
+                                  self._numProcesses * 2)
+
+        try:
+            for rows in results:
+                for row,fields,error in rows:
+                    yield (lineNo, row, fields, error)
+                    lineNo = lineNo + 1
+        finally:
+            if pool != None:
+                pool.terminate()
+                pool.join()
+
+#############################################################################
+
+def guessFormat(path):
+    """ Return the format of the given file, based on its extension.
+    """
+    if path.lower().endswith(".csv"):
+        return FORMAT_CSV
+    return FORMAT_JSONL
+
+
+def parseRow(values, columnMap=None):
+    """ Convert a single row into a dictionary of Posting fields.
+
+        'values' is a dictionary mapping column names to values, as read from
+        the input file.  'columnMap' maps column names to Posting field names,
+        as described for the PostingImporter class.  We raise a ValueError if
+        a value can't be converted.
+    """
+    fields = {}
+    for column,value in values.items():
+        if columnMap and column in columnMap:
+            field = columnMap[column]
+        elif column in FIELD_NAMES:
+            field = column
+        else:
+            continue
+
+        if value == None or value == "":
+            continue
+
+        if field in ["latitude", "longitude", "price"]:
+            value = float(value)
+        elif field == "clickCount":
+            value = int(value)
+        elif field in ["timestamp", "expiration"]:
+            value = parseTimestamp(value)
+        elif field in ["annotations", "trustedAnnotations"]:
+            if isinstance(value, basestring):
+                value = json.loads(value)
+            if not isinstance(value, dict):
+                raise ValueError(field + " must be an object")
+        elif field == "images":
+            if isinstance(value, basestring):
+                if value.startswith("["):
+                    value = json.loads(value)
+                else:
+                    value = value.split("|")
+            if not isinstance(value, list):
+                raise ValueError("images must be a list")
+        fields[field] = value
+    return fields
+
+
+def parseTimestamp(value):
+    """ Convert a timestamp value into a datetime.datetime object, in UTC.
+    """
+    if isinstance(value, (int, long, float)):
+        return datetime.datetime.utcfromtimestamp(value)
+    for format in TIMESTAMP_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, format)
+        except ValueError:
+            pass
+    try:
+        return datetime.datetime.utcfromtimestamp(float(value))
+    except ValueError:
+        raise ValueError("Invalid timestamp: " + repr(value))
+
+#############################################################################
+
+def _parseBlock(task):
+    """ Parse the rows in a single block of the input file.
+
+        'task' is a (path, format, start, end, header, columnMap) tuple.  We
+        return a list of (row, fields, error) tuples, one for each line in
+        the block.  This is run in a worker process.
+    """
+    path,format,start,end,header,columnMap = task
+
+    f = open(path, "rb")
+    try:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            lines = data[start:end].splitlines()
+        finally:
+            data.close()
+    finally:
+        f.close()
+
+    results = []
+    for line in lines:
+        try:
+            if format == FORMAT_CSV:
+                values = csv.reader([line]).next()
+                if len(values) != len(header):
+                    raise ValueError("Expected %d columns, found %d" %
+                                     (len(header), len(values)))
+                values = dict(zip(header, values))
+            else:
+                values = json.loads(line)
+                if not isinstance(values, dict):
+                    raise ValueError("Row must be a JSON object")
+            results.append((line, parseRow(values, columnMap), None))
+        except Exception,e:
+            results.append((line, None, str(e) or e.__class__.__name__))
+    return results
+
+
+def _nextLine(data, pos):
+    """ Return the offset of the start of the line after 'pos'.
+    """
+    end = data.find("\n", pos)
+    if end == -1:
+        return len(data)
+    return end + 1
+
+
+def _splitBlocks(data, start, blockSize):
+    """ Split the given memory-mapped data into blocks of whole lines.
+
+        We return a list of (start, end) offsets for blocks of about
+        'blockSize' bytes, starting at offset 'start'.
+    """
+    blocks = []
+    while start < len(data):
+        end = _nextLine(data, min(len(data), start + blockSize) - 1)
+        blocks.append((start, end))
+        start = end
+    return blocks
+
+
+def _boundedMap(pool, function, items, maxPending):
+    """ Apply a function to each item using a process pool.
+
+        Unlike Pool.imap(), at most 'maxPending' items are submitted to the
+        pool at once, so results can't build up in memory if the caller is
+        slower than the pool.  The results are yielded in order.
+    """
+    pending = collections.deque()
+    for item in items:
+        pending.append(pool.apply_async(function, (item,)))
+        if len(pending) >= maxPending:
+            yield pending.popleft().get()
+    while len(pending) > 0:
+        yield pending.popleft().get()
+
+
+def _updateRates(stats, startTime):
+    """ Fill in the 'elapsed' and 'rowsPerSec' entries in the given stats.
+    """
+    stats['elapsed'] = time.time() - startTime
+    if stats['elapsed'] > 0:
+        stats['rowsPerSec'] = stats['rows'] / stats['elapsed']
+    return dict(stats)
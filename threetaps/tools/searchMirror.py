@@ -0,0 +1,409 @@
+""" threetaps.tools.searchMirror
+
+    This Python module implements the SearchMirror class, which keeps a local
+    copy of the postings matching one or more search queries.
+
+    Analytics jobs tend to run the same searches over and over again.  A
+    SearchMirror downloads the postings matching each search query (a
+    "slice") into a local SQLite database once, and then keeps the database
+    up to date by only fetching the postings which have arrived since the
+    last sync.  The mirrored postings can then be searched locally, as often
+    as required, without touching the 3taps server:
+
+        mirror = SearchMirror("analytics.db", SearchAPIClient())
+        mirror.addSlice("cars", SearchQuery(category="VAUT", location="SFO"))
+        mirror.sync()
+        cheapCars = mirror.search(SearchQuery(location="SFO"), maxPrice=5000)
+"""
+from threetaps.api.clients.encoders import formatTimestamp
+from threetaps.api.clients.searchAPIClient import SearchQuery
+from threetaps.api.models import Posting
+
+import datetime
+import sqlite3
+import time
+import simplejson as json
+
+#############################################################################
+
+# The fields requested for each mirrored posting.
+
+MIRROR_RETVALS = ["postKey", "source", "category", "location", "heading",
+                  "body", "latitude", "longitude", "price", "currency",
+                  "images", "externalID", "externalURL", "accountName",
+                  "timestamp", "annotations"]
+
+# The format of a posting's timestamp, as returned by the 3taps server.
+
+TIMESTAMP_FORMAT = "%Y/%m/%d %H:%M:%S UTC"
+
+# The SearchQuery attributes which are stored for each slice.
+
+_QUERY_FIELDS = ["source", "category", "location", "heading", "body", "text",
+                 "externalID", "start", "end", "annotations",
+                 "trustedAnnotations"]
+
+#############################################################################
+
+class SearchMirror:
+    """ A local SQLite mirror of the postings matching some search queries.
+
+        The mirror is stored in the SQLite database at 'path', which is
+        created if it doesn't already exist.  'client' is the SearchAPIClient
+        used to fetch postings from the server.
+
+        Each slice is fetched page by page, newest first.  The first sync of
+        a slice downloads every matching posting; after that, we remember the
+        newest timestamp seen (the slice's "watermark"), and later syncs only
+        fetch postings from 'overlapSeconds' before the watermark onwards.
+        The overlap allows for postings which arrive at the server a little
+        out of order.  Postings are stored by their post key, so a posting
+        which is fetched more than once simply replaces the earlier copy.
+
+        The mirrored postings are indexed by category, location, source,
+        timestamp and price, so that local searches on these fields are fast.
+    """
+    def __init__(self, path, client, pageSize=1000, overlapSeconds=300):
+        """ Standard initializer.
+        """
+        self._client         = client
+        self._pageSize       = pageSize
+        self._overlapSeconds = overlapSeconds
+
+        self._db = sqlite3.connect(path)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS slices (
+                name      TEXT PRIMARY KEY,
+                query     TEXT NOT NULL,
+                watermark TEXT,
+                lastSync  REAL);
+
+            CREATE TABLE IF NOT EXISTS postings (
+                postKey    TEXT PRIMARY KEY,
+                source     TEXT,
+                category   TEXT,
+                location   TEXT,
+                externalID TEXT,
+                heading    TEXT,
+                body       TEXT,
+                timestamp  TEXT,
+                price      REAL,
+                data       TEXT NOT NULL);
+
+            CREATE INDEX IF NOT EXISTS postingsByCategory
+                ON postings (category, timestamp);
+            CREATE INDEX IF NOT EXISTS postingsByLocation
+                ON postings (location, timestamp);
+            CREATE INDEX IF NOT EXISTS postingsBySource
+                ON postings (source, timestamp);
+            CREATE INDEX IF NOT EXISTS postingsByTimestamp
+                ON postings (timestamp);
+            CREATE INDEX IF NOT EXISTS postingsByPrice
+                ON postings (price);
+        """)
+        self._db.commit()
+
+    # =====================
+    # == MANAGING SLICES ==
+    # =====================
+
+    def addSlice(self, name, query):
+        """ Add a slice to the mirror.
+
+            'name' is a unique name for the slice, and 'query' is the
+            SearchQuery object which selects the slice's postings.  If a
+            slice with this name already exists, its query is replaced, and
+            its postings will be fetched again in full on the next sync.
+        """
+        self._db.execute("INSERT OR REPLACE INTO slices (name, query) " +
+                         "VALUES (?, ?)", (name, _encodeQuery(query)))
+        self._db.commit()
+
+
+    def removeSlice(self, name):
+        """ Remove a slice from the mirror.
+
+            Note that postings already mirrored are not deleted.
+        """
+        self._db.execute("DELETE FROM slices WHERE name=?", (name,))
+        self._db.commit()
+
+
+    def getSlices(self):
+        """ Return a dictionary mapping slice names to their SearchQuery.
+        """
+        slices = {}
+        for name,query in self._db.execute("SELECT name, query FROM slices"):
+            slices[name] = _decodeQuery(query)
+        return slices
+
+
+    def getWatermark(self, name):
+        """ Return the newest timestamp seen for the given slice.
+
+            We return the timestamp as a string in the 3taps format, or None
+            if the slice has not been synced yet.
+        """
+        row = self._db.execute("SELECT watermark FROM slices WHERE name=?",
+                               (name,)).fetchone()
+        if row == None:
+            raise RuntimeError("Unknown slice: " + repr(name))
+        return row[0]
+
+    # =============
+    # == SYNCING ==
+    # =============
+
+    def sync(self, names=None):
+        """ Bring the mirror up to date with the server.
+
+            If 'names' is given, only the slices with these names are synced;
+            otherwise every slice is.  We return a dictionary mapping each
+            slice name to the number of postings fetched for it, or None if
+            the server could not be searched.  A slice which fails to sync
+            keeps its old watermark, so nothing is missed next time.
+        """
+        if names == None:
+            names = sorted(self.getSlices().keys())
+
+        results = {}
+        for name in names:
+            results[name] = self._syncSlice(name)
+        return results
+
+    # ====================
+    # == LOCAL SEARCHES ==
+    # ====================
+
+    def search(self, query=None, minPrice=None, maxPrice=None, limit=None):
+        """ Search the mirrored postings.
+
+            'query' is a SearchQuery object, which is matched in the same way
+            as the 3taps server would, except that the heading, body and text
+            criteria are simple case-insensitive substring matches.  Trusted
+            annotations are not returned by the search API, so they aren't
+            mirrored, and a query which uses them raises a RuntimeError.
+            'minPrice' and 'maxPrice', if given, limit the price of the
+            matching postings.  At most 'limit' postings are returned, if it
+            is given.
+
+            We return a list of matching Posting objects, newest first.
+        """
+        sql,params = self._buildQuery("data", query, minPrice, maxPrice)
+        sql = sql + " ORDER BY timestamp DESC"
+        if limit != None and not _hasAnnotations(query):
+            sql = sql + " LIMIT %d" % limit
+
+        results = []
+        for (data,) in self._db.execute(sql, params):
+            row = json.loads(data)
+            if _annotationsMatch(row, query):
+                results.append(Posting(**row))
+                if limit != None and len(results) >= limit:
+                    break
+        return results
+
+
+    def count(self, query=None, minPrice=None, maxPrice=None):
+        """ Return the number of mirrored postings matching a search.
+
+            The parameters are the same as for search().
+        """
+        if _hasAnnotations(query):
+            return len(self.search(query, minPrice, maxPrice))
+        sql,params = self._buildQuery("COUNT(*)", query, minPrice, maxPrice)
+        return self._db.execute(sql, params).fetchone()[0]
+
+
+    def close(self):
+        """ Close the mirror's database.
+        """
+        self._db.close()
+
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _syncSlice(self, name):
+        """ Sync a single slice, returning the number of postings fetched.
+
+            We return None if the server could not be searched.
+        """
+        row = self._db.execute("SELECT query, watermark FROM slices " +
+                               "WHERE name=?", (name,)).fetchone()
+        if row == None:
+            raise RuntimeError("Unknown slice: " + repr(name))
+        query     = _decodeQuery(row[0])
+        watermark = row[1]
+
+        # When resyncing, fetch from a little before the watermark.
+
+        since = None
+        if watermark != None:
+            since = datetime.datetime.strptime(watermark, TIMESTAMP_FORMAT) \
+                  - datetime.timedelta(seconds=self._overlapSeconds)
+            if query.start == None or query.start < since:
+                query.start = since
+            since = formatTimestamp(since)
+
+        numFetched = 0
+        newest     = watermark
+        page       = 0
+        while True:
+            response = self._client.search(query, rpp=self._pageSize,
+                                           page=page, retvals=MIRROR_RETVALS)
+            if not response['success']:
+                self._db.rollback()
+                return None
+
+            postings = response['results']
+            rows     = []
+            for posting in postings:
+                if since != None and posting.timestamp < since:
+                    continue
+                rows.append(_postingToRow(posting))
+                if newest == None or posting.timestamp > newest:
+                    newest = posting.timestamp
+            self._db.executemany("INSERT OR REPLACE INTO postings " +
+                                 "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                 rows)
+            numFetched = numFetched + len(rows)
+
+            # Stop at the last page, or once we've gone past the overlap.
+
+            if len(postings) < self._pageSize or len(rows) < len(postings):
+                break
+            page = page + 1
+
+        self._db.execute("UPDATE slices SET watermark=?, lastSync=? " +
+                         "WHERE name=?", (newest, time.time(), name))
+        self._db.commit()
+        return numFetched
+
+
+    def _buildQuery(self, columns, query, minPrice, maxPrice):
+        """ Build an SQL query for the postings matching a search.
+
+            We return an (sql, params) tuple.
+        """
+        conditions = []
+        params     = []
+
+        if query != None:
+            for field in ["source", "externalID"]:
+                value = getattr(query, field)
+                if value != None:
+                    conditions.append("%s=?" % field)
+                    params.append(value)
+
+            for field in ["category", "location"]:
+                value = getattr(query, field)
+                if value != None:
+                    values = value.split("+OR+")
+                    conditions.append("%s IN (%s)" %
+                                      (field, ",".join(["?"] * len(values))))
+                    params.extend(values)
+
+            for field in ["heading", "body"]:
+                value = getattr(query, field)
+                if value != None:
+                    conditions.append("%s LIKE ? ESCAPE '\\'" % field)
+                    params.append(_likePattern(value))
+            if query.text != None:
+                conditions.append("(heading LIKE ? ESCAPE '\\' OR " +
+                                  "body LIKE ? ESCAPE '\\')")
+                params.extend([_likePattern(query.text)] * 2)
+
+            if query.start != None:
+                conditions.append("timestamp>=?")
+                params.append(formatTimestamp(query.start))
+            if query.end != None:
+                conditions.append("timestamp<=?")
+                params.append(formatTimestamp(query.end))
+
+        if minPrice != None:
+            conditions.append("price>=?")
+            params.append(minPrice)
+        if maxPrice != None:
+            conditions.append("price<=?")
+            params.append(maxPrice)
+
+        sql = "SELECT %s FROM postings" % columns
+        if len(conditions) > 0:
+            sql = sql + " WHERE " + " AND ".join(conditions)
+        return (sql, params)
+
+#############################################################################
+
+def _encodeQuery(query):
+    """ Convert a SearchQuery object into a JSON string.
+    """
+    fields = {}
+    for field in _QUERY_FIELDS:
+        value = getattr(query, field)
+        if isinstance(value, datetime.datetime):
+            value = formatTimestamp(value)
+        if value != None:
+            fields[field] = value
+    return json.dumps(fields, sort_keys=True)
+
+
+def _decodeQuery(data):
+    """ Convert a string created by _encodeQuery() back into a SearchQuery.
+    """
+    fields = json.loads(data)
+    for field in ["start", "end"]:
+        if field in fields:
+            fields[field] = datetime.datetime.strptime(fields[field],
+                                                       TIMESTAMP_FORMAT)
+    return SearchQuery(**dict([(str(key), value)
+                               for key,value in fields.items()]))
+
+
+def _postingToRow(posting):
+    """ Convert a Posting object into a row of the postings table.
+    """
+    data = {}
+    for field in MIRROR_RETVALS:
+        value = getattr(posting, field, None)
+        if value != None:
+            data[field] = value
+
+    if posting.price != None:
+        price = float(posting.price)
+    else:
+        price = None
+
+    return (posting.postKey, posting.source, posting.category,
+            posting.location, posting.externalID, posting.heading,
+            posting.body, posting.timestamp, price, json.dumps(data))
+
+
+def _likePattern(value):
+    """ Return an SQL LIKE pattern which matches the given substring.
+    """
+    value = value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return "%" + value + "%"
+
+
+def _hasAnnotations(query):
+    """ Return True if the given SearchQuery has any annotation criteria.
+    """
+    if query == None:
+        return False
+    if query.trustedAnnotations:
+        raise RuntimeError("Trusted annotations can't be searched locally.")
+    return bool(query.annotations)
+
+
+def _annotationsMatch(row, query):
+    """ Return True if a mirrored posting matches a query's annotations.
+    """
+    if not _hasAnnotations(query):
+        return True
+
+    annotations = row.get("annotations") or {}
+    for key,value in query.annotations.items():
+        if annotations.get(key) != value:
+            return False
+    return True